@@ -0,0 +1,129 @@
+import sys
+import os
+import random
+import shutil
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from database.config import Base, SessionLocal, criar_engine
+from classes.usuarios import Usuario
+from classes.transacoes import Transacao, TipoTransacao
+from classes.categorias import Categoria
+from classes.agregados import aplicar_deltas, deltas_de_registros
+import data_provider
+
+# Benchmark dos widgets do data_provider que agregam transações (recuperar_despesas e recuperar_ultimas_movimentacoes).
+# Mede a latência da versão em SQL (GROUP BY/ORDER BY/LIMIT) e da versão anterior, que trazia todas as linhas para o pandas,
+# com históricos de tamanhos crescentes para o mesmo usuário. A versão em SQL deve ficar praticamente constante.
+# Uso: python Scripts_aux/benchmark_data_provider.py [tamanhos separados por vírgula]
+
+#region VERSÕES ANTERIORES (pandas), mantidas aqui apenas como referência de comparação
+def despesas_pandas(id_usuario, periodo="mensal"):
+    db = SessionLocal()
+    try:
+        inicio, fim = data_provider.calcular_intervalo(periodo)
+        query = db.query(Transacao.valor, Categoria.nome.label("Categoria"), Categoria.cor_hex, Categoria.icone)\
+            .join(Categoria, Transacao.id_categoria == Categoria.id_categoria)\
+            .filter(Transacao.id_usuario == id_usuario, Transacao.data.between(inicio, fim), Transacao.tipo == "despesa")
+        df = pd.DataFrame(query.all())
+        if df.empty:
+            return []
+        df_resumo = df.groupby(["Categoria", "cor_hex", "icone"])['valor'].sum().reset_index()
+        return df_resumo.sort_values(by='valor', ascending=False).head(6).to_dict('records')
+    finally:
+        db.close()
+
+def ultimas_pandas(id_usuario):
+    db = SessionLocal()
+    try:
+        query = db.query(Transacao.valor, Transacao.data, Transacao.descricao, Categoria.cor_hex, Categoria.nome)\
+            .join(Categoria, Transacao.id_categoria == Categoria.id_categoria)\
+            .filter(Transacao.id_usuario == id_usuario)
+        df = pd.DataFrame(query.all())
+        if df.empty:
+            return []
+        ultimas = df.sort_values(by='data', ascending=False).head(8)
+        ultimas['descricao'] = ultimas['descricao'].str.slice(0, 20)
+        return ultimas.to_dict('records')
+    finally:
+        db.close()
+#endregion
+
+def popular(engine, id_usuario, ids_categoria, quantidade, ja_inseridas):
+    # acrescenta transações ao histórico do usuário, espalhadas pelos últimos 5 anos
+    agora = datetime.now()
+    linhas = [{
+        "valor": round(random.uniform(5, 500), 2),
+        "tipo": TipoTransacao.DESPESA if i % 4 else TipoTransacao.RECEITA,
+        "data": agora - timedelta(minutes=random.randint(1, 5 * 365 * 24 * 60)),
+        "descricao": f"COMPRA NO ESTABELECIMENTO {i % 700}",
+        "id_usuario": id_usuario,
+        "id_conta": 1,
+        "id_categoria": ids_categoria[i % len(ids_categoria)],
+        "quitada": True,
+        "ignore": False,
+    } for i in range(ja_inseridas, quantidade)]
+
+    if linhas:
+        with engine.begin() as conexao:
+            conexao.execute(insert(Transacao.__table__), linhas)
+            aplicar_deltas(conexao, deltas_de_registros(linhas)) # mantém os agregados mensais, como faz o importador
+
+def cronometrar(funcao, repeticoes=5):
+    # retorna o melhor tempo (em ms) de algumas execuções, para reduzir o ruído
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return min(tempos)
+
+def executar_benchmark(tamanhos=(1000, 10000, 100000, 300000)):
+    random.seed(7)
+    pasta = tempfile.mkdtemp(prefix="bench_provider_")
+
+    try:
+        engine = criar_engine(f"sqlite:///{os.path.join(pasta, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal.configure(bind=engine)
+
+        db = SessionLocal()
+        try:
+            usuario = Usuario(nome="Bench", email="bench@teste.com", senha_plana="123")
+            db.add(usuario)
+            db.flush()
+            categorias = [Categoria(nome=f"Categoria {i}", id_usuario=usuario.id_usuario) for i in range(12)]
+            db.add_all(categorias)
+            db.commit()
+            id_usuario = usuario.id_usuario
+            ids_categoria = [c.id_categoria for c in categorias]
+        finally:
+            db.close()
+
+        print(f"{'transações':>12}{'despesas SQL':>16}{'despesas pandas':>18}{'últimas SQL':>15}{'últimas pandas':>17}")
+        inseridas = 0
+        for tamanho in sorted(tamanhos):
+            popular(engine, id_usuario, ids_categoria, tamanho, inseridas)
+            inseridas = tamanho
+
+            # as duas versões precisam devolver o mesmo resultado
+            assert [r["Categoria"] for r in data_provider.recuperar_despesas.sem_cache(id_usuario)] == [r["Categoria"] for r in despesas_pandas(id_usuario)]
+            assert [r["valor"] for r in data_provider.recuperar_ultimas_movimentacoes.sem_cache(id_usuario)] == [r["valor"] for r in ultimas_pandas(id_usuario)]
+
+            print(f"{tamanho:>12}"
+                  f"{cronometrar(lambda: data_provider.recuperar_despesas.sem_cache(id_usuario)):>13.2f} ms"
+                  f"{cronometrar(lambda: despesas_pandas(id_usuario)):>15.2f} ms"
+                  f"{cronometrar(lambda: data_provider.recuperar_ultimas_movimentacoes.sem_cache(id_usuario)):>12.2f} ms"
+                  f"{cronometrar(lambda: ultimas_pandas(id_usuario)):>14.2f} ms")
+
+        engine.dispose()
+
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+if __name__ == "__main__":
+    tamanhos = [int(t) for t in sys.argv[1].split(",")] if len(sys.argv) > 1 else (1000, 10000, 100000, 300000)
+    executar_benchmark(tamanhos)
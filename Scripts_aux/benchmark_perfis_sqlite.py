@@ -0,0 +1,140 @@
+import sys
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func
+from sqlalchemy.exc import OperationalError
+from database.config import Base, PERFIS_SQLITE, criar_engine
+from classes.transacoes import Transacao, TipoTransacao
+
+# Benchmark dos perfis do SQLite definidos em database/config.py. Para cada perfil, cria um banco novo em um diretório
+# temporário e mede: escritas com um commit por transação (como o transaction_service faz), leituras analíticas
+# (GROUP BY no estilo do data_provider) e uma carga concorrente com leitores e um escritor (como várias sessões do Streamlit).
+# Uso: python Scripts_aux/benchmark_perfis_sqlite.py [qtd_transacoes_base] [segundos_concorrencia]
+
+TABELA = Transacao.__table__
+
+def gerar_linha(i, agora):
+    return {
+        "valor": round(random.uniform(5, 500), 2),
+        "tipo": TipoTransacao.DESPESA if i % 4 else TipoTransacao.RECEITA,
+        "data": agora - timedelta(days=random.randint(0, 730)),
+        "descricao": f"COMPRA {i % 500}",
+        "id_usuario": 1 + i % 5,
+        "id_conta": 1 + i % 10,
+        "id_categoria": 1 + i % 12,
+        "quitada": True,
+        "ignore": False,
+    }
+
+def consulta_analitica():
+    # soma das despesas por categoria nos últimos 90 dias de um usuário (mesmo formato do resumo do painel)
+    inicio = datetime.now() - timedelta(days=90)
+    return select(TABELA.c.id_categoria, func.sum(TABELA.c.valor))\
+        .where(TABELA.c.id_usuario == 1, TABELA.c.tipo == TipoTransacao.DESPESA, TABELA.c.data >= inicio)\
+        .group_by(TABELA.c.id_categoria)
+
+def medir_escritas(engine, quantidade=500):
+    agora = datetime.now()
+    inicio = time.perf_counter()
+    for i in range(quantidade):
+        with engine.begin() as conexao: # um commit por transação
+            conexao.execute(insert(TABELA), gerar_linha(i, agora))
+    return quantidade / (time.perf_counter() - inicio)
+
+def medir_leituras(engine, repeticoes=200):
+    consulta = consulta_analitica()
+    inicio = time.perf_counter()
+    with engine.connect() as conexao:
+        for _ in range(repeticoes):
+            conexao.execute(consulta).all()
+    return repeticoes / (time.perf_counter() - inicio)
+
+def medir_concorrencia(engine, engine_leitura, segundos=3.0, leitores=4):
+    # um escritor fazendo commits pequenos enquanto vários leitores repetem a consulta analítica
+    contagem = {"leituras": 0, "escritas": 0, "travamentos": 0}
+    trava_contagem = threading.Lock()
+    fim = time.perf_counter() + segundos
+    consulta = consulta_analitica()
+
+    def somar(chave):
+        with trava_contagem:
+            contagem[chave] += 1
+
+    def escritor():
+        agora = datetime.now()
+        i = 0
+        while time.perf_counter() < fim:
+            try:
+                with engine.begin() as conexao:
+                    conexao.execute(insert(TABELA), gerar_linha(i, agora))
+                somar("escritas")
+            except OperationalError:
+                somar("travamentos")
+            i += 1
+
+    def leitor():
+        while time.perf_counter() < fim:
+            try:
+                with engine_leitura.connect() as conexao:
+                    conexao.execute(consulta).all()
+                somar("leituras")
+            except OperationalError:
+                somar("travamentos")
+
+    threads = [threading.Thread(target=escritor)] + [threading.Thread(target=leitor) for _ in range(leitores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {chave: valor / segundos if chave != "travamentos" else valor for chave, valor in contagem.items()}
+
+def executar_benchmark(qtd_base=100000, segundos_concorrencia=3.0):
+    pasta = tempfile.mkdtemp(prefix="bench_sqlite_")
+    resultados = {}
+
+    try:
+        for perfil in PERFIS_SQLITE:
+            random.seed(42)
+            url = f"sqlite:///{os.path.join(pasta, perfil + '.db')}"
+            engine = criar_engine(url, perfil)
+            Base.metadata.create_all(bind=engine)
+
+            # massa inicial gravada em lote, igual para todos os perfis
+            agora = datetime.now()
+            with engine.begin() as conexao:
+                conexao.execute(insert(TABELA), [gerar_linha(i, agora) for i in range(qtd_base)])
+
+            engine_leitura = criar_engine(url, perfil, somente_leitura=True)
+
+            print(f"Perfil '{perfil}'...")
+            resultados[perfil] = {
+                "escritas_s": medir_escritas(engine),
+                "leituras_s": medir_leituras(engine_leitura),
+                **{f"concorrente_{k}": v for k, v in medir_concorrencia(engine, engine_leitura, segundos_concorrencia).items()},
+            }
+
+            engine_leitura.dispose()
+            engine.dispose()
+
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    colunas = ["escritas_s", "leituras_s", "concorrente_escritas", "concorrente_leituras", "concorrente_travamentos"]
+    print(f"\n{'perfil':<16}" + "".join(f"{c:>26}" for c in colunas))
+    for perfil, valores in resultados.items():
+        print(f"{perfil:<16}" + "".join(f"{valores[c]:>26.1f}" for c in colunas))
+    print("\n(escritas/leituras em operações por segundo; travamentos = erros 'database is locked' na carga concorrente)")
+
+    return resultados
+
+if __name__ == "__main__":
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    executar_benchmark(qtd, segundos)
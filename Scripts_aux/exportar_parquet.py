@@ -0,0 +1,223 @@
+import sys
+import os
+import json
+import shutil
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime, date
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, func, cast, Integer
+from database.config import SessionLeitura
+from classes.transacoes import Transacao
+from classes.categorias import Categoria, Subcategoria
+from classes.contas import Conta
+from classes.agregados import AgregadoMensal
+
+# Exportação das transações para Parquet, para as análises de Data Science: um arquivo por usuário e mês, em pastas no formato
+# id_usuario=<id>/ano=<aaaa>/mes=<mm>/transacoes.parquet (lido como um dataset particionado pelo pyarrow, pandas, DuckDB ou Spark).
+# As linhas vêm do banco em lotes (yield_per) já ordenadas por usuário e data, então cada partição é gravada assim que termina e a
+# memória usada é a de um lote mais a de uma partição, qualquer que seja o tamanho da tabela.
+# A exportação é incremental: o manifesto (_manifesto.json na pasta de destino) guarda a marca d'água (início da última exportação)
+# e a quantidade de linhas de cada partição. Nas execuções seguintes, só são regravadas as partições com transações gravadas depois
+# da marca d'água (coluna atualizado_em) ou cuja quantidade de linhas mudou (remoções, lidas dos agregados mensais); as partições que
+# ficaram vazias são apagadas. Renomear uma conta ou categoria não altera as transações: use --completo para regravar tudo.
+# Uso: python Scripts_aux/exportar_parquet.py [pasta de destino] [--completo]
+
+DIRETORIO_PADRAO = "exportacao_parquet"
+NOME_MANIFESTO = "_manifesto.json"
+NOME_ARQUIVO = "transacoes.parquet"
+LINHAS_POR_LOTE = 50000
+
+_NOMES = pa.dictionary(pa.int32(), pa.string()) # colunas de nomes e códigos repetidos: categóricas no pandas
+
+# esquema fixo, igual em todas as partições (id_usuario, ano e mes vêm do caminho da partição)
+ESQUEMA = pa.schema([
+    ("id_transacao", pa.int64()),
+    ("data", pa.timestamp("us")),
+    ("valor_centavos", pa.int64()), # sempre positivo; o sentido vem do tipo
+    ("tipo", _NOMES),
+    ("descricao", pa.string()),
+    ("local", pa.string()),
+    ("tag", _NOMES),
+    ("id_conta", pa.int64()),
+    ("conta", _NOMES),
+    ("id_categoria", pa.int64()),
+    ("categoria", _NOMES),
+    ("id_subcategoria", pa.int64()),
+    ("subcategoria", _NOMES),
+    ("tipo_registro", _NOMES),
+    ("quitada", pa.bool_()),
+    ("ignore", pa.bool_()),
+    ("essencial", pa.bool_()),
+    ("id_recorrencia", pa.int64()),
+    ("moeda", _NOMES),
+])
+
+#region CONSULTAS
+def _consulta_transacoes():
+    # transações com os nomes da conta, da categoria e da subcategoria, nas colunas do ESQUEMA. O valor sai do banco como os
+    # centavos inteiros gravados (CAST), sem passar pelo float do tipo Dinheiro. Só entram as transações com usuário, data e tipo,
+    # as mesmas contadas nos agregados mensais (usados para detectar remoções).
+    return select(
+        Transacao.id_usuario, Transacao.id_transacao, Transacao.data, cast(Transacao.valor, Integer), Transacao.tipo,
+        Transacao.descricao, Transacao.local, Transacao.tag, Transacao.id_conta, Conta.nome_conta, Transacao.id_categoria,
+        Categoria.nome, Transacao.id_subcategoria, Subcategoria.nome, Transacao.tipo_registro, Transacao.quitada,
+        Transacao.ignore, Transacao.essencial, Transacao.id_recorrencia, Transacao.moeda
+    ).select_from(Transacao)\
+     .outerjoin(Conta, Conta.id_conta == Transacao.id_conta)\
+     .outerjoin(Categoria, Categoria.id_categoria == Transacao.id_categoria)\
+     .outerjoin(Subcategoria, Subcategoria.id_subcategoria == Transacao.id_subcategoria)\
+     .where(Transacao.id_usuario != None, Transacao.data != None, Transacao.tipo != None)
+
+def _limites_do_mes(ano, mes):
+    inicio = datetime(ano, mes, 1)
+    return inicio, datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+
+def _particoes_alteradas(db, marca_dagua):
+    # partições (id_usuario, ano, mes) com alguma transação inserida ou alterada desde a marca d'água, no índice ix_transacoes_atualizado_em
+    ano, mes = func.strftime("%Y", Transacao.data), func.strftime("%m", Transacao.data)
+    linhas = db.execute(select(Transacao.id_usuario, ano, mes).distinct()
+                        .where(Transacao.atualizado_em >= marca_dagua, Transacao.id_usuario != None, Transacao.data != None)).all()
+    return {(id_usuario, int(a), int(m)) for id_usuario, a, m in linhas}
+
+def _quantidades_por_particao(db):
+    # quantidade atual de transações de cada partição, lida dos agregados mensais (uma linha por mês e categoria, não as transações)
+    linhas = db.execute(select(AgregadoMensal.id_usuario, AgregadoMensal.mes, func.sum(AgregadoMensal.quantidade))
+                        .group_by(AgregadoMensal.id_usuario, AgregadoMensal.mes)).all()
+    return {(id_usuario, mes.year, mes.month): int(quantidade) for id_usuario, mes, quantidade in linhas if quantidade > 0}
+#endregion
+
+#region ARQUIVOS
+def _chave(particao):
+    return "{}/{}/{:02d}".format(*particao)
+
+def _pasta_da_particao(diretorio, particao):
+    id_usuario, ano, mes = particao
+    return os.path.join(diretorio, f"id_usuario={id_usuario}", f"ano={ano}", f"mes={mes:02d}")
+
+def _gravar_particao(diretorio, particao, linhas):
+    # grava as linhas de uma partição (no formato de _consulta_transacoes) de forma atômica: arquivo temporário + os.replace
+    colunas = list(zip(*linhas))[1:] # a primeira coluna (id_usuario) está no caminho da partição
+    dados = {}
+    for campo, valores in zip(ESQUEMA, colunas):
+        if campo.name in ("tipo", "tipo_registro"):
+            valores = [v.value if v is not None else None for v in valores] # enums do SQLAlchemy -> texto
+        if pa.types.is_dictionary(campo.type):
+            dados[campo.name] = pa.array(valores, type=pa.string()).dictionary_encode()
+        else:
+            dados[campo.name] = pa.array(valores, type=campo.type)
+
+    pasta = _pasta_da_particao(diretorio, particao)
+    os.makedirs(pasta, exist_ok=True)
+    destino = os.path.join(pasta, NOME_ARQUIVO)
+    pq.write_table(pa.table(dados, schema=ESQUEMA), f"{destino}.tmp", compression="zstd")
+    os.replace(f"{destino}.tmp", destino)
+
+def _remover_particao(diretorio, particao):
+    pasta = _pasta_da_particao(diretorio, particao)
+    if os.path.isdir(pasta):
+        shutil.rmtree(pasta)
+    # apaga também as pastas do ano e do usuário que ficaram vazias
+    for pasta in (os.path.dirname(pasta), os.path.dirname(os.path.dirname(pasta))):
+        if os.path.isdir(pasta) and not os.listdir(pasta):
+            os.rmdir(pasta)
+
+def _ler_manifesto(diretorio):
+    caminho = os.path.join(diretorio, NOME_MANIFESTO)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+def _gravar_manifesto(diretorio, dados):
+    # mesmo cuidado do checkpoint do importador: arquivo temporário + os.replace
+    caminho = os.path.join(diretorio, NOME_MANIFESTO)
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, indent=1)
+    os.replace(f"{caminho}.tmp", caminho)
+#endregion
+
+#region EXPORTAÇÃO
+def _exportar_em_fluxo(db, consulta, diretorio, linhas_por_lote):
+    # percorre o resultado em lotes e grava cada partição quando a seguinte começa (as linhas vêm ordenadas por usuário e data).
+    # Retorna {partição: quantidade de linhas gravadas}.
+    gravadas = {}
+    atual, pendentes = None, []
+
+    resultado = db.execute(consulta.order_by(Transacao.id_usuario, Transacao.data, Transacao.id_transacao)
+                           .execution_options(yield_per=linhas_por_lote))
+    for lote in resultado.partitions():
+        for linha in lote:
+            particao = (linha[0], linha[2].year, linha[2].month)
+            if particao != atual:
+                if pendentes:
+                    _gravar_particao(diretorio, atual, pendentes)
+                    gravadas[atual] = len(pendentes)
+                atual, pendentes = particao, []
+            pendentes.append(linha)
+
+    if pendentes:
+        _gravar_particao(diretorio, atual, pendentes)
+        gravadas[atual] = len(pendentes)
+    return gravadas
+
+def exportar_parquet(diretorio=DIRETORIO_PADRAO, completo=False, linhas_por_lote=LINHAS_POR_LOTE):
+    """ Exporta as transações para Parquet, particionadas por usuário, ano e mês. Na primeira execução (ou com completo=True)
+    exporta tudo em uma única consulta em fluxo; nas seguintes, regrava só as partições alteradas desde a última exportação
+    (uma consulta indexada por partição) e apaga as que ficaram vazias. Retorna um resumo com as partições gravadas e removidas."""
+
+    os.makedirs(diretorio, exist_ok=True)
+    manifesto = None if completo else _ler_manifesto(diretorio)
+    inicio = datetime.now() # a próxima marca d'água: o que for gravado durante a exportação entra na próxima execução
+
+    db = SessionLeitura() # só leitura: a exportação não trava as escritas do app enquanto percorre a tabela
+
+    try:
+        quantidades = _quantidades_por_particao(db)
+
+        if manifesto is None:
+            anteriores = _ler_manifesto(diretorio) or {"particoes": {}}
+            gravadas = _exportar_em_fluxo(db, _consulta_transacoes(), diretorio, linhas_por_lote)
+            removidas = [p for p in (tuple(map(int, chave.split("/"))) for chave in anteriores["particoes"]) if p not in gravadas]
+        else:
+            exportadas = {tuple(map(int, chave.split("/"))): qtd for chave, qtd in manifesto["particoes"].items()}
+            alteradas = _particoes_alteradas(db, datetime.fromisoformat(manifesto["marca_dagua"]))
+            alteradas |= {p for p in set(quantidades) | set(exportadas) if quantidades.get(p) != exportadas.get(p)}
+
+            gravadas, removidas = dict(exportadas), []
+            for particao in sorted(alteradas):
+                id_usuario, ano, mes = particao
+                de, ate = _limites_do_mes(ano, mes)
+                consulta = _consulta_transacoes().where(Transacao.id_usuario == id_usuario, Transacao.data >= de, Transacao.data < ate)
+                novas = _exportar_em_fluxo(db, consulta, diretorio, linhas_por_lote)
+                gravadas.pop(particao, None)
+                gravadas.update(novas)
+                if particao not in novas:
+                    removidas.append(particao)
+
+        for particao in removidas:
+            _remover_particao(diretorio, particao)
+
+        _gravar_manifesto(diretorio, {
+            "marca_dagua": inicio.isoformat(),
+            "exportado_em": date.today().isoformat(),
+            "particoes": {_chave(p): qtd for p, qtd in sorted(gravadas.items())},
+        })
+
+        regravadas = len(gravadas) if manifesto is None else len(alteradas) - len(removidas)
+        print(f"Exportação concluída: {regravadas} partição(ões) gravada(s), {len(removidas)} removida(s), "
+              f"{sum(gravadas.values())} transações no total em '{diretorio}'.")
+        return {"completa": manifesto is None, "particoes_gravadas": regravadas, "particoes_removidas": len(removidas),
+                "transacoes": sum(gravadas.values())}
+
+    except Exception as e:
+        print(f"Erro na exportação para Parquet (o manifesto anterior continua valendo): {e}")
+        raise e
+
+    finally:
+        db.close()
+#endregion
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    exportar_parquet(argumentos[0] if argumentos else DIRETORIO_PADRAO, completo="--completo" in sys.argv)
@@ -0,0 +1,237 @@
+import sys
+import os
+import io
+import re
+from contextlib import redirect_stdout
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+import database.config as config
+from database.config import Base, SessionLocal, SessionLeitura
+from classes.usuarios import Usuario
+from classes.contas import Conta_Corrente, Conta_Cartao, SubtipoConta
+from classes.transacoes import Transacao
+from classes.categorias import Categoria
+from classes.regras import RegraTag
+from classes.familias import Familia
+from classes.metas import Meta
+from classes.ativos import Ativo
+import data_provider
+import importadorCSV
+from services import transaction_service, agregado_service, recorrencia_service, previsao_service
+
+# Suíte de regressão dos planos de consulta: executa as funções do data_provider e dos serviços contra um banco em memória,
+# captura cada SQL emitido e roda EXPLAIN QUERY PLAN. Se alguma consulta voltar a varrer uma tabela inteira (SCAN), o script falha.
+# Também falha quando um cenário dá erro (as funções de leitura capturam as exceções e só imprimem "Erro ...", então a saída de cada
+# cenário é verificada) ou quando o número de consultas analisadas muda: menos consultas que o esperado costuma significar um
+# cenário que parou no meio, e mais consultas, uma regressão. Ao mudar de propósito as consultas, atualize CONSULTAS_ESPERADAS.
+# Uso: python Scripts_aux/verificar_planos_consulta.py
+
+# tabelas que nunca podem ser varridas por completo nos caminhos quentes
+TABELAS_MONITORADAS = {"transacoes", "contas", "categorias", "subcategorias", "regras_tags", "agregados_mensais", "metas", "ativos"}
+
+# número de consultas (SELECT, UPDATE e DELETE) que os cenários abaixo emitem contra a massa de popular_banco
+CONSULTAS_ESPERADAS = 131
+
+# "SCAN tabela" (varredura da tabela) ou "SCAN tabela USING INDEX ..." (varredura do índice inteiro). Só SEARCH é aceito.
+PADRAO_SCAN = re.compile(r"^SCAN (\w+)")
+
+engine_teste = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+# todas as funções da aplicação passam a usar o banco de teste, inclusive as de relatório (SessionLeitura): o banco em memória
+# só existe nesta engine, então ela também faz o papel da engine somente leitura
+SessionLocal.configure(bind=engine_teste)
+SessionLeitura.configure(bind=engine_teste)
+config.engine_leitura = engine_teste
+
+consultas_capturadas = [] # lista de (origem, sql, parâmetros)
+origem_atual = None
+
+@event.listens_for(engine_teste, "before_cursor_execute")
+def capturar_consulta(conn, cursor, statement, parameters, context, executemany):
+    # guardamos apenas as leituras e as atualizações/remoções, que são as que dependem de índice
+    if origem_atual and not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+        consultas_capturadas.append((origem_atual, statement, parameters))
+
+def popular_banco():
+    # cria uma massa pequena, mas representativa, de dados para o planejador trabalhar
+    Base.metadata.create_all(bind=engine_teste)
+    db = SessionLocal()
+    try:
+        familia = Familia(nome_familia="Família Teste")
+        db.add(familia)
+        db.flush()
+
+        usuario = Usuario(nome="Teste", email="planos@teste.com", senha_plana="123", id_familia=familia.id_familia)
+        db.add(usuario)
+        db.flush()
+
+        categoria = Categoria(nome="Alimentação", id_usuario=usuario.id_usuario, limite_gastos_mensal=500.0)
+        db.add(categoria)
+        db.flush()
+
+        corrente = Conta_Corrente(nome_conta="Corrente", id_usuario=usuario.id_usuario, subtipo_conta=SubtipoConta.corrente, cheque_especial=500.0, limite_seguranca=100.0)
+        cartao = Conta_Cartao(nome_conta="Cartão", id_usuario=usuario.id_usuario, subtipo_conta=SubtipoConta.cartao, limite=2000.0, vencimento_cartao=10, fechamento_cartao=3)
+        db.add_all([corrente, cartao])
+        db.flush()
+
+        db.add(RegraTag(palavra_chave="supermercado", id_usuario=usuario.id_usuario, id_categoria=categoria.id_categoria, id_subcategoria=None))
+
+        hoje = datetime.now()
+        for i in range(300):
+            conta = corrente if i % 2 else cartao
+            db.add(Transacao(
+                valor=10.0 + i,
+                tipo="despesa" if i % 3 else "receita",
+                id_conta=conta.id_conta,
+                id_usuario=usuario.id_usuario,
+                id_categoria=categoria.id_categoria,
+                data=hoje - timedelta(days=i) + (timedelta(days=40) if i % 17 == 0 else timedelta()),
+                descricao=f"MERCADO {i}",
+                quitada=bool(i % 5)
+            ))
+
+        # itens compartilhados com a família: uma conta de quem não é membro, uma meta da família e um ativo com compras
+        parente = Usuario(nome="Parente", email="parente@teste.com", senha_plana="123")
+        db.add(parente)
+        db.flush()
+        compartilhada = Conta_Corrente(nome_conta="Casa", id_usuario=parente.id_usuario, subtipo_conta=SubtipoConta.corrente)
+        compartilhada.id_familia = familia.id_familia
+        meta = Meta(nome_meta="Viagem", valor_alvo=5000.0, data_inicio=datetime.now().date(), prazo_final=(datetime.now() + timedelta(days=365)).date(),
+                    id_familia=familia.id_familia, aporte_inicial=300.0)
+        db.add_all([compartilhada, meta])
+        db.flush()
+        ativo = Ativo(nome_ativo="Tesouro", tipo_ativo="renda_fixa", id_usuario=usuario.id_usuario, id_conta=corrente.id_conta, id_familia=familia.id_familia)
+        db.add(ativo)
+        db.flush()
+        compra = Transacao(valor=1000.0, tipo="compra", id_conta=corrente.id_conta, id_usuario=usuario.id_usuario, quantidade=10,
+                           data=datetime.now() - timedelta(days=30), descricao="APLICACAO TESOURO")
+        compra.id_ativo = ativo.id_ativo
+        db.add_all([
+            compra,
+            Transacao(valor=200.0, tipo="receita", id_conta=compartilhada.id_conta, id_usuario=parente.id_usuario, id_meta=meta.id_meta,
+                      data=datetime.now() - timedelta(days=10), descricao="APORTE VIAGEM"),
+        ])
+        db.commit()
+        return usuario.id_usuario, corrente.id_conta, familia.id_familia
+    finally:
+        db.close()
+
+def somar_periodo_longo(id_usuario):
+    # período de vários meses, com bordas: exercita a leitura dos agregados e das transações das bordas
+    db = SessionLocal()
+    try:
+        agora = datetime.now()
+        return agregado_service.somar_periodo(db, id_usuario, agora - timedelta(days=250), agora, agrupar_por=("id_categoria", "tipo"))
+    finally:
+        db.close()
+
+def executar_cenarios(id_usuario, id_conta, id_familia, caminho_csv):
+    # cada entrada é (nome exibido no relatório, função sem argumentos)
+    cenarios = [
+        ("data_provider.consolidar_saldos", lambda: data_provider.consolidar_saldos(id_usuario)),
+        ("data_provider.recuperar_despesas", lambda: data_provider.recuperar_despesas(id_usuario)),
+        ("data_provider.recuperar_saldo_total", lambda: data_provider.recuperar_saldo_total(id_usuario)),
+        ("data_provider.listar_contas", lambda: data_provider.listar_contas(id_usuario)),
+        ("data_provider.obter_detalhamento_contas", lambda: data_provider.obter_detalhamento_contas(id_usuario)),
+        ("data_provider.recuperar_composicao_patrimonio", lambda: data_provider.recuperar_composicao_patrimonio(id_usuario)),
+        ("data_provider.recuperar_resumo_mensal", lambda: data_provider.recuperar_resumo_mensal(id_usuario)),
+        ("data_provider.recuperar_ultimas_movimentacoes", lambda: data_provider.recuperar_ultimas_movimentacoes(id_usuario)),
+        ("data_provider.recuperar_agendamentos", lambda: data_provider.recuperar_agendamentos(id_usuario)),
+        ("data_provider.rastreador_gatilhos", lambda: data_provider.rastreador_gatilhos(id_usuario)),
+        ("data_provider.recuperar_alertas", lambda: data_provider.recuperar_alertas(id_usuario)),
+        ("data_provider.recuperar_orcamentos", lambda: data_provider.recuperar_orcamentos(id_usuario)),
+        ("data_provider.recuperar_saldos_projetados", lambda: data_provider.recuperar_saldos_projetados(id_usuario)),
+        ("data_provider.recuperar_totais_por_categoria", lambda: data_provider.recuperar_totais_por_categoria(
+            id_usuario, (datetime.now() - timedelta(days=90)).date(), datetime.now().date())),
+        ("data_provider.carregar_painel", lambda: data_provider.carregar_painel(id_usuario, "anual")),
+        ("data_provider.recuperar_historico_saldos", lambda: data_provider.recuperar_historico_saldos(
+            id_usuario, (datetime.now() - timedelta(days=400)).date(), frequencia="mensal")),
+        ("data_provider.recuperar_faturas_cartoes", lambda: data_provider.recuperar_faturas_cartoes(id_usuario)),
+        ("data_provider.recuperar_saldo_familia", lambda: data_provider.recuperar_saldo_familia(id_familia)),
+        ("data_provider.recuperar_composicao_patrimonio_familia", lambda: data_provider.recuperar_composicao_patrimonio_familia(id_familia)),
+        ("data_provider.recuperar_resumo_mensal_familia", lambda: data_provider.recuperar_resumo_mensal_familia(id_familia)),
+        ("data_provider.recuperar_despesas_familia", lambda: data_provider.recuperar_despesas_familia(id_familia, "anual")),
+        ("data_provider.recuperar_orcamentos_familia", lambda: data_provider.recuperar_orcamentos_familia(id_familia)),
+        ("data_provider.recuperar_metas_familia", lambda: data_provider.recuperar_metas_familia(id_familia)),
+        ("agregado_service.somar_periodo", lambda: somar_periodo_longo(id_usuario)),
+        ("recorrencia_service.detectar_recorrencias", lambda: recorrencia_service.detectar_recorrencias(id_usuario)),
+        ("recorrencia_service.detectar_recorrencias (incremental)", lambda: recorrencia_service.detectar_recorrencias(id_usuario, descricoes={"MERCADO"})),
+        ("previsao_service.prever_fluxo", lambda: previsao_service.prever_fluxo(id_usuario=id_usuario)),
+        ("previsao_service.prever_fluxo (família)", lambda: previsao_service.prever_fluxo(id_familia=id_familia)),
+        ("transaction_service.criar_movimentacao", lambda: transaction_service.criar_movimentacao(
+            12.5, "despesa", id_usuario, id_conta, "SUPERMERCADO NOVO", datetime.now())),
+        ("transaction_service.alterar_status_quitacao", lambda: transaction_service.alterar_status_quitacao(1, True)),
+        ("transaction_service.deletar_movimentacao", lambda: transaction_service.deletar_movimentacao(2)),
+        ("importadorCSV.importar_extrato_csv", lambda: importadorCSV.importar_extrato_csv(caminho_csv, id_conta)),
+        ("importadorCSV.importar_extrato_csv_em_partes", lambda: list(importadorCSV.importar_extrato_csv_em_partes(caminho_csv, id_conta, linhas_por_parte=5))),
+    ]
+
+    # um cenário falha se levantar uma exceção ou se imprimir um erro capturado pela própria função
+    global origem_atual
+    erros = []
+    for nome, funcao in cenarios:
+        origem_atual = nome
+        saida = io.StringIO()
+        try:
+            with redirect_stdout(saida):
+                funcao()
+        except Exception as e:
+            erros.append((nome, repr(e)))
+        finally:
+            origem_atual = None
+
+        print(saida.getvalue(), end="")
+        erros.extend((nome, linha.strip()) for linha in saida.getvalue().splitlines() if "Erro" in linha)
+
+    return [nome for nome, _ in cenarios], erros
+
+def analisar_planos():
+    # roda EXPLAIN QUERY PLAN para cada consulta capturada e devolve a lista de varreduras encontradas
+    falhas = []
+    conexao = engine_teste.raw_connection()
+    try:
+        cursor = conexao.cursor()
+        for origem, sql, parametros in consultas_capturadas:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)
+            for linha in cursor.fetchall():
+                detalhe = linha[-1]
+                encontrado = PADRAO_SCAN.match(detalhe)
+                if encontrado and encontrado.group(1) in TABELAS_MONITORADAS:
+                    falhas.append((origem, detalhe, " ".join(sql.split())))
+    finally:
+        conexao.close()
+    return falhas
+
+def verificar_planos_consulta():
+    id_usuario, id_conta, id_familia = popular_banco()
+    caminho_csv = os.path.join(os.path.dirname(__file__), "meu_extrato_teste.csv")
+
+    nomes, erros = executar_cenarios(id_usuario, id_conta, id_familia, caminho_csv)
+    falhas = analisar_planos()
+
+    print(f"\n{len(consultas_capturadas)} consultas analisadas em {len(nomes)} cenários.")
+    sucesso = True
+
+    if erros:
+        print(f"❌ {len(erros)} erro(s) nos cenários:")
+        for origem, erro in erros:
+            print(f"  - {origem}: {erro}")
+        sucesso = False
+
+    if len(consultas_capturadas) != CONSULTAS_ESPERADAS:
+        print(f"❌ Eram esperadas {CONSULTAS_ESPERADAS} consultas.")
+        sucesso = False
+
+    if falhas:
+        print(f"❌ {len(falhas)} consulta(s) com varredura completa de tabela:")
+        for origem, detalhe, sql in falhas:
+            print(f"  - {origem}: {detalhe}\n      {sql[:300]}")
+        sucesso = False
+
+    if sucesso:
+        print("✅ Nenhuma consulta varre tabelas inteiras.")
+    return sucesso
+
+if __name__ == "__main__":
+    sys.exit(0 if verificar_planos_consulta() else 1)
@@ -1,7 +1,8 @@
 import streamlit as st
 import streamlit.components.v1 as components
-from database.config import SessionLocal
 import urllib.parse
+import data_provider
+from utils.cache import versao_dados
 
 # --- IMPORTAÇÃO DOS MODELOS (Ordem para evitar erros de mapeamento) ---
 from classes.familias import Familia  
@@ -16,7 +17,6 @@ from classes.indices import IndiceFinanceiro
 
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
-from sqlalchemy.orm import joinedload
 import locale
 try:
     locale.setlocale(locale.LC_TIME, 'pt_BR.utf-8')
@@ -49,11 +49,30 @@ st.set_page_config(page_title="MeuDinheiro Resumo", layout="centered")
 # 📊 LÓGICA DE DADOS
 # ==========================================
 #region
-with SessionLocal() as db: 
-    # Carrega categorias e contas com transações (evita DetachedInstanceError)
-    categorias = db.query(Categoria).options(joinedload(Categoria.transacoes)).filter(Categoria.id_usuario == 1).all()
-    contas_usuario = db.query(Conta).options(joinedload(Conta.transacoes)).filter(Conta.id_usuario == 1).all()
-    saldototal_usuario = sum([c.saldo_atual for c in contas_usuario])
+ID_USUARIO = 1
+
+# As consultas abaixo trazem apenas valores já agregados pelo banco (nada de carregar o histórico de transações).
+# O st.cache_data guarda o resultado entre os reruns; a versão dos dados do usuário (utils/cache.py) entra na chave,
+# então qualquer escrita no banco faz a próxima execução buscar os valores atualizados.
+@st.cache_data(show_spinner=False, max_entries=256)
+def carregar_saldos_contas(id_usuario, versao, dia):
+    # saldo atual de cada conta (o dia entra na chave porque transações futuras passam a contar quando a data chega)
+    return data_provider.obter_detalhamento_contas(id_usuario)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def carregar_totais_categoria(id_usuario, data_inicio, data_fim, versao):
+    # total de saídas por categoria no período selecionado
+    return data_provider.recuperar_totais_por_categoria(id_usuario, data_inicio, data_fim)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def consolidar_saldos_do_dia(id_usuario, dia):
+    # única escrita antes das leituras: leva os saldos materializados até hoje (uma vez por dia) e reavalia os alertas dessas contas
+    return data_provider.consolidar_saldos(id_usuario)
+
+consolidar_saldos_do_dia(ID_USUARIO, date.today())
+versao_usuario = versao_dados(ID_USUARIO)
+contas_usuario = carregar_saldos_contas(ID_USUARIO, versao_usuario, date.today())
+saldototal_usuario = sum([c["saldo_atual"] for c in contas_usuario])
 
 # --- TOPO DO APP ---
 st.title("Painel de Controle Financeiro")
@@ -103,12 +122,11 @@ nome_periodo = meses_pt[hoje.month - 1] if opcao == "Mensal" else opcao.upper()
 # 4. Processamento de Dados (Filtro e Legenda)
 labels_grafico, valores_grafico, cores_grafico = [], [], []
 itens_legenda_html = ""
-for cat in categorias:
-    total = sum([t.valor for t in cat.transacoes if (t.tipo in ["Despesa", "Transferencia", "Investimento"]) and data_inicio <= t.data.date() <= data_fim])
-    if total > 0:
-        labels_grafico.append(cat.nome); valores_grafico.append(total); cores_grafico.append(cat.cor_hex)
-        v_txt = "R$ ****" if st.session_state.privacidade else f"R$ {total:,.2f}"
-        itens_legenda_html += f'<div style="display: flex; justify-content: space-between; margin-bottom: 12px;"><span style="color: {cat.cor_hex}; font-weight: 700; text-transform: uppercase; font-size: 0.9rem;">{cat.nome}</span><span style="color: {cat.cor_hex}; font-weight: 700; font-size: 0.9rem;">{v_txt}</span></div>'
+for cat in carregar_totais_categoria(ID_USUARIO, data_inicio, data_fim, versao_usuario): # uma consulta pequena por período (só categorias com total > 0)
+    total = cat["valor"]
+    labels_grafico.append(cat["nome"]); valores_grafico.append(total); cores_grafico.append(cat["cor_hex"])
+    v_txt = "R$ ****" if st.session_state.privacidade else f"R$ {total:,.2f}"
+    itens_legenda_html += f'<div style="display: flex; justify-content: space-between; margin-bottom: 12px;"><span style="color: {cat["cor_hex"]}; font-weight: 700; text-transform: uppercase; font-size: 0.9rem;">{cat["nome"]}</span><span style="color: {cat["cor_hex"]}; font-weight: 700; font-size: 0.9rem;">{v_txt}</span></div>'
 
 if not valores_grafico:
     labels_grafico, dados_js, cores_grafico = ["Sem Dados"], [1], ["#DDDDDD"]
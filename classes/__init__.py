@@ -7,4 +7,6 @@ from .indices import IndiceFinanceiro
 from .metas import Meta
 from .regras import RegraTag
 from .familias import Familia
-from .convites_familia import ConviteFamilia
\ No newline at end of file
+from .convites_familia import ConviteFamilia
+from .agregados import AgregadoMensal
+from .alertas import Alerta
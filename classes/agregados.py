@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import datetime
+from database.config import Base
+from sqlalchemy import Column, Integer, Date, Enum, UniqueConstraint, event, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.attributes import get_history
+from classes.transacoes import Transacao, TipoTransacao
+from utils.dinheiro import Dinheiro, centavos, reais
+
+"""############################### AGREGADOS MENSAIS ########################################################"""
+class AgregadoMensal(Base):
+    """ Tabela de agregados (rollup) das transações: soma e quantidade por usuário, mês, categoria, subcategoria e tipo.
+    É mantida incrementalmente a cada escrita em transacoes (eventos abaixo e importador), para que os relatórios de períodos longos
+    leiam uma linha por mês e categoria em vez de todas as transações. Pode ser refeita por completo com services/agregado_service.py."""
+
+#region TABELA E COLUNAS
+    __tablename__ = "agregados_mensais"
+
+    # CAMPOS DA TABELA
+    id_agregado = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, nullable=False) # dono das transações agregadas
+    mes = Column(Date, nullable=False) # primeiro dia do mês agregado
+    id_categoria = Column(Integer, nullable=False, default=0) # 0 = transações sem categoria (NULL não funcionaria na restrição de unicidade)
+    id_subcategoria = Column(Integer, nullable=False, default=0) # 0 = transações sem subcategoria
+    tipo = Column(Enum(TipoTransacao), nullable=False)
+    total = Column(Dinheiro, nullable=False, default=0.0) # soma dos valores das transações, exata (centavos inteiros no banco)
+    quantidade = Column(Integer, nullable=False, default=0) # número de transações
+
+    # RESTRIÇÃO DE UNICIDADE (também serve de índice para as consultas por usuário e mês)
+    __table_args__ = (UniqueConstraint("id_usuario", "mes", "id_categoria", "id_subcategoria", "tipo", name="_agregado_mensal_uc"),)
+#endregion
+
+#region MANUTENÇÃO INCREMENTAL
+
+CAMPOS_CHAVE = ("id_usuario", "data", "id_categoria", "id_subcategoria", "tipo")
+
+def inicio_do_mes(data):
+    """Retorna o primeiro dia do mês da data (aceita date ou datetime)."""
+    if isinstance(data, datetime):
+        data = data.date()
+    return data.replace(day=1)
+
+def chave_agregado(id_usuario, data, id_categoria, id_subcategoria, tipo):
+    # chave da linha agregada de uma transação. Transações sem usuário, data ou tipo não entram nos agregados.
+    if id_usuario is None or data is None or tipo is None:
+        return None
+    return (id_usuario, inicio_do_mes(data), id_categoria or 0, id_subcategoria or 0, TipoTransacao(tipo))
+
+def aplicar_deltas(conexao, deltas):
+    """ Soma os deltas {chave: (total, quantidade)} nos agregados com um único UPSERT em massa. As linhas que ficarem
+    sem nenhuma transação são removidas."""
+
+    deltas = {chave: valores for chave, valores in deltas.items() if chave is not None and any(valores)}
+    if not deltas:
+        return
+
+    linhas = [{"id_usuario": u, "mes": m, "id_categoria": c, "id_subcategoria": s, "tipo": t, "total": total, "quantidade": qtd}
+              for (u, m, c, s, t), (total, qtd) in deltas.items()]
+
+    comando = insert(AgregadoMensal.__table__)
+    comando = comando.on_conflict_do_update(
+        index_elements=["id_usuario", "mes", "id_categoria", "id_subcategoria", "tipo"],
+        set_={"total": AgregadoMensal.__table__.c.total + comando.excluded.total,
+              "quantidade": AgregadoMensal.__table__.c.quantidade + comando.excluded.quantidade}
+    )
+    conexao.execute(comando, linhas)
+
+    if any(qtd < 0 for _, qtd in deltas.values()):
+        usuarios = {chave[0] for chave in deltas}
+        conexao.execute(delete(AgregadoMensal.__table__).where(
+            AgregadoMensal.__table__.c.id_usuario.in_(usuarios), AgregadoMensal.__table__.c.quantidade <= 0))
+
+def deltas_de_registros(registros, sinal=1):
+    """Agrupa uma lista de transações em dicionários (como as do INSERT em massa do importador) em deltas por chave. Os valores são
+    somados em centavos, então o total de cada chave é exato."""
+    deltas = defaultdict(lambda: [0, 0])
+    for r in registros:
+        chave = chave_agregado(r["id_usuario"], r["data"], r.get("id_categoria"), r.get("id_subcategoria"), r["tipo"])
+        deltas[chave][0] += centavos(r["valor"]) * sinal
+        deltas[chave][1] += sinal
+    return {chave: (reais(total), quantidade) for chave, (total, quantidade) in deltas.items()}
+
+def _valores_anteriores(alvo):
+    # valores da transação antes das alterações pendentes desta sessão (para desfazer a contribuição antiga)
+    anteriores = {}
+    for campo in CAMPOS_CHAVE + ("valor",):
+        historico = get_history(alvo, campo)
+        anteriores[campo] = historico.deleted[0] if historico.deleted else getattr(alvo, campo)
+    return anteriores
+
+def _chave_e_valor(valores):
+    return chave_agregado(*(valores[campo] for campo in CAMPOS_CHAVE)), valores["valor"] or 0.0
+
+# Os eventos do mapeador cobrem todas as escritas feitas pelo ORM (transaction_service, CRUDMixin, scripts) na mesma transação do banco.
+# Escritas em massa pelo Core (importador, remoção de contas) chamam aplicar_deltas diretamente.
+@event.listens_for(Transacao, "after_insert")
+def _agregar_insercao(mapper, conexao, alvo):
+    chave, valor = _chave_e_valor({campo: getattr(alvo, campo) for campo in CAMPOS_CHAVE + ("valor",)})
+    aplicar_deltas(conexao, {chave: (valor, 1)})
+
+@event.listens_for(Transacao, "after_delete")
+def _agregar_remocao(mapper, conexao, alvo):
+    chave, valor = _chave_e_valor(_valores_anteriores(alvo))
+    aplicar_deltas(conexao, {chave: (-valor, -1)})
+
+@event.listens_for(Transacao, "after_update")
+def _agregar_alteracao(mapper, conexao, alvo):
+    if not any(get_history(alvo, campo).has_changes() for campo in CAMPOS_CHAVE + ("valor",)):
+        return # ex.: mudança de quitada ou descrição, que não afeta os agregados
+
+    chave_antiga, valor_antigo = _chave_e_valor(_valores_anteriores(alvo))
+    chave_nova, valor_novo = _chave_e_valor({campo: getattr(alvo, campo) for campo in CAMPOS_CHAVE + ("valor",)})
+
+    deltas = defaultdict(lambda: [0.0, 0])
+    deltas[chave_antiga][0] -= valor_antigo
+    deltas[chave_antiga][1] -= 1
+    deltas[chave_nova][0] += valor_novo
+    deltas[chave_nova][1] += 1
+    aplicar_deltas(conexao, deltas)
+
+#endregion
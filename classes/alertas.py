@@ -0,0 +1,124 @@
+from datetime import datetime, date
+from database.config import Base, SessionLocal
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint, event, delete
+from sqlalchemy.orm.attributes import get_history
+from classes.transacoes import Transacao, TipoTransacao
+from classes.contas import Conta
+from classes.categorias import Categoria
+from utils.dinheiro import Dinheiro
+
+"""############################### ALERTAS ########################################################"""
+class Alerta(Base):
+    """ Alertas gerados pelos gatilhos das contas e categorias (limite de segurança, uso do cheque especial, uso do limite do cartão
+    e orçamento mensal da categoria). Os gatilhos são avaliados a cada escrita que pode mudá-los (services/alerta_service.py), então
+    a leitura dos alertas é uma única consulta nesta tabela, sem recalcular saldos.
+    Cada situação tem uma chave de deduplicação: enquanto ela continua valendo, o mesmo alerta é atualizado (e não repetido); quando
+    deixa de valer, o alerta é desativado, e só volta a aparecer (como não reconhecido) se a situação se repetir."""
+
+#region TABELA E COLUNAS
+    __tablename__ = "alertas"
+
+    # CAMPOS DA TABELA
+    id_alerta = Column(Integer, primary_key=True, autoincrement=True)
+    chave = Column(String, nullable=False) # chave de deduplicação da situação, ex.: "cheque_especial:3" ou "orcamento_categoria:7:2026-10"
+    tipo = Column(String, nullable=False) # um de alerta_service.TIPOS_ALERTA
+    mensagem = Column(String, nullable=False) # texto exibido no widget de notificações
+    valor = Column(Dinheiro, nullable=True) # valor em reais que disparou o gatilho (saldo, valor usado ou total gasto), para ordenar ou destacar
+    percentual = Column(Float, nullable=True) # percentual de uso (cheque especial, limite do cartão e orçamento), quando o gatilho tem um
+    referencia = Column(Date, nullable=True) # mês a que o alerta se refere (orçamento da categoria); nulo para os alertas das contas
+    ativo = Column(Boolean, nullable=False, default=True) # a situação ainda vale
+    reconhecido = Column(Boolean, nullable=False, default=False) # o usuário já viu e dispensou o alerta
+    criado_em = Column(DateTime, nullable=False, default=datetime.now) # quando a situação começou (ou recomeçou)
+    atualizado_em = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    # CHAVES ESTRANGEIRAS
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False)
+    id_conta = Column(Integer, ForeignKey("contas.id_conta", ondelete="CASCADE"), nullable=True) # conta do gatilho, se houver
+    id_categoria = Column(Integer, ForeignKey("categorias.id_categoria", ondelete="CASCADE"), nullable=True) # categoria do gatilho, se houver
+
+    # RESTRIÇÃO DE UNICIDADE (deduplicação) E ÍNDICE DA LEITURA DOS ALERTAS PENDENTES
+    __table_args__ = (
+        UniqueConstraint("id_usuario", "chave", name="_alerta_usuario_chave_uc"),
+        Index("ix_alertas_usuario_pendentes", "id_usuario", "ativo", "reconhecido", "criado_em"),
+    )
+#endregion
+
+#region AVALIAÇÃO A CADA ESCRITA
+# Toda escrita feita pelo ORM em uma sessão de SessionLocal (services, CRUDMixin, scripts) que pode mudar um gatilho deixa a conta
+# e o mês da categoria afetados anotados na sessão (after_flush); no commit, os gatilhos anotados são reavaliados uma única vez,
+# na mesma transação do banco (alerta_service.avaliar). Escritas em massa pelo Core (importador, remoção de contas) chamam o
+# alerta_service diretamente.
+
+CAMPOS_TRANSACAO = ("id_conta", "id_categoria", "data", "tipo", "valor", "quitada", "ignore") # mudam o saldo, a fatura ou o orçamento
+CAMPOS_CONTA = ("limite_seguranca", "cheque_especial", "limite", "saldo_inicial", "tipo_conta", "fechamento_cartao", "vencimento_cartao", "nome_conta")
+CAMPOS_CATEGORIA = ("limite_gastos_mensal", "nome")
+
+def _alterou(objeto, campos):
+    return any(get_history(objeto, campo).has_changes() for campo in campos)
+
+def _valores(objeto, campo):
+    # valores atual e anterior (antes das alterações do flush) do campo, para avaliar também a conta ou categoria de origem
+    historico = get_history(objeto, campo)
+    return set(historico.added) | set(historico.deleted) | set(historico.unchanged) or {getattr(objeto, campo)}
+
+def _anotar(sessao, objeto, novo):
+    if isinstance(objeto, Transacao):
+        if not novo and not _alterou(objeto, CAMPOS_TRANSACAO):
+            return
+        ids_conta = {id_conta for id_conta in _valores(objeto, "id_conta") if id_conta}
+        despesa = any(tipo is not None and TipoTransacao(tipo) == TipoTransacao.DESPESA for tipo in _valores(objeto, "tipo"))
+        categorias = {(id_categoria, data) for id_categoria in _valores(objeto, "id_categoria") for data in _valores(objeto, "data")
+                      if id_categoria and data} if despesa else set()
+    elif isinstance(objeto, Conta):
+        if not novo and not _alterou(objeto, CAMPOS_CONTA):
+            return
+        ids_conta, categorias = {objeto.id_conta}, set()
+    elif isinstance(objeto, Categoria):
+        if not novo and not _alterou(objeto, CAMPOS_CATEGORIA):
+            return
+        ids_conta, categorias = set(), {(objeto.id_categoria, date.today())} # o orçamento do mês corrente
+    else:
+        return
+
+    if objeto.id_usuario is None:
+        return
+    pendentes = sessao.info.setdefault("alertas_pendentes", {}).setdefault(objeto.id_usuario, (set(), set()))
+    pendentes[0].update(ids_conta)
+    pendentes[1].update(categorias)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _anotar_gatilhos(sessao, contexto_flush):
+    # as listas new, dirty e deleted e o histórico dos atributos ainda são os de antes do flush
+    for objeto in sessao.new:
+        _anotar(sessao, objeto, novo=True)
+    for objeto in sessao.dirty:
+        _anotar(sessao, objeto, novo=False)
+    for objeto in sessao.deleted:
+        _anotar(sessao, objeto, novo=True)
+
+@event.listens_for(SessionLocal, "before_commit")
+def _avaliar_gatilhos(sessao):
+    sessao.flush() # as escritas ainda pendentes passam pelo after_flush antes da avaliação
+    pendentes = sessao.info.pop("alertas_pendentes", None)
+    if not pendentes:
+        return
+
+    from services import alerta_service # import local para evitar importação circular (o serviço importa as classes)
+    for id_usuario, (ids_conta, categorias) in pendentes.items():
+        alerta_service.avaliar(sessao, id_usuario, ids_conta, categorias)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_gatilhos(sessao):
+    sessao.info.pop("alertas_pendentes", None)
+
+# O SQLite só aplica o ON DELETE CASCADE com PRAGMA foreign_keys ligado, o que não é o caso: os alertas de uma conta ou categoria
+# removida pelo ORM (CRUDMixin.deletar, account_service) são apagados no mesmo flush, para não ficarem ativos sem dono.
+@event.listens_for(Conta, "after_delete", propagate=True)
+def _remover_alertas_da_conta(mapper, conexao, conta):
+    conexao.execute(delete(Alerta).where(Alerta.id_conta == conta.id_conta))
+
+@event.listens_for(Categoria, "after_delete")
+def _remover_alertas_da_categoria(mapper, conexao, categoria):
+    conexao.execute(delete(Alerta).where(Alerta.id_categoria == categoria.id_categoria))
+
+#endregion
@@ -21,10 +21,10 @@ class Ativo(Base, CRUDMixin):
     taxa_custodia_anual = Column(Float, nullable=True) # taxa de custódia anual do ativo financeiro, ou seja, a taxa cobrada por corretoras ou instituições financeiras para manter o ativo em custódia. O campo taxa_custodia_anual é usado para calcular o custo total do investimento em um ativo ao longo do tempo, levando em consideração as taxas de custódia cobradas pela corretora ou instituição financeira. O campo taxa_custodia_anual é opcional, pois nem todos os ativos financeiros estão sujeitos a taxas de custódia, como por exemplo, um imóvel ou um carro.
 
     # CHAVES ESTRANGEIRAS:
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario")) # id do usuário ao qual o ativo pertence, para garantir que cada usuário tenha seus próprios ativos financeiros registrados no sistema. O campo id_usuario é usado para criar um relacionamento entre o ativo e o usuário, permitindo que o sistema associe os ativos ao usuário correto e exiba as informações dos ativos de forma personalizada para cada usuário. O campo id_usuario é uma chave estrangeira que referencia a coluna id_usuario da tabela de usuários, garantindo a integridade referencial entre os ativos e os usuários no banco de dados.
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), index=True) # id do usuário ao qual o ativo pertence, para garantir que cada usuário tenha seus próprios ativos financeiros registrados no sistema. O campo id_usuario é usado para criar um relacionamento entre o ativo e o usuário, permitindo que o sistema associe os ativos ao usuário correto e exiba as informações dos ativos de forma personalizada para cada usuário. O campo id_usuario é uma chave estrangeira que referencia a coluna id_usuario da tabela de usuários, garantindo a integridade referencial entre os ativos e os usuários no banco de dados.
     id_indice = Column(Integer, ForeignKey("indices.id_indice"), nullable=True) # id do índice financeiro associado ao ativo, para permitir que o usuário vincule um índice financeiro específico ao ativo, como a taxa SELIC para uma ação de renda fixa, ou a inflação medida pelo IPCA para um fundo imobiliário. O campo id_indice é usado para criar um relacionamento entre o ativo e um índice financeiro, permitindo que o sistema utilize o valor do índice para calcular a rentabilidade do ativo ou corrigir o valor do ativo de acordo com a inflação, por exemplo. O campo id_indice é opcional, pois nem todos os ativos precisam estar associados a um índice financeiro.
     id_conta = Column(Integer, ForeignKey("contas.id_conta")) # id da conta associada ao ativo, para permitir que o usuário vincule um ativo a uma conta específica, como uma conta de investimento ou uma conta de poupança. O campo id_conta é usado para criar um relacionamento entre o ativo e uma conta, permitindo que o sistema associe os ativos às contas corretas e exiba as informações dos ativos de forma personalizada para cada conta. O campo id_conta é opcional, pois nem todos os ativos precisam estar associados a uma conta específica.
-    id_familia = Column(Integer, ForeignKey("familias.id_familia"), nullable=True) # id da família associada ao ativo, para permitir que o usuário vincule um ativo a uma família específica, caso ele faça parte de uma família no sistema. O campo id_familia é usado para criar um relacionamento entre o ativo e uma família, permitindo que o sistema associe os ativos às famílias corretas e exiba as informações dos ativos de forma personalizada para cada família. O campo id_familia é opcional, pois nem todos os ativos precisam estar associados a uma família específica.
+    id_familia = Column(Integer, ForeignKey("familias.id_familia"), nullable=True, index=True) # id da família associada ao ativo, para permitir que o usuário vincule um ativo a uma família específica, caso ele faça parte de uma família no sistema. O campo id_familia é usado para criar um relacionamento entre o ativo e uma família, permitindo que o sistema associe os ativos às famílias corretas e exiba as informações dos ativos de forma personalizada para cada família. O campo id_familia é opcional, pois nem todos os ativos precisam estar associados a uma família específica.
 
     # RELACIONAMENTOS COM OUTRAS TABELAS:
     usuario = relationship("Usuario", back_populates="ativos") # relacionamento com a tabela de usuários.                                       # CONFERIDO
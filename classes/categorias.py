@@ -1,9 +1,10 @@
 from database.config import Base
 from database.mixin import CRUDMixin
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Enum
 from sqlalchemy.orm import relationship
 from classes.transacoes import TipoTransacao
 from utils.tools import gerar_cor
+from utils.dinheiro import Dinheiro
 
 """############################### CATEGORIAS ########################################################"""
 class Categoria(Base, CRUDMixin):
@@ -17,12 +18,12 @@ class Categoria(Base, CRUDMixin):
     cor_hex = Column(String) # cor hexadecimal da categoria
     icone = Column(String(50)) # nome do ícone da categoria
     tipo = Column(Enum(TipoTransacao)) # tipo de transação associado a categoria
-    limite_gastos_mensal = Column(Float, nullable=True) # limite de gastos mensal para a categoria, pode ser nulo caso o usuário não queira estipular um limite
+    limite_gastos_mensal = Column(Dinheiro, nullable=True) # limite de gastos mensal para a categoria, pode ser nulo caso o usuário não queira estipular um limite
     ordem_exibicao = Column(Integer, nullable=True) # campo para definir a ordem de exibição das categorias, pode ser nulo caso o usuário não queira estipular uma ordem específica
     ativa = Column(Boolean, nullable=False, default=True) # campo para indicar se a categoria está ativa ou inativa.
     
     # CHAVE ESTRANGEIRA:
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=True) # id de usuário
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=True, index=True) # id de usuário
 
     # RELACIONAMENTOS:
     usuario = relationship("Usuario", back_populates="categorias") # relacionamento com a tabela de usuários
@@ -72,13 +73,13 @@ class Subcategoria(Base, CRUDMixin):
     nome = Column(String, nullable=False) # nome da subcategoria
     icone = Column(String(50)) # nome do ícone da subcategoria
     tipo = Column(Enum(TipoTransacao)) # tipo de transação associado a subcategoria
-    limite_gastos_mensal = Column(Float, nullable=True) # limite de gastos mensal para a subcategoria, pode ser nulo caso o usuário não queira estipular um limite
+    limite_gastos_mensal = Column(Dinheiro, nullable=True) # limite de gastos mensal para a subcategoria, pode ser nulo caso o usuário não queira estipular um limite
     ordem_exibicao = Column(Integer, nullable=True) # campo para definir a ordem de exibição das categorias, pode ser nulo caso o usuário não queira estipular uma ordem específica
     ativa = Column(Boolean, nullable=False, default=True) # campo para indicar se a subcategoria está ativa ou inativa.
 
     # CHAVES ESTRANGEIRAS:
     id_categoria = Column(Integer, ForeignKey("categorias.id_categoria")) # id da categoria pai
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario")) # id de usuário
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), index=True) # id de usuário
 
     # RELACIONAMENTOS:
     categoria = relationship("Categoria", back_populates="subcategorias") # relacionamento com a tabela de categorias
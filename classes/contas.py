@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Enum, Date, event
 from database.config import Base
 from database.mixin import CRUDMixin
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import get_history
 from datetime import datetime, date
+from types import SimpleNamespace
 import enum
+from classes.transacoes import Transacao
+from utils.dinheiro import Dinheiro, centavos, reais
 
 # region ENUMS
 
@@ -35,7 +39,7 @@ class Conta(Base, CRUDMixin):
 
     # CAMPOS DA TABELA
     id_conta = Column(Integer, primary_key=True, autoincrement=True) # coluna id conta
-    saldo_inicial = Column(Float, default=0.0) # coluna de saldo inicial
+    saldo_inicial = Column(Dinheiro, default=0.0) # coluna de saldo inicial
     nome_conta = Column(String) # Coluna nome da conta
     banco = Column(String) # nome do banco
     tipo_instituicao = Column(Enum(TipoInstituicao), default=TipoInstituicao.banco) # tipo de instituição financeira, como banco, fintech, corretora, etc.
@@ -43,23 +47,28 @@ class Conta(Base, CRUDMixin):
     cor_perfil = Column(String, nullable=True) # cor para representar a conta nos gráficos, pode ser nula, caso o usuário não queira escolher uma cor específica para a conta, e nesse caso, o sistema pode atribuir uma cor padrão ou escolher uma cor aleatória para a conta.
     tipo_conta = Column(String, nullable=False) # coluna com o tipo de conta (Ex.: conta corrente, poupança, cartão de crédito, dinheiro, etc.). O campo tipo_conta é usado para categorizar as contas do usuário e pode ser útil para filtrar as contas em gráficos e relatórios, ou para aplicar regras específicas de acordo com o tipo de conta, como por exemplo, não considerar contas do tipo dinheiro no cálculo do patrimônio líquido.
     subtipo_conta = Column(Enum(SubtipoConta), nullable=True) # coluna com o subtipo de conta. O campo subtipo_conta é usado para fornecer uma categorização mais detalhada das contas do usuário, permitindo uma organização mais granular e personalizada das contas, e pode ser útil para filtrar as contas em gráficos e relatórios, ou para aplicar regras específicas de acordo com o subtipo de conta.
-    limite_seguranca = Column (Float, nullable=True) # limite de segurança estipulado pelo usuário
+    limite_seguranca = Column (Dinheiro, nullable=True) # limite de segurança estipulado pelo usuário
     ativa = Column(Boolean, default=True) # campo para indicar se a conta está ativa ou inativa, permitindo que o usuário desative contas que não estão mais em uso sem precisar deletá-las do sistema, e assim manter um histórico das contas anteriores. O campo ativa é usado para filtrar as contas ativas e inativas em gráficos e relatórios, e para evitar que contas inativas sejam consideradas em cálculos como o saldo total ou o patrimônio líquido do usuário.
+
+    # SALDO MATERIALIZADO
+    # O saldo é mantido incrementalmente pelos serviços de escrita (services/saldo_service.py), evitando percorrer todas as transações a cada leitura.
+    saldo_materializado = Column(Dinheiro, default=0.0) # saldo da conta considerando todas as transações até a data de saldo_referencia.
+    saldo_referencia = Column(Date, nullable=True) # dia até o qual o saldo materializado está consolidado. Quando o dia vira, o saldo é levado até hoje somando as transações que eram futuras (saldo_service.atualizar_saldos_vencidos).
     
     # CONTA CORRENTE
     # Essas colunas são usadas apenas para contas do tipo corrente, e podem ser nulas para outros tipos de conta.
-    cheque_especial = Column(Float, default= 0.0 ) # coluna de cheque especial para contas correntes, por padrão será 0.0 para contas que não possuam essa funcionalidade.
+    cheque_especial = Column(Dinheiro, default= 0.0 ) # coluna de cheque especial para contas correntes, por padrão será 0.0 para contas que não possuam essa funcionalidade.
     vencimento = Column (Integer, nullable=True) #  Dia do mês que vence o cheque especial para contas correntes com essa função.
 
     # CARTÃO DE CRÉDITO
     # Essas colunas são usadas apenas para contas do tipo cartão, e podem ser nulas para outros tipos de conta.
-    limite = Column(Float, default=0.0 ) # coluna de limite para contas do tipo cartão,
+    limite = Column(Dinheiro, default=0.0 ) # coluna de limite para contas do tipo cartão,
     vencimento_cartao = Column(Integer, nullable=True) #  Dia do mês que vence a fatura do cartão.
     fechamento_cartao = Column(Integer, nullable=True) #  Dia do mês que em que a fatura do cartão é fechada.
 
     # CHAVES ESTRANGEIRAS
-    id_familia = Column(Integer, ForeignKey("familias.id_familia", ondelete="SET NULL"), nullable=True) # coluna de id da família, que permitirá associar a conta a uma família. Pode ser nula para contas que não sejam associadas a uma família.
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario")) # recuperando a id de usuário da tabela usuários
+    id_familia = Column(Integer, ForeignKey("familias.id_familia", ondelete="SET NULL"), nullable=True, index=True) # coluna de id da família, que permitirá associar a conta a uma família. Pode ser nula para contas que não sejam associadas a uma família.
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), index=True) # recuperando a id de usuário da tabela usuários
     id_indice = Column(Integer, ForeignKey("indices.id_indice")) # id de indice financeiro
 
     # RELACIONAMENTOS COM OUTRAS TABELAS  
@@ -107,6 +116,8 @@ class Conta(Base, CRUDMixin):
 
         self.nome_conta = nome_conta
         self.saldo_inicial = saldo_inicial
+        self.saldo_materializado = saldo_inicial or 0.0 # uma conta nova ainda não tem transações, então o saldo é o próprio saldo inicial.
+        self.saldo_referencia = date.today()
         self.id_usuario = id_usuario
         self.tipo_conta = tipo_conta 
         self.subtipo_conta = subtipo_conta
@@ -134,18 +145,33 @@ class Conta(Base, CRUDMixin):
     # PROPRIEDADES:
     @property
     def saldo_atual(self):
-        """ propriedade para calcular o saldo atual da conta, levando em consideração o saldo inicial e as transações associadas à conta. 
-        A função percorre as transações da conta e, para cada transação, verifica se é uma receita ou despesa e atualiza o saldo de acordo. 
-        O resultado é o saldo atual da conta, que pode ser usado para exibir ao usuário ou para outras funcionalidades do sistema. """
+        """ propriedade que retorna o saldo atual da conta. O saldo é materializado na coluna saldo_materializado e mantido
+        a cada escrita de transações (eventos no fim deste arquivo), então a leitura é O(1). Se o saldo materializado não for de hoje (ex.: a conta não foi
+        atualizada desde ontem), ele é levado até hoje somando só as transações do intervalo (saldo_service.rolar_saldo). """
+
+        if self.saldo_materializado is not None and self.saldo_referencia == date.today():
+            return self.saldo_materializado
+
+        if self.id_conta is None: # conta ainda não gravada: só existem as transações em memória
+            return self.calcular_saldo_transacoes()
+
+        from services import saldo_service # import local para evitar importação circular (o serviço importa as classes)
+        return saldo_service.rolar_saldo(self)
+
+    def calcular_saldo_transacoes(self):
+        """ calcula o saldo atual da conta percorrendo as transações associadas, levando em consideração o saldo inicial.
+        Para cada transação, verifica se é uma receita ou despesa e atualiza o saldo de acordo.
+        É o cálculo de referência, usado para contas que ainda não foram gravadas. """
         
-        # o saldo atual começa com o saldo inicial da conta
-        total = self.saldo_inicial
-        hoje = datetime.date.today() # adiciona o dia de hoje em uma variável para comparar com a data das transações.
+        # o saldo atual começa com o saldo inicial da conta. A soma é feita em centavos inteiros (utils/dinheiro.py), sem erro de arredondamento.
+        total = centavos(self.saldo_inicial or 0)
+        hoje = date.today() # adiciona o dia de hoje em uma variável para comparar com a data das transações.
 
         # percorre as transações associadas à conta e atualiza o saldo de acordo com o tipo de transação (receita ou despesa)
         for t in self.transacoes:
             
-            if t.data > hoje: # se a data da transação for maior que a data de hoje, ou seja, se a transação for futura, ela não é considerada no cálculo do saldo atual, pois ainda não ocorreu.
+            data_t = t.data.date() if isinstance(t.data, datetime) else t.data
+            if data_t > hoje: # se a data da transação for maior que a data de hoje, ou seja, se a transação for futura, ela não é considerada no cálculo do saldo atual, pois ainda não ocorreu.
                 continue
 
             if t.ignore: # se a transação estiver marcada para ser ignorada, ela não é considerada no cálculo do saldo.
@@ -153,42 +179,30 @@ class Conta(Base, CRUDMixin):
 
             # verifica o tipo da transação, se for receita, o valor é adicionado ao total.
             if t.tipo == "receita":
-                total += t.valor
+                total += centavos(t.valor)
 
             # verifica o tipo da transação, se for despesa, o valor é subtraído do total.
             elif t.tipo in ["despesa", "transferencia", "investimento"]: # se a transação for uma despesa, transferência ou investimento, o valor é subtraído do total, mas somente se a transação estiver marcada como quitada, ou seja, se a despesa já foi paga. Caso contrário, a despesa não é considerada no cálculo do saldo atual, pois ainda não foi paga.
                 if t.quitada: # se a transação for uma despesa e estiver marcada como quitada, o valor é subtraído do total, caso contrário, a despesa não é considerada no cálculo do saldo atual, pois ainda não foi paga.
-                    total -= t.valor
+                    total -= centavos(t.valor)
 
-        return total
+        return reais(total)
     
     # MÉTODOS ESPECÍFICOS:
-    def verificar_gatilhos(self):
+    def verificar_gatilhos(self, saldo=None):
         """ função para verificar os gatilhos de alerta relacionados ao saldo da conta, como o limite de segurança e o uso do cheque especial. 
         A função percorre as transações da conta, calcula o saldo atual e verifica se o saldo está abaixo do limite de segurança estipulado pelo usuário 
         ou se o cheque especial está sendo usado. Se alguma dessas condições for verdadeira, a função adiciona uma mensagem de alerta à lista de alertas, 
         que pode ser exibida para o usuário. """
         try:
             alertas = [] # lista para armazenar os alertas gerados pela função
-            saldo = self.saldo_atual # calcula o saldo atual da conta usando a propriedade saldo_atual, que leva em consideração o saldo inicial e as transações associadas à conta.
-            
-            # verifica se o saldo está abaixo do limite de segurança estipulado pelo usuário, e se o limite de segurança é maior que 0 para evitar alertas desnecessários 
-            # quando o usuário não estipulou um limite de segurança.
-            
-            limite = self.limite_seguranca or 0
+            if saldo is None: # quem já calculou os saldos em lote (saldo_service.saldos_em_lote) passa o saldo pronto, sem consultar a conta.
+                saldo = self.saldo_atual # calcula o saldo atual da conta usando a propriedade saldo_atual, que leva em consideração o saldo inicial e as transações associadas à conta.
 
-            if limite > 0 and saldo < limite and saldo > 0: 
-                alertas.append(
-                    f"Atenção! O saldo da conta {self.nome_conta} está abaixo do limite estipulado de R${limite:.2f}."
-                    )
-            
-            cheque = self.cheque_especial or 0
+            # as regras dos gatilhos ficam no services/alerta_service.py, que também as avalia a cada escrita e grava na tabela alertas.
+            from services import alerta_service # import local para evitar importação circular (o serviço importa as classes)
 
-            if cheque > 0 and saldo < 0:
-                percentual_uso = (abs(saldo) / cheque)* 100
-                alertas.append(
-                    f"Alerta: Você está usando {percentual_uso:.1f}% do seu cheque especial na conta {self.nome_conta}."
-                )
+            alertas.extend(mensagem for _, mensagem, *_ in alerta_service.gatilhos_da_conta(self, saldo))
 
             return alertas
         
@@ -326,15 +340,61 @@ class Conta_Cartao(Conta):
 #region PROPRIEDADES E MÉTODOS DA CONTA CARTÃO
     @property
     def fatura_atual_cartao(self):
-        # essa property vai ser responsável por passar o valor da fatura atual, calculando o valor acumulado de gastos que ainda não foram quitados
-        
-        return sum(t.valor for t in self.transacoes_pendentes)
+        # essa property vai ser responsável por passar o valor da fatura atual: o que ainda não foi quitado no ciclo em andamento
+        # (ver services/fatura_service.py). Compras de ciclos anteriores e parcelas de ciclos futuros ficam de fora.
+        # Cartões sem dias de fechamento e vencimento cadastrados têm um ciclo só, então a fatura é todo o valor pendente.
+        from services import fatura_service # import local para evitar importação circular (o serviço importa as classes)
+
+        faturas = fatura_service.distribuir_em_faturas(self, self._lancamentos_pendentes())
+        return faturas.get(fatura_service.ciclo_atual(self), [0.0, 0.0])[1]
+
+    def _lancamentos_pendentes(self):
+        # transações pendentes no formato de fatura_service.distribuir_em_faturas
+        return [(t.data, t.valor, t.quitada, t.tipo_registro, t.quantidade) for t in self.transacoes_pendentes if not t.ignore]
     
     @property
     def saldo_disponivel_cartao(self):
         # Propriedade para calcular o saldo disponível do cartão, subtraindo o valor da fatura atual do limite do cartão.
         # O resultado é o saldo disponível do cartão, que pode ser usado para exibir ao usuário ou para outras funcionalidades do sistema.
         
-        return self.limite - self.fatura_atual_cartao
+        # Todo o valor pendente compromete o limite, inclusive as faturas fechadas e as parcelas futuras.
+
+        return reais(centavos(self.limite or 0) - sum(centavos(valor) for _, valor, *_ in self._lancamentos_pendentes()))
+
+#endregion
+
+#region MANUTENÇÃO DO SALDO MATERIALIZADO
+# O saldo materializado acompanha toda escrita de transações feita pelo ORM (transaction_service, CRUDMixin, scripts), na mesma
+# transação do banco, como os agregados mensais (classes/agregados.py). Escritas em massa pelo Core (importador, remoção de contas)
+# atualizam ou reconstroem o saldo diretamente (saldo_service.aplicar_delta_no_saldo / comando_reconstrucao).
+
+CAMPOS_SALDO = ("id_conta", "data", "tipo", "valor", "quitada", "ignore")
+
+def _valores_saldo(alvo, anteriores=False):
+    # campos da transação que afetam o saldo; com anteriores=True, os valores de antes das alterações pendentes da sessão
+    valores = {}
+    for campo in CAMPOS_SALDO:
+        historico = get_history(alvo, campo) if anteriores else None
+        valores[campo] = historico.deleted[0] if historico and historico.deleted else getattr(alvo, campo)
+    return SimpleNamespace(**valores)
+
+@event.listens_for(Transacao, "after_insert")
+def _saldo_insercao(mapper, conexao, alvo):
+    from services import saldo_service # import local para evitar importação circular (o serviço importa as classes)
+    saldo_service.aplicar_no_saldo(conexao, alvo)
+
+@event.listens_for(Transacao, "after_delete")
+def _saldo_remocao(mapper, conexao, alvo):
+    from services import saldo_service
+    saldo_service.aplicar_no_saldo(conexao, _valores_saldo(alvo, anteriores=True), sinal=-1)
+
+@event.listens_for(Transacao, "after_update")
+def _saldo_alteracao(mapper, conexao, alvo):
+    if not any(get_history(alvo, campo).has_changes() for campo in CAMPOS_SALDO):
+        return # ex.: mudança de descrição ou categoria, que não afeta o saldo
+
+    from services import saldo_service
+    saldo_service.aplicar_no_saldo(conexao, _valores_saldo(alvo, anteriores=True), sinal=-1)
+    saldo_service.aplicar_no_saldo(conexao, alvo)
 
 #endregion
@@ -1,7 +1,9 @@
 from database.config  import Base, SessionLocal 
 from database.mixin import CRUDMixin
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, event
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import get_history
+from utils.cache import incrementar_versao_familia
 
 """############################### FAMILIAS ########################################################"""
 class Familia(Base, CRUDMixin):
@@ -26,3 +28,38 @@ class Familia(Base, CRUDMixin):
         self.nome_familia = nome_familia
 #endregion
     
+
+#region VERSÃO DA COMPOSIÇÃO DA FAMÍLIA
+# As visões da família (data_provider) guardam em cache quem são os membros e quais contas, metas e ativos são compartilhados.
+# Toda escrita do ORM em uma sessão de SessionLocal que cria, remove ou muda o id_familia de um objeto (usuário, conta, meta, ativo,
+# a própria família) anota as famílias afetadas, a de antes e a de depois (after_flush); depois do commit, a versão de cada uma
+# é incrementada (utils/cache.py) e a composição volta a ser lida do banco.
+
+def _familias_afetadas(objeto, novo):
+    if "id_familia" not in objeto.__mapper__.attrs:
+        return set()
+    historico = get_history(objeto, "id_familia")
+    if not novo and not historico.has_changes():
+        return set()
+    return {id_familia for id_familia in (*historico.added, *historico.deleted, *historico.unchanged, objeto.id_familia) if id_familia}
+
+@event.listens_for(SessionLocal, "after_flush")
+def _anotar_familias(sessao, contexto_flush):
+    anotadas = sessao.info.setdefault("familias_alteradas", set())
+    for objeto in sessao.new:
+        anotadas.update(_familias_afetadas(objeto, novo=True))
+    for objeto in sessao.dirty:
+        anotadas.update(_familias_afetadas(objeto, novo=False))
+    for objeto in sessao.deleted:
+        anotadas.update(_familias_afetadas(objeto, novo=True))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _incrementar_versoes_familias(sessao):
+    for id_familia in sessao.info.pop("familias_alteradas", ()):
+        incrementar_versao_familia(id_familia)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_familias(sessao):
+    sessao.info.pop("familias_alteradas", None)
+
+#endregion
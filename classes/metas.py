@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, Float, String, Date, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, CheckConstraint
 from sqlalchemy.orm import relationship
 from database.config import Base 
 from database.mixin import CRUDMixin
 from datetime import date
+from utils.dinheiro import Dinheiro, somar
 
 """############################### METAS ########################################################"""
 class Meta(Base, CRUDMixin):
@@ -14,14 +15,14 @@ class Meta(Base, CRUDMixin):
     # CAMPOS DA TABELA:
     id_meta = Column(Integer, primary_key=True, autoincrement=True)
     nome_meta = Column(String, nullable=False)
-    valor_alvo = Column(Float, nullable=False)
-    aporte_inicial = Column(Float, nullable=False, default=0.0)
+    valor_alvo = Column(Dinheiro, nullable=False)
+    aporte_inicial = Column(Dinheiro, nullable=False, default=0.0)
     data_inicio = Column(Date, default=date.today)
     prazo_final = Column(Date)
 
     # CHAVES ESTRANGEIRAS:
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"))
-    id_familia = Column(Integer, ForeignKey("familias.id_familia"))
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), index=True)
+    id_familia = Column(Integer, ForeignKey("familias.id_familia"), index=True)
 
     # RELACIONAMENTOS:
     transacoes = relationship("Transacao", back_populates="meta") # relacionamento com a tabela de transações.  # CONFERIDO
@@ -74,10 +75,10 @@ class Meta(Base, CRUDMixin):
         Considera o aporte inicial + depósitos (receitas/transferências) 
         - retiradas (despesas).
         """
-        entradas = sum(t.valor for t in self.transacoes if t.tipo in ["receita", "transferencia", "dividendo"])
-        saidas = sum(t.valor for t in self.transacoes if t.tipo == "despesa")
+        entradas = somar(t.valor for t in self.transacoes if t.tipo in ["receita", "transferencia", "dividendo"])
+        saidas = somar(t.valor for t in self.transacoes if t.tipo == "despesa")
         
-        return self.aporte_inicial + (entradas - saidas)
+        return somar([self.aporte_inicial, entradas, -saidas]) # somas em centavos (utils/dinheiro.py), sem erro de arredondamento
 
     @property
     def progresso(self):
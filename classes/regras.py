@@ -1,7 +1,11 @@
 from database.config import Base, SessionLocal
-from database.mixin import CRUDMixin
+from database.mixin import CRUDMixin, executar_apos_commit
 from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
+from utils.automato import AutomatoPalavrasChave
+
+# cache em memória dos autômatos de palavras-chave, um por usuário. É reconstruído apenas quando uma regra do usuário é salva ou deletada.
+_automatos_por_usuario = {}
 
 """############################### REGRAS TAG ########################################################"""
 class RegraTag(Base, CRUDMixin):
@@ -16,7 +20,7 @@ class RegraTag(Base, CRUDMixin):
     palavra_chave = Column(String, nullable=False) # palavra ou expressão que, quando encontrada no texto da transação, aciona a regra. Ex: 'uber', 'mercado', 'netflix', etc. O unique=True garante que não haja regras duplicadas para a mesma palavra-chave.
     
     # CHAVES ESTRANGEIRAS
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario")) # id do usuário ao qual a regra pertence, para garantir que cada usuário tenha suas próprias regras personalizadas.
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), index=True) # id do usuário ao qual a regra pertence, para garantir que cada usuário tenha suas próprias regras personalizadas.
     id_categoria =  Column(Integer, ForeignKey("categorias.id_categoria"))
     id_subcategoria = Column(Integer, ForeignKey("subcategorias.id_subcategoria"))
     
@@ -48,22 +52,75 @@ class RegraTag(Base, CRUDMixin):
 
     @classmethod
     def buscar_regra(cls, texto_transacao, id_usuario):
-        """Método de Classe responsável conferir nas regras cadastradas se o texto de entrada já existe"""
+        """Método de Classe responsável conferir nas regras cadastradas se o texto de entrada já existe.
+        Usa o autômato compilado do usuário, então o custo não depende da quantidade de regras. Quando mais de uma palavra-chave
+        aparece no texto, vence a mais longa (mais específica) e, no empate, a regra mais antiga (menor id_regra)."""
+
+        if not texto_transacao:
+            return None
 
-        db =  SessionLocal()
+        return cls.obter_automato(id_usuario).buscar(texto_transacao.upper())
 
-        try:
-            # busca pelas regras do usuário.
-            regras = db.query(cls).filter(cls.id_usuario == id_usuario).all()
+    @classmethod
+    def classificar_lote(cls, textos, id_usuario):
+        """Classifica uma lista de descrições de uma só vez, retornando a regra encontrada (ou None) para cada texto, na mesma ordem.
+        Textos repetidos são avaliados apenas uma vez."""
 
-            # agora verifica se alguma palavra chave está contida no texto da transação.
-            for regra in regras:
-                if regra.palavra_chave in texto_transacao.upper():
-                    return regra # retorna a regra encontrada 
+        automato = cls.obter_automato(id_usuario)
+        resultados = {}
 
-            return None # nenhuma regra encontrada
-        
-        finally:
-            db.close()
+        for texto in set(textos):
+            resultados[texto] = automato.buscar(texto.upper()) if texto else None
+
+        return [resultados[texto] for texto in textos]
+
+    @classmethod
+    def obter_automato(cls, id_usuario):
+        """Retorna o autômato de palavras-chave do usuário, montando-o a partir do banco se ainda não estiver em cache."""
+
+        automato = _automatos_por_usuario.get(id_usuario)
+
+        if automato is None:
+            db = SessionLocal()
+            try:
+                # busca pelas regras do usuário (os objetos continuam acessíveis depois de fechar a sessão, pois expire_on_commit=False).
+                regras = db.query(cls).filter(cls.id_usuario == id_usuario).all()
+            finally:
+                db.close()
+
+            automato = AutomatoPalavrasChave(
+                (regra.palavra_chave, regra, (len(regra.palavra_chave), -regra.id_regra)) for regra in regras
+            )
+            _automatos_por_usuario[id_usuario] = automato
+
+        return automato
+
+    @staticmethod
+    def invalidar_cache(id_usuario=None):
+        """Descarta o autômato em cache do usuário (ou de todos os usuários, se id_usuario for None)."""
+        if id_usuario is None:
+            _automatos_por_usuario.clear()
+        else:
+            _automatos_por_usuario.pop(id_usuario, None)
+
+    # as operações de escrita invalidam o cache do usuário, para que a próxima busca reconstrua o autômato.
+    # dentro de uma unidade de trabalho, a invalidação só acontece depois do commit, quando a regra já está visível no banco.
+    def salvar(self):
+        resultado = super().salvar()
+        id_usuario = self.id_usuario
+        executar_apos_commit(lambda: self.invalidar_cache(id_usuario))
+        return resultado
+
+    def modificar(self):
+        resultado = super().modificar()
+        id_usuario = self.id_usuario
+        executar_apos_commit(lambda: self.invalidar_cache(id_usuario))
+        return resultado
+
+    def deletar(self):
+        resultado = super().deletar()
+        id_usuario = self.id_usuario
+        executar_apos_commit(lambda: self.invalidar_cache(id_usuario))
+        return resultado
 
 #endregion
\ No newline at end of file
@@ -2,9 +2,11 @@ from datetime import datetime, date
 import enum
 from typing import List, Optional
 from database.config import Base, SessionLocal
-from sqlalchemy import Column, Integer, Float, String, DateTime, Date, ForeignKey, Boolean, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Boolean, Enum, Index, event
+from sqlalchemy.orm import relationship, validates
 from database.mixin import CRUDMixin
+from utils.tools import normalizar_descricao, canonizar_descricao
+from utils.dinheiro import Dinheiro, centavos
 import hashlib
 
 #region ENUMS
@@ -37,14 +39,15 @@ class Transacao(Base, CRUDMixin):
 
     # CAMPOS DA TABELA:
     id_transacao = Column(Integer, primary_key=True, autoincrement=True) # id única da transação, o primary key impede que hajam mais de uma chave igual e o autoincrement adiciona 1 a cada nova transação
-    valor = Column(Float, nullable=False) # valor da transação
+    valor = Column(Dinheiro, nullable=False) # valor da transação, em reais no Python e em centavos inteiros no banco (utils/dinheiro.py)
     tipo = Column(Enum(TipoTransacao)) # tipo da transação, se é Receita , Despesa , Transferência (como para mesadas ou movimentação entre contas, por exemplo) ou Investimento
     tag = Column(String) # tags para organizar os gráficos
     data = Column(DateTime, default=datetime.now) # data e hora da transação, o default define que, caso o usuário não informe uma data, a data atual será usada
     descricao = Column(String) # Campo curto para o usuário adicionar algum comentário sobre a transação
+    descricao_normalizada = Column(String) # descrição sem acentos, números e pontuação (utils.tools.normalizar_descricao), mantida automaticamente. Agrupa os lançamentos do mesmo estabelecimento na detecção de recorrências.
     local = Column(String) # Local onde a transação ocorreu. Ex.: Mercado X, Padaria Y, etc
     essencial = Column(Boolean, default=False) # se a transação é essencial ou não. Será usada para que o usuário possa filtrar os gráficos e cálculos para mostrar apenas as transações essenciais, por exemplo, para ter uma noção melhor de quanto ele gasta com coisas essenciais e quanto gasta com coisas supérfluas.
-    quantidade = Column(Integer, nullable=True) # quantidade de itens relacionados à transação. Será usada primariamente para transações de compra de ativos como ações em que a quantidade é relevante para calcular o valor investido total.
+    quantidade = Column(Integer, nullable=True) # quantidade de itens relacionados à transação. Será usada primariamente para transações de compra de ativos como ações em que a quantidade é relevante para calcular o valor investido total. Nas compras parceladas (tipo_registro PARCELADO) é o número de parcelas, usado para dividir a compra pelas faturas do cartão (services/fatura_service.py).
     tipo_registro = Column(Enum(TipoRegistro), default=TipoRegistro.COMUM) # identificador de transação comum, recorrente, parcelada ou extorno.
     quitada = Column(Boolean, default=True) # se a transação já foi paga ou não. Será usada para as transações recorrentes, para que o usuário possa marcar como paga a transação do mês atual, por exemplo.
     ignore = Column(Boolean, default=False) # se a transação deve ser ignorada nos gráficos e cálculos. Será usada para qualquer transação, para que o usuário possa marcar como ignorada alguma movimentação, como quando o usuário tem alguma despesa de um familiar em sua conta e ela não é necessariamente uma despesa do usuário.
@@ -56,6 +59,8 @@ class Transacao(Base, CRUDMixin):
     data_termino = Column(Date, nullable=True) # data do vencimento da última cobrança, para as transações recorrentes. Pode ser nula, para as recorrências que não têm data de término definida, como uma mensalidade de academia, por exemplo.
     moeda = Column(String, default="BRL") # moeda da transação, para o caso de o usuário querer usar outra moeda além do Real, como o Dólar, por exemplo. O default é BRL, mas o usuário pode escolher outra moeda, como USD, EUR, etc.
     hash_unico = Column(String, unique=True) # hash único para cada transação, gerado a partir de suas informações, para evitar que haja transações duplicadas, principalmente a partir da leitura de SMS, onde pode haver o risco de ler o mesmo SMS mais de uma vez e criar transações duplicadas. O hash pode ser gerado a partir do valor, data, descrição e local da transação, por exemplo, para garantir que cada transação tenha um hash único que a identifique de forma exclusiva.
+    atualizado_em = Column(DateTime, default=datetime.now, onupdate=datetime.now) # momento da última gravação da linha (inserção ou alteração, pelo ORM ou pelo Core). É a marca d'água da exportação incremental (Scripts_aux/exportar_parquet.py); nulo nas transações anteriores à coluna que não foram alteradas desde então.
+    impressao_digital = Column(String) # impressão digital canônica do lançamento (conta, valor em centavos, data e descrição normalizada), mantida automaticamente pelo ORM e gravada pelo importador. Não é única, porque duas compras iguais podem existir de verdade; é a chave da verificação de duplicatas, com uma consulta no índice ix_transacoes_impressao_digital.
     status_conferencia = Column(Enum(StatusConferencia), default=StatusConferencia.PENDENTE) # status da conferência da transação, para que o usuário possa marcar se a transação já foi conferida, se está pendente de conferência ou se há alguma discrepância na conferência, como quando o valor da transação no extrato do banco é diferente do valor registrado na transação, por exemplo. 
 
     # CHAVES ESTRANGEIRAS:
@@ -73,6 +78,22 @@ class Transacao(Base, CRUDMixin):
     usuario = relationship("Usuario", back_populates="transacoes") # relacionamento com a tabela de usuários.                   # CONFERIDO
     ativo = relationship("Ativo", back_populates="transacoes") # relacionamento com a tabela de ativos.                         #   
     meta = relationship("Meta", back_populates="transacoes") # relacionamento com a tabela de metas.                            # CONFERIDO
+
+    # ÍNDICES:
+    # índices compostos para os caminhos mais usados. As colunas extras no final permitem que o SQLite responda as consultas só com o índice (covering index).
+    __table_args__ = (
+        Index("ix_transacoes_usuario_tipo_data", "id_usuario", "tipo", "data", "id_categoria", "valor"), # resumos por período e tipo (data_provider)
+        Index("ix_transacoes_usuario_data", "id_usuario", "data", "valor", "descricao"), # últimas movimentações e detecção de duplicatas na importação
+        Index("ix_transacoes_usuario_quitada_data", "id_usuario", "quitada", "data"), # agendamentos (transações futuras não quitadas)
+        Index("ix_transacoes_conta_data", "id_conta", "data"), # saldo da conta e transações por conta
+        Index("ix_transacoes_conta_pendentes", "id_conta", "quitada", "tipo", "valor"), # transações pendentes / fatura do cartão
+        Index("ix_transacoes_usuario_registro_data", "id_usuario", "tipo_registro", "data"), # recorrências do usuário (expansão das ocorrências)
+        Index("ix_transacoes_usuario_descricao_data", "id_usuario", "descricao_normalizada", "data", "tipo", "valor", "id_recorrencia"), # histórico de um estabelecimento (detecção de recorrências, só com o índice)
+        Index("ix_transacoes_impressao_digital", "impressao_digital"), # verificação de duplicatas (criar_movimentacao e importador)
+        Index("ix_transacoes_atualizado_em", "atualizado_em", "id_usuario", "data"), # partições alteradas desde a última exportação (só com o índice)
+        Index("ix_transacoes_ativo_tipo", "id_ativo", "tipo", "valor"), # valor investido nos ativos (composição do patrimônio da família, só com o índice)
+        Index("ix_transacoes_meta_tipo", "id_meta", "tipo", "valor"), # valor poupado nas metas (metas da família, só com o índice)
+    )
 #endregion    
     
 #region INIT    
@@ -151,10 +172,18 @@ class Transacao(Base, CRUDMixin):
 
 #region MÉTODOS E ATRIBUTOS DA CLASSE    
 
+    @validates("descricao")
+    def _atualizar_descricao_normalizada(self, chave, descricao):
+        # toda vez que a descrição é definida (no __init__ ou em uma edição), a versão normalizada acompanha
+        self.descricao_normalizada = normalizar_descricao(descricao)
+        return descricao
+
     @property
     def preco_unitario(self):
         # propriedade para calcular o preço unitário dos itens relacionados à transação, dividindo o valor total da transação pela quantidade de itens, caso a quantidade seja fornecida.
         # Essa propriedade é útil para transações de compra de ativos, como ações, em que o preço unitário é relevante para calcular o valor investido total.
+        # Nas compras parceladas, a quantidade é o número de parcelas, então o preço unitário é o valor de cada parcela (sem o ajuste de centavos
+        # que a fatura_service faz na primeira).
         return self.valor / self.quantidade if self.quantidade else None
     
     @classmethod
@@ -167,20 +196,37 @@ class Transacao(Base, CRUDMixin):
             db.close()
 
     @staticmethod
-    def gerar_hash_estatico(valor, data, descricao, local=""):
-        #Gera um hash SHA-256 baseado nos dados da transação para evitar duplicidade.
-        
-        data_str = str(data)
-        local_str = local or ""
-    
-        payload = f"{valor}{data_str}{descricao}{local_str}".encode('utf-8')
-        return hashlib.sha256(payload).hexdigest()
+    def gerar_hash_estatico(valor, data, descricao, local="", id_conta=None):
+        # Gera um hash SHA-256 baseado nos dados da transação, no mesmo formato de criar_hash_unico (usado também pelo importador).
+        # A conta entra no hash para que o mesmo lançamento em contas (ou usuários) diferentes não esbarre na unicidade da coluna.
+        payload = f"{id_conta}-{valor}-{data.strftime('%Y-%m-%d %H:%M:%S')}-{descricao}-{local or ''}"
+        return hashlib.sha256(payload.encode()).hexdigest()
 
     def criar_hash_unico(self):
         # função para criar um hash único para a transação, a partir de suas informações, para evitar que haja transações duplicadas, principalmente a partir da leitura de SMS, 
-        # onde pode haver o risco de ler o mesmo SMS mais de uma vez e criar transações duplicadas. O hash pode ser gerado a partir do valor, data, descrição e local da transação, 
-        # por exemplo, para garantir que cada transação tenha um hash único que a identifique de forma exclusiva.
-        hash_input = f"{self.valor}-{self.data.strftime('%Y-%m-%d %H:%M:%S')}-{self.descricao}-{self.local}"
-        self.hash_unico = hashlib.sha256(hash_input.encode()).hexdigest()
+        # onde pode haver o risco de ler o mesmo SMS mais de uma vez e criar transações duplicadas. O hash é gerado a partir da conta, valor, data, descrição e local da transação 
+        # (gerar_hash_estatico), para garantir que cada transação tenha um hash único que a identifique de forma exclusiva.
+        self.hash_unico = self.gerar_hash_estatico(self.valor, self.data, self.descricao, self.local, self.id_conta)
+
+    @staticmethod
+    def calcular_impressao_digital(id_conta, valor, data, descricao):
+        """ Impressão digital canônica de um lançamento: SHA-256 da conta, do valor em centavos inteiros, da data (até os segundos) e
+        da descrição canônica (utils.tools.canonizar_descricao: sem diferença de maiúsculas, acentos e espaços, mas com os números, que
+        distinguem "PIX 123" de "PIX 456"). Todos os caminhos de escrita usam esta função, então o mesmo
+        lançamento tem a mesma impressão digital venha ele da tela, de uma recorrência ou de um extrato importado (extratos só têm o
+        dia, gravado à meia-noite). Duas compras iguais feitas em horários diferentes continuam distintas."""
+        payload = f"{id_conta}|{centavos(valor)}|{data.strftime('%Y-%m-%d %H:%M:%S')}|{canonizar_descricao(descricao)}"
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def atualizar_impressao_digital(self):
+        self.impressao_digital = self.calcular_impressao_digital(self.id_conta, self.valor, self.data, self.descricao)
 
 #endregion
+
+# A impressão digital acompanha toda inserção e alteração feita pelo ORM (transaction_service, CRUDMixin, scripts), então basta
+# editar a conta, o valor, a data ou a descrição. Escritas em massa pelo Core (importador) gravam a coluna diretamente.
+@event.listens_for(Transacao, "before_insert")
+@event.listens_for(Transacao, "before_update")
+def _atualizar_impressao_digital(mapper, conexao, alvo):
+    if alvo.data is not None and alvo.valor is not None:
+        alvo.atualizar_impressao_digital()
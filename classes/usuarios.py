@@ -1,12 +1,13 @@
 from argon2 import PasswordHasher
 from database.config  import Base, SessionLocal
-from sqlalchemy import Column, Integer, Float, String, DateTime, Date, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Boolean
 from sqlalchemy.orm import relationship
 from utils.constants import CATEGORIAS_DESPESAS, CATEGORIAS_RECEITA, CATEGORIAS_PATRIMONIO
 from classes.transacoes import TipoTransacao
 from database.mixin import CRUDMixin
 from utils.tools import gerar_cor
 import datetime
+from utils.dinheiro import Dinheiro, somar
 
 """############################### USUÁRIOS ########################################################"""
 class Usuario(Base, CRUDMixin): 
@@ -19,9 +20,9 @@ class Usuario(Base, CRUDMixin):
     nome = Column(String) # nome do usuário
     email = Column(String, unique=True, nullable=False) # email do usuário
     senha_hash = Column(String(255)) # hash da senha do usuário, para garantir a segurança das senhas armazenadas no banco de dados. O campo senha_hash é preenchido com o hash da senha fornecida pelo usuário durante a criação da conta ou atualização da senha, usando a biblioteca bcrypt para gerar o hash de forma segura. O campo senha_plana não é armazenado no banco de dados, ele é usado apenas para receber a senha em formato plano durante a criação ou atualização da senha, e depois é convertido para hash e armazenado no campo senha_hash.
-    renda_mensal = Column(Float, nullable=True) # renda mensal do usuário, pode ser nula caso o usuário não queira informar
+    renda_mensal = Column(Dinheiro, nullable=True) # renda mensal do usuário, pode ser nula caso o usuário não queira informar
     nascimento = Column(Date, nullable=True) # data de nascimento do usuário, pode ser nula caso o usuário não queira informar
-    objetivo_reserva = Column(Float, nullable=True) # valor que o usuário estipula como objetivo para sua reserva de emergência, pode ser nulo caso o usuário não queira informar
+    objetivo_reserva = Column(Dinheiro, nullable=True) # valor que o usuário estipula como objetivo para sua reserva de emergência, pode ser nulo caso o usuário não queira informar
     data_criacao =  Column(DateTime, default=datetime.datetime.now, nullable=False) # data de criação do usuário, preenchida automaticamente com a data e hora atual quando o usuário é criado
     preferencia_moeda = Column(String(3),nullable=False, default="BRL") # moeda preferida do usuário, preenchida automaticamente com "BRL" caso o usuário não informe uma preferência
     admin_familia = Column(Boolean, nullable=False, default=False) # campo booleano para indicar se o usuário é admin da família.
@@ -70,7 +71,7 @@ class Usuario(Base, CRUDMixin):
     def saldo_total(self):
         """Soma o saldo de todas as contas ativas vinculadas ao usuário."""
         # O SQLAlchemy gerencia a busca das contas através do relacionamento
-        return sum(conta.saldo for conta in self.contas if conta.ativa)
+        return somar(conta.saldo for conta in self.contas if conta.ativa)
 
     def definir_senha(self, senha_plana):
         # função que irá gerar o hash a partir da senha digitada pelo usuário, utilizando o algoritmo argon2, e atualizar o campo senha_hash do usuário com o novo hash gerado. 
@@ -108,7 +109,8 @@ class Usuario(Base, CRUDMixin):
             raise e
         
     def inicializar_novo_usuario(self, session):
-        """ Essa função adicionará categorias e subcategorias padrão ao usuário assim que um novo registro for criado."""
+        """ Essa função adicionará categorias e subcategorias padrão ao usuário assim que um novo registro for criado.
+        As categorias são adicionadas na sessão recebida, sem commit."""
 
         # importamos as Classes Categoria e Subcategoria aqui para evitar erro de importação circular.
         from classes.categorias import Categoria, Subcategoria 
@@ -141,4 +143,5 @@ class Usuario(Base, CRUDMixin):
                     )
                     session.add(nova_sub)
         
-        session.commit()
\ No newline at end of file
+        # o commit fica com quem chamou, para que o usuário e as categorias possam ser gravados na mesma transação.
+        session.flush()
\ No newline at end of file
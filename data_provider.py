@@ -1,8 +1,98 @@
-import pandas as pd
-from database.config import SessionLocal
-from classes import Transacao, Categoria, Conta
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from dataclasses import dataclass, asdict
+from sqlalchemy import func, or_
+from database.config import SessionLocal, SessionLeitura
+from classes import Transacao, Categoria, Conta, Usuario, Ativo, Meta
+from classes.transacoes import TipoTransacao
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+from services import saldo_service, agregado_service, recorrencia_service, previsao_service, historico_service, fatura_service, alerta_service, orcamento_service
+from utils.cache import em_cache, cache_consultas, versao_familia
+from utils.dinheiro import somar, centavos, reais
+
+#region SNAPSHOT DO PAINEL
+# Estruturas imutáveis devolvidas por carregar_painel. Elas só guardam valores prontos (nada de objetos do SQLAlchemy),
+# então o app pode renderizar o painel inteiro sem voltar ao banco.
+
+@dataclass(frozen=True)
+class ContaPainel:
+    id_conta: int
+    nome: str
+    subtipo: Optional[str]
+    instituicao: Optional[str]
+    saldo_atual: float
+    limite: Optional[float]
+    ignorar: bool
+
+@dataclass(frozen=True)
+class ComposicaoPatrimonio:
+    subtipo: Optional[str]
+    saldo: float
+
+@dataclass(frozen=True)
+class ResumoMensal:
+    despesas: float
+    receitas: float
+    despesas_previstas: float = 0.0 # o que ainda está agendado até o fim do mês (transações futuras e ocorrências das recorrências)
+    receitas_previstas: float = 0.0
+
+@dataclass(frozen=True)
+class DespesaCategoria:
+    categoria: str
+    cor_hex: Optional[str]
+    icone: Optional[str]
+    valor: float
+
+@dataclass(frozen=True)
+class Movimentacao:
+    valor: float
+    data: datetime
+    descricao: Optional[str]
+    cor_hex: Optional[str]
+    categoria: str
+
+@dataclass(frozen=True)
+class Agendamento:
+    valor: float
+    data: datetime
+    descricao: Optional[str]
+    categoria: str
+    cor_hex: Optional[str]
+
+@dataclass(frozen=True)
+class SaldoProjetado:
+    id_conta: int
+    nome: str
+    saldo_atual: float
+    saldo_projetado: float
+
+@dataclass(frozen=True)
+class AlertaPendente:
+    id_alerta: int
+    tipo: str
+    mensagem: str
+    valor: Optional[float]        # valor em reais que disparou o alerta (saldo, valor usado ou total gasto)
+    percentual: Optional[float]   # percentual de uso, nos alertas que têm um
+    criado_em: datetime
+    id_conta: Optional[int]
+    id_categoria: Optional[int]
+
+@dataclass(frozen=True)
+class Painel:
+    id_usuario: int
+    periodo: str
+    inicio: Optional[datetime]
+    fim: Optional[datetime]
+    saldo_total: float
+    contas: Tuple[ContaPainel, ...]
+    composicao_patrimonio: Tuple[ComposicaoPatrimonio, ...]
+    resumo_mensal: ResumoMensal
+    despesas_por_categoria: Tuple[DespesaCategoria, ...]
+    ultimas_movimentacoes: Tuple[Movimentacao, ...]
+    agendamentos: Tuple[Agendamento, ...]
+    alertas: Tuple[str, ...]
+    gerado_em: datetime
+
+#endregion
 
 def calcular_intervalo(periodo, data_inicio_custom=None, data_fim_custom=None):
     """Retorna o intervalo escolhido pelo usuário."""
@@ -41,70 +131,298 @@ def calcular_intervalo(periodo, data_inicio_custom=None, data_fim_custom=None):
     
     return None, None
 
+
+# horizonte (em dias) das ocorrências de recorrências mostradas nos agendamentos e da projeção de saldos
+JANELA_AGENDAMENTOS_DIAS = 30
+
+#region CONSULTAS COMPARTILHADAS
+# Cada consulta do painel existe uma única vez, recebendo a sessão já aberta. As funções públicas abaixo abrem a própria sessão
+# e chamam estas funções; carregar_painel chama todas elas na mesma sessão, reaproveitando as contas carregadas uma só vez.
+
+def _carregar_contas(db, id_usuario):
+    # busca as contas do usuário e o saldo de todas elas com uma única consulta em lote (2 SELECT, sem escrita): saldos_em_lote
+    # já leva até hoje os saldos materializados de ontem. Retorna (contas, {id_conta: saldo}): os saldos nunca são lidos conta a conta.
+    contas = db.query(Conta).filter(Conta.id_usuario == id_usuario).all()
+    return contas, saldo_service.saldos_em_lote(db, [c.id_conta for c in contas])
+
+def _proximo_vencimento(dia, hoje):
+    # transforma o dia de vencimento (1 a 31) na próxima data em que ele ocorre, para ordenar os agendamentos por data
+    if not dia:
+        return hoje
+
+    data_venc = None
+    ano, mes = hoje.year, hoje.month
+    while data_venc is None:
+        try:
+            data_venc = datetime(ano, mes, dia)
+        except ValueError: # dia que não existe no mês (ex.: 31 em abril): usamos o último dia do mês
+            data_venc = datetime(ano, mes, 1) + timedelta(days=31)
+            data_venc = data_venc.replace(day=1) - timedelta(days=1)
+
+        if data_venc.date() < hoje.date():
+            data_venc = None
+            ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+    return data_venc
+
+def _saldo_total(contas, saldos):
+    # soma o saldo atual das contas que não estão marcadas para serem ignoradas
+    return somar(saldos[c.id_conta] for c in contas if not c.ignorar_patrimonio)
+
+def _detalhamento_contas(contas, saldos):
+    return [ContaPainel(
+        id_conta=conta.id_conta,
+        nome=conta.nome_conta,
+        subtipo=conta.subtipo_conta.value if conta.subtipo_conta else None,
+        instituicao=conta.tipo_instituicao.value if conta.tipo_instituicao else None,
+        saldo_atual=saldos[conta.id_conta],
+        limite=conta.limite,
+        ignorar=conta.ignorar_patrimonio
+    ) for conta in contas]
+
+def _composicao_patrimonio(contas, saldos):
+    # agrupa os saldos por subtipo de conta, mantendo a ordem alfabética que o groupby do pandas produzia
+    totais = {}
+    for c in contas:
+        if not c.ignorar_patrimonio:
+            subtipo = c.subtipo_conta.value if c.subtipo_conta else None
+            totais[subtipo] = somar([totais.get(subtipo, 0.0), saldos[c.id_conta]])
+
+    return [ComposicaoPatrimonio(subtipo=s, saldo=totais[s]) for s in sorted(totais, key=lambda s: (s is None, s or ""))]
+
+def _fim_do_mes(hoje):
+    return (hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=32)).replace(day=1) - timedelta(microseconds=1)
+
+def _totais_do_mes(db, id_usuario, hoje, recorrencias, agrupar_por=("tipo",)):
+    # soma as despesas e receitas do mês corrente agrupadas por tipo (os dias do mês corrente vêm das transações, via somar_periodo).
+    # As previstas são o restante do mês: transações já gravadas com data futura mais as ocorrências geradas das recorrências.
+    # Retorna ({chave: realizado}, {chave: previsto}), com as chaves na ordem de agrupar_por (ex.: (tipo, id_usuario) na família).
+    inicio, fim = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0), hoje
+    fim_do_mes = _fim_do_mes(hoje)
+    tipos = [TipoTransacao.DESPESA, TipoTransacao.RECEITA]
+
+    realizadas = {chave: total for chave, (total, _) in agregado_service.somar_periodo(
+        db, id_usuario, inicio, fim, agrupar_por=agrupar_por, tipos=tipos).items()}
+    previstas = {chave: total for chave, (total, _) in agregado_service.somar_periodo(
+        db, id_usuario, hoje + timedelta(microseconds=1), fim_do_mes, agrupar_por=agrupar_por, tipos=tipos).items()}
+
+    # as ocorrências são somadas em centavos inteiros, como as demais somas de valores, e voltam para reais no fim
+    previstas_centavos = {chave: centavos(total) for chave, total in previstas.items()}
+    for ocorrencia in recorrencia_service.ocorrencias_no_periodo(recorrencias, hoje, fim_do_mes):
+        if ocorrencia.recorrencia.tipo in tipos:
+            chave = tuple(getattr(ocorrencia.recorrencia, coluna) for coluna in agrupar_por)
+            previstas_centavos[chave] = previstas_centavos.get(chave, 0) + centavos(ocorrencia.recorrencia.valor or 0)
+
+    return realizadas, {chave: reais(total) for chave, total in previstas_centavos.items()}
+
+def _resumo_mensal(db, id_usuario, hoje, recorrencias):
+    realizadas, previstas = _totais_do_mes(db, id_usuario, hoje, recorrencias)
+    return ResumoMensal(despesas=realizadas.get((TipoTransacao.DESPESA,), 0.0), receitas=realizadas.get((TipoTransacao.RECEITA,), 0.0),
+                        despesas_previstas=previstas.get((TipoTransacao.DESPESA,), 0.0), receitas_previstas=previstas.get((TipoTransacao.RECEITA,), 0.0))
+
+def _categorias_por_id(db, ids_categoria, *filtros):
+    # nome, cor e ícone das categorias pedidas, em uma única consulta pela chave primária
+    if not ids_categoria:
+        return {}
+    linhas = db.query(Categoria.id_categoria, Categoria.nome, Categoria.cor_hex, Categoria.icone)\
+        .filter(Categoria.id_categoria.in_(ids_categoria), *filtros).all()
+    return {id_cat: (nome, cor, icone) for id_cat, nome, cor, icone in linhas}
+
+def _despesas_por_categoria(db, id_usuario, inicio, fim, categoria_especifica=None):
+    # a soma por categoria vem dos agregados mensais (mais as bordas do período lidas das transações), então o custo
+    # não cresce com o tamanho do histórico; só o agrupamento por nome e o corte nas 6 maiores são feitos aqui.
+    totais = agregado_service.somar_periodo(db, id_usuario, inicio, fim, agrupar_por=("id_categoria",), tipos=[TipoTransacao.DESPESA])
+
+    # filtro para caso haja alguma categoria específica:
+    filtros = [Categoria.nome == categoria_especifica] if categoria_especifica else []
+    categorias = _categorias_por_id(db, [id_cat for (id_cat,) in totais if id_cat], *filtros)
+
+    # agrupamos os valores por categoria (nome, cor e ícone) para ter um valor único por categoria no gráfico
+    valores = {}
+    for (id_cat,), (total, _) in totais.items():
+        if id_cat in categorias:
+            valores[categorias[id_cat]] = somar([valores.get(categorias[id_cat], 0.0), total])
+
+    maiores = sorted(valores.items(), key=lambda item: item[1], reverse=True)[:6]
+    return [DespesaCategoria(categoria=nome, cor_hex=cor, icone=icone, valor=valor) for (nome, cor, icone), valor in maiores]
+
+def _ultimas_movimentacoes(db, id_usuario):
+    # pegamos os dados valor, descrição, data da tabela transação e os dados cor hex e nome da tabela categoria e os juntamos usando o id_categoria como referencial
+    query = db.query(Transacao.valor, Transacao.data, Transacao.descricao, Categoria.cor_hex, Categoria.nome).join(Categoria, Transacao.id_categoria == Categoria.id_categoria)
+
+    # aí filtramos pelo usuário:
+    query = query.filter(Transacao.id_usuario == id_usuario)
+
+    # pegamos as 08 últimas entradas já no banco (o índice por usuário e data é lido de trás para frente e para na oitava linha)
+    query = query.order_by(Transacao.data.desc()).limit(8)
+
+    # a descrição é limitada a 20 caracteres para não quebrar o layout da tabela
+    return [Movimentacao(valor=valor, data=data_t, descricao=descricao[:20] if descricao else descricao, cor_hex=cor, categoria=nome)
+            for valor, data_t, descricao, cor, nome in query.all()]
+
+def _agendamentos(db, id_usuario, contas, saldos, hoje, recorrencias):
+    # transações futuras e ainda não quitadas do usuário, as próximas ocorrências das recorrências (geradas, não gravadas)
+    # e os eventos automáticos das contas (fatura do cartão e uso do cheque especial)
+    agendados = [Agendamento(valor=valor, data=data_t, descricao=descricao, categoria=categoria, cor_hex=cor)
+                 for valor, data_t, descricao, categoria, cor in db.query(
+                     Transacao.valor,
+                     Transacao.data,
+                     Transacao.descricao,
+                     Categoria.nome,
+                     Categoria.cor_hex
+                     ).join(Categoria).filter(Transacao.id_usuario == id_usuario, # filtramos a busca por usuário, se ocorre hoje ou no futuro e se não foi quitada.
+                                              Transacao.data >= hoje,
+                                              Transacao.quitada == False
+                                              ).all()]
+
+    agendados.extend(Agendamento(valor=o.recorrencia.valor, data=o.data, descricao=o.recorrencia.descricao,
+                                 categoria=o.recorrencia.categoria or "Recorrente", cor_hex=o.recorrencia.cor_hex)
+                     for o in recorrencia_service.ocorrencias_no_periodo(recorrencias, hoje, hoje + timedelta(days=JANELA_AGENDAMENTOS_DIAS)))
+
+    # faturas dos cartões (fatura_service, uma consulta para todos): cada fatura com valor pendente que já fechou, venceu ou está
+    # em aberto entra como agendamento no próprio vencimento. As parcelas dos ciclos futuros ainda não viram agendamento.
+    cartoes = [c for c in contas if c.tipo_conta == "cartao" and c.vencimento_cartao]
+    for resumo in fatura_service.resumir_cartoes(db, cartoes, hoje.date(), ciclos_anteriores=0).values():
+        agendados.extend(Agendamento(
+            valor=fatura.pendente,
+            data=datetime.combine(fatura.vencimento, datetime.min.time()),
+            descricao=f"Fatura {resumo.nome}",
+            categoria="Cartão",
+            cor_hex='#FF4B4B' # IMPORTANTE"," VERIFICAR COMO ISSO VAI FICAR NO LAYOUT.
+        ) for fatura in resumo.faturas if fatura.pendente > 0 and fatura.status in ("vencida", "fechada", "aberta"))
+
+    for c in contas:
+        # logica para o cheque especial: o uso é a parte negativa do saldo da conta corrente.
+        uso_cheque_especial = -saldos[c.id_conta] if saldos[c.id_conta] < 0 else 0.0
+        if c.tipo_conta == "corrente" and uso_cheque_especial > 0:
+            agendados.append(Agendamento(
+                valor=uso_cheque_especial,
+                data=_proximo_vencimento(c.vencimento, hoje),
+                descricao=f"Uso do Limite {c.nome_conta}",
+                categoria="Bancário",
+                cor_hex='#FF904B' # IMPORTANTE"," VERIFICAR COMO ISSO VAI FICAR NO LAYOUT.
+            ))
+
+    return sorted(agendados, key=lambda a: a.data)
+
+def _alertas(db, id_usuario):
+    # alertas ativos e não reconhecidos, já avaliados a cada escrita pelo alerta_service: uma única consulta na tabela alertas,
+    # sem recalcular saldos.
+    return [AlertaPendente(id_alerta=a.id_alerta, tipo=a.tipo, mensagem=a.mensagem, valor=a.valor, percentual=a.percentual,
+                           criado_em=a.criado_em, id_conta=a.id_conta, id_categoria=a.id_categoria) for a in alerta_service.consultar_pendentes(db, id_usuario)]
+
+#endregion
+
+# As funções públicas de leitura passam pelo cache versionado (utils/cache.py): enquanto o usuário não gravar nada,
+# um novo carregamento do painel não consulta o banco. Elas usam a sessão somente leitura e nunca escrevem (uma escrita mudaria
+# a versão dos dados e invalidaria o próprio resultado): o que precisa ser gravado antes das leituras fica em consolidar_saldos.
+
+def consolidar_saldos(id_usuario):
+    """ Passo de escrita que o app executa antes das leituras: leva até hoje os saldos materializados que ficaram no dia anterior
+    e reavalia os gatilhos dessas contas (na virada do dia, transações que eram futuras passam a contar sem nenhuma escrita).
+    Fora da virada do dia é um único UPDATE que não altera nenhuma linha."""
+
+    try:
+        return saldo_service.consolidar_saldos(id_usuario)
+
+    except Exception as e:
+        print(f"Erro ao consolidar os saldos: {e}")
+        return {}
+
+@em_cache
+def carregar_painel(id_usuario, periodo="mensal", data_inicio_custom=None, data_fim_custom=None):
+    """ Monta, em uma única sessão, tudo o que o painel precisa: saldos, contas, composição do patrimônio, resumo do mês,
+    despesas por categoria do período, últimas movimentações, agendamentos e alertas.
+    As contas são carregadas uma só vez e o número de consultas é fixo (não depende da quantidade de contas ou de transações).
+    Retorna um Painel imutável, que pode ser renderizado sem acessar o banco."""
+
+    db = SessionLeitura()
+    hoje = datetime.now()
+
+    try:
+        inicio, fim = calcular_intervalo(periodo, data_inicio_custom, data_fim_custom)
+        contas, saldos = _carregar_contas(db, id_usuario)
+        recorrencias = recorrencia_service.carregar_recorrencias(db, id_usuario)
+        detalhamento = _detalhamento_contas(contas, saldos)
+
+        return Painel(
+            id_usuario=id_usuario,
+            periodo=periodo,
+            inicio=inicio,
+            fim=fim,
+            saldo_total=_saldo_total(contas, saldos),
+            contas=tuple(detalhamento),
+            composicao_patrimonio=tuple(_composicao_patrimonio(contas, saldos)),
+            resumo_mensal=_resumo_mensal(db, id_usuario, hoje, recorrencias),
+            despesas_por_categoria=tuple(_despesas_por_categoria(db, id_usuario, inicio, fim)),
+            ultimas_movimentacoes=tuple(_ultimas_movimentacoes(db, id_usuario)),
+            agendamentos=tuple(_agendamentos(db, id_usuario, contas, saldos, hoje, recorrencias)),
+            alertas=tuple(a.mensagem for a in _alertas(db, id_usuario)),
+            gerado_em=hoje
+        )
+
+    finally:
+        db.close()
+
+@em_cache
 def recuperar_despesas(id_usuario, periodo = "mensal", categoria_especifica=None, data_inicio_custom=None, data_fim_custom=None):
     # essa função será responsável por retornar as despesas do usuário por período (chamando a função calcular_intervalo) e categorias.
-    
+
     # estabelece concexão com o DB
-    db = SessionLocal()
-    
+    db = SessionLeitura()
+
     try:
         # pegando o período da consulta:
         inicio, fim = calcular_intervalo(periodo, data_inicio_custom, data_fim_custom)
 
-        # construindo a query principal:
-        query = db.query(Transacao.valor, Categoria.nome.label("Categoria"), Categoria.cor_hex, Categoria.icone).join(Categoria, Transacao.id_categoria == Categoria.id_categoria)  
+        # retornamos uma lista de dicionários, no mesmo formato usado pelo gráfico
+        return [{"Categoria": d.categoria, "cor_hex": d.cor_hex, "icone": d.icone, "valor": d.valor}
+                for d in _despesas_por_categoria(db, id_usuario, inicio, fim, categoria_especifica)]
 
-        # filtro de usuário:
-        query = query.filter(Transacao.id_usuario == id_usuario)
+    except Exception as e:
+        print (f"Erro ao buscar as despesas: {e}")
+        return []
 
-        # filtro de período:
-        if inicio and fim:
-            query = query.filter(Transacao.data.between(inicio,fim))
+    finally:
+        db.close()
 
-        # filtro de tipo:
-        query = query.filter(Transacao.tipo == "despesa")
+@em_cache
+def recuperar_totais_por_categoria(id_usuario, data_inicio, data_fim):
+    """ Retorna o total de saídas (despesas, transferências e compras de ativos) de cada categoria entre data_inicio e data_fim
+    (datas inclusivas), já somado no banco. Usada pelo gráfico de rosca do app, que antes carregava todas as transações do usuário.
+    Só aparecem as categorias com total positivo, na ordem em que foram criadas."""
 
-        # filtro para caso haja alguma categoria específica:
-        if categoria_especifica:
-            query = query.filter(Categoria.nome == categoria_especifica)
+    db = SessionLeitura() # só leitura: não disputa a trava de escrita
 
-        # criação do dataframe para o tratamento dos dados:
-        df = pd.DataFrame(query.all())
+    try:
+        inicio = datetime.combine(data_inicio, datetime.min.time())
+        fim = datetime.combine(data_fim, datetime.max.time()) # até o fim do dia de data_fim
 
-        if df.empty:
-            return []
-    
-        # aqui nós agrupamos os valores por categoria e os somamos para ter um valor único por categoria no gráfico
-        df_resumo = df.groupby(["Categoria", "cor_hex","icone"])['valor'].sum().reset_index()
+        totais = agregado_service.somar_periodo(db, id_usuario, inicio, fim, agrupar_por=("id_categoria",),
+                                                tipos=[TipoTransacao.DESPESA, TipoTransacao.TRANSFERENCIA, TipoTransacao.COMPRA])
+        categorias = _categorias_por_id(db, [id_cat for (id_cat,), (total, _) in totais.items() if id_cat and total > 0])
 
-        # pegamos os 6 maiores valores e os ordenamos
-        df_resumo = df_resumo.sort_values(by='valor', ascending= False).head(6)
+        return [{"id_categoria": id_cat, "nome": categorias[id_cat][0], "cor_hex": categorias[id_cat][1], "valor": totais[(id_cat,)][0]}
+                for id_cat in sorted(categorias)]
 
-        # adicionamos os resultados a uma lista de dicionarios que será utilizada pelo Pandas
-        return df_resumo.to_dict('records')
-    
     except Exception as e:
-        print (f"Erro ao buscar as despesas: {e}")
+        print (f"Erro ao buscar os totais por categoria: {e}")
         return []
-    
+
     finally:
         db.close()
 
+@em_cache
 def recuperar_saldo_total(id_usuario):
     # função responsável por somar o saldo em cada conta do usuário, mostrando o saldo total na tela de resumo.
 
     # estabelece concexão com o DB
-    db = SessionLocal()
+    db = SessionLeitura()
 
     try:
-        # pesquisa no bd por todas as contas do usuário que não estão marcadas para serem ignoradas
-        contas = db.query(Conta).filter(Conta.id_usuario == id_usuario, Conta.ignorar_patrimonio == False).all()
+        # busca as contas do usuário com o saldo materializado consolidado até hoje e soma as que não estão marcadas para serem ignoradas
+        return _saldo_total(*_carregar_contas(db, id_usuario))
 
-        # aqui nós iteramos o saldo atual (que é uma propriedade que criamos em conta) e somamos tudo 
-        total = sum(c.saldo_atual for c in contas)
-
-        return total if total else 0.0
-    
     except Exception as e:
         print(f"Erro ao calcular saldo total: {e}")
         return 0.0
@@ -115,35 +433,20 @@ def recuperar_saldo_total(id_usuario):
 def listar_contas(id_usuario):
     """Retorna todas as contas ativas de um usuário específico."""
     db = SessionLocal()
-    
+
     try:
         return db.query(Conta).filter_by(id_usuario=id_usuario).all()
     finally:
         db.close()
 
+@em_cache
 def obter_detalhamento_contas(id_usuario):
     """ Retorna uma lista com o nome e o saldo atual de cada conta do usuário.
     Útil para a aba de 'Minhas Contas'."""
-    db = SessionLocal()
+    db = SessionLeitura()
     try:
-        # 1. Buscamos todas as contas do usuário
-        contas = db.query(Conta).filter_by(id_usuario=id_usuario).all()
-        
-        # 2. Montamos a lista com os dados processados
-        lista_detalhada = []
-        
-        for conta in contas:
-            lista_detalhada.append({
-                "id_conta": conta.id_conta,
-                "nome": conta.nome_conta,
-                "subtipo": conta.subtipo_conta.value,
-                "instituicao": conta.tipo_instituicao.value,
-                "saldo_atual": conta.saldo_atual, 
-                "limite": conta.limite,
-                "ignorar": conta.ignorar_patrimonio
-            })
-            
-        return lista_detalhada
+        # Consolidamos os saldos materializados, buscamos todas as contas do usuário e montamos a lista com os dados processados
+        return [asdict(conta) for conta in _detalhamento_contas(*_carregar_contas(db, id_usuario))]
 
     except Exception as e:
         print(f"❌ Erro ao listar detalhes das contas: {e}")
@@ -151,213 +454,491 @@ def obter_detalhamento_contas(id_usuario):
     finally:
         db.close()
 
+@em_cache
 def recuperar_composicao_patrimonio(id_usuario):
     """
     Agrupa os saldos por SubtipoConta para gerar o gráfico de rosca no Dash.
     """
-    db = SessionLocal()
+    db = SessionLeitura()
     try:
-        contas = db.query(Conta).filter(
-            Conta.id_usuario == id_usuario, 
-            Conta.ignorar_patrimonio == False
-        ).all()
-
-        if not contas:
-            return []
-
-        # Criamos uma lista de dicionários com os dados brutos
-        dados = [
-            {"subtipo": c.subtipo_conta.value, "saldo": c.saldo_atual} 
-            for c in contas
-        ]
-        
-        df = pd.DataFrame(dados)
-        
-        # Agrupamos por subtipo e somamos
-        df_resumo = df.groupby("subtipo")["saldo"].sum().reset_index()
-        
-        return df_resumo.to_dict('records')
+        return [asdict(item) for item in _composicao_patrimonio(*_carregar_contas(db, id_usuario))]
     finally:
         db.close()
 
+@em_cache
 def recuperar_resumo_mensal(id_usuario):
     # essa função deverá ser capaz de somar as movimentações do usuário no último mês (despesas e receitas) para mostrarmos na tela de resumo.
 
     # criando a conexão com o DB
-    db = SessionLocal()
-
-    hoje = datetime.now()
+    db = SessionLeitura()
 
     try:
-        # cria um atalho para o período mensal
-        inicio, fim = hoje.replace(day=1, hour=0, minute=0, second=0), hoje
-    
-        # dividimos a pesquisa para cada tipo: "despesa" ou "receita". Vamos precisar dos dois valores para mostrar na tela inicial do app.
-        
-        # DESPESA
-        # query principal, pegamos a tabela transação e filtramos por id de usuário, por tipo "despesa" e pelo período (mês corrente)
-        total_despesas = db.query(func.sum(Transacao.valor))\
-        .filter(Transacao.id_usuario == id_usuario)\
-        .filter(Transacao.tipo == "Despesa")\
-        .filter(Transacao.data.between(inicio,fim)).scalar()
-
-        # RECEITA
-        # mesma query da despesa, mas o filtro é por "receita"
-        total_receitas = db.query(func.sum(Transacao.valor))\
-        .filter(Transacao.id_usuario == id_usuario)\
-        .filter(Transacao.tipo == "Receita")\
-        .filter(Transacao.data.between(inicio,fim)).scalar()
-
         # a função retorna um dicionário com as somas das despesas e receitas ou 0.0 para o caso de não existirem transações no período.
-        return {
-            "despesas": total_despesas or 0.0,
-            "receitas": total_receitas or 0.0
-            }
-    
+        recorrencias = recorrencia_service.carregar_recorrencias(db, id_usuario)
+        return asdict(_resumo_mensal(db, id_usuario, datetime.now(), recorrencias))
+
     except Exception as e:
         print (f" Erro na recuperação dos dados: {e}")
-        
+
         # Retorna o dicionário zerado para o app não travar
-        return {"despesas": 0.0, "receitas": 0.0}
+        return asdict(ResumoMensal(despesas=0.0, receitas=0.0))
 
     finally:
         db.close()
 
+@em_cache
 def recuperar_ultimas_movimentacoes(id_usuario):
     # essa função vai ser responsável por recuperarmos as últimas transações do usuário para adicionarmos ao widget "últimas movimentações"
 
     # estabelecemos conexão com o DB:
-    db = SessionLocal()
+    db = SessionLeitura()
 
     try:
+        # retornamos uma lista de dicts (a chave da categoria continua sendo 'nome', como na consulta original)
+        return [{"valor": m.valor, "data": m.data, "descricao": m.descricao, "cor_hex": m.cor_hex, "nome": m.categoria}
+                for m in _ultimas_movimentacoes(db, id_usuario)]
 
-        # consulta principal no bd: pegamos os dados valor, descrição, data da tabela transação e os dados cor hex e nome da tabela categoria e os juntamos usando o id_categoria como referencial 
-        query = db.query(Transacao.valor, Transacao.data, Transacao.descricao, Categoria.cor_hex, Categoria.nome).join(Categoria, Transacao.id_categoria == Categoria.id_categoria)
-
-        # aí filtramos pelo usuário:
-        query = query.filter(Transacao.id_usuario == id_usuario)
-
-        # crimaos um dataframe para armazenar os resultados:
-        df = pd.DataFrame(query.all())
-
-        if df.empty:
-            return []
-        
-        # pegamos as 08 últimas entradas:
-        ultimas_entradas = df.sort_values(by='data', ascending=False).head(8)
-
-        # Aqui nós limitamos a descrição para mostrar apenas 20 caracteres para não quebrar o layout da tabela
-        ultimas_entradas['descricao'] = ultimas_entradas['descricao'].str.slice(0, 20)
-
-        # retornamos um dict
-        return ultimas_entradas.to_dict('records')
-    
     except Exception as e:
         print (f"Erro ao recuperar os dados: {e}")
         return []
-    
+
     finally:
         db.close()
 
+@em_cache
 def recuperar_agendamentos(id_usuario):
     # essa função vai buscar tudo o que houver agendado na conta do usuário e retornar para usarmos no widget "agendamentos".
 
     # estabelecendo concexão com o DB
-    db = SessionLocal()
-    hoje = datetime.now()
+    db = SessionLeitura()
 
     try:
-        # primeiro buscamos entre as tabelas transação e categoria os dados que vamos precisar
-        agend_transacoes_categorias = db.query(
-            Transacao.valor, 
-            Transacao.data, 
-            Transacao.descricao, 
-            Categoria.nome.label('categoria'), 
-            Categoria.cor_hex
-            ).join(Categoria).filter(Transacao.id_usuario == id_usuario, # aqui filtramos a busca por usuário, se ocorre hoje ou no futuro e se não foi quitada.
-                                     Transacao.data >= hoje,
-                                     Transacao.quitada == False
-                                     ).all()
-        
-        # criamos o dataframe para o pandas
-        df_trans = pd.DataFrame(agend_transacoes_categorias)
-        
-        # depois vamos buscar na tabela conta os dados do cartão e cheque especial que tbm deverão aparecer:
-
-        # primeiro vamos pesquisar na tabela contas todas as contas que pertencem ao usuário, 
-        contas = db.query(Conta).filter(Conta.id_usuario == id_usuario).all()
-
-        # Lógica para a fatura do cartão de crédito. Buscamos em Contas se há algum valor na fatura atual usando o filtro personalizado "fatura_atual_cartao"
-        # se houver, adicionamos os dados à tupla eventos_automáticos
-        eventos_automaticos = []
-        
-        for c in contas:
-            if c.tipo_conta == "cartao" and c.vencimento_cartao:
-                if c.fatura_atual_cartao > 0:
-                    eventos_automaticos.append({
-                        'valor': c.fatura_atual_cartao,
-                        'data': c.vencimento_cartao,
-                        'descricao': f"Fatura {c.nome_conta}",
-                        'categoria': "Cartão",
-                        'cor_hex': '#FF4B4B' # IMPORTANTE"," VERIFICAR COMO ISSO VAI FICAR NO LAYOUT.
-                    })
-
-        # logica para o cheque especial.
-            if c.tipo_conta == "corrente" and c.uso_cheque_especial > 0:
-                eventos_automaticos.append({
-                    'valor': c.uso_cheque_especial,
-                        'data': c.vencimento or hoje,
-                        'descricao': f"Uso do Limite {c.nome_conta}",
-                        'categoria': "Bancário",
-                        'cor_hex': '#FF904B' # IMPORTANTE"," VERIFICAR COMO ISSO VAI FICAR NO LAYOUT.
-                    })
-        
-        df_contas = pd.DataFrame (eventos_automaticos)
-
-
-        # agora vamos unir os dados das pesquisas em uma linda tabela pandas pro nosso app poder usar:
-
-        df_final = pd.concat([df_trans, df_contas], ignore_index= True)
-
-        if not df_final.empty:
-            df_final['data'] = pd.to_datetime(df_final['data'])
-            df_final = df_final.sort_values(by='data', ascending=True)
-
-            return df_final.to_dict('records')
-        
-        return []
-    
+        # transações agendadas + ocorrências das recorrências + fatura do cartão e uso do cheque especial, já ordenados por data
+        contas, saldos = _carregar_contas(db, id_usuario)
+        recorrencias = recorrencia_service.carregar_recorrencias(db, id_usuario)
+        return [asdict(agendamento) for agendamento in _agendamentos(db, id_usuario, contas, saldos, datetime.now(), recorrencias)]
+
     except Exception as e:
         print (f"Não foi possível recuperar os dados dos agendamentos: {e}")
+        return []
 
     finally:
         db.close()
 
+@em_cache
+def recuperar_saldos_projetados(id_usuario, dias=JANELA_AGENDAMENTOS_DIAS):
+    """ Retorna, para cada conta ativa do usuário, o saldo atual e o saldo projetado daqui a `dias` dias, considerando as transações
+    agendadas, as ocorrências das recorrências (que não precisam estar gravadas) e as faturas dos cartões. É o último dia da
+    previsão de previsao_service."""
+
+    try:
+        previsao = previsao_service.prever_fluxo(id_usuario=id_usuario, dias=dias)
+        return [asdict(SaldoProjetado(id_conta=c.id_conta, nome=c.nome, saldo_atual=c.saldo_atual, saldo_projetado=c.saldo_final))
+                for c in previsao.contas]
+
+    except Exception as e:
+        print (f"Erro ao projetar os saldos: {e}")
+        return []
+
+@em_cache
+def recuperar_historico_saldos(id_usuario, data_inicio, data_fim=None, frequencia="diaria"):
+    """ Série histórica para o gráfico de evolução: o saldo de cada conta e o patrimônio total (sem as contas ignoradas) ao fim
+    de cada dia do período, ou de cada mês com frequencia="mensal". Os meses já fechados são reaproveitados do cache do
+    historico_service, então só o mês corrente é recalculado a cada escrita."""
+
+    try:
+        historico = historico_service.historico_saldos(id_usuario, data_inicio, data_fim, frequencia)
+        datas = historico.datas.astype(object) # datetime64[D] -> date
+
+        return {
+            "contas": [{"data": datas[i], "id_conta": id_conta, "conta": nome, "saldo": float(historico.saldos[i, j])}
+                       for j, (id_conta, nome) in enumerate(zip(historico.ids_conta, historico.nomes))
+                       for i in range(len(datas))],
+            "patrimonio": [{"data": datas[i], "saldo": float(historico.patrimonio[i])} for i in range(len(datas))]
+        }
+
+    except Exception as e:
+        print(f"Erro ao recuperar o histórico de saldos: {e}")
+        return {"contas": [], "patrimonio": []}
+
+@em_cache
+def recuperar_faturas_cartoes(id_usuario):
+    """ Para cada cartão ativo do usuário: uso do limite, valor em atraso, fatura atual, próxima fatura a pagar e as faturas
+    recentes e futuras (com as parcelas já distribuídas pelos ciclos). Todos os cartões saem de uma única consulta."""
+
+    try:
+        return [asdict(resumo) for resumo in fatura_service.resumir_cartoes_do_usuario(id_usuario)]
+
+    except Exception as e:
+        print(f"Erro ao recuperar as faturas dos cartões: {e}")
+        return []
+
+@em_cache
 def rastreador_gatilhos(id_usuario):
-    # o propósito dessa função é buscar os gatilhos de todas as contas a fim de passar essa informação para o widget de notificações
+    # o propósito dessa função é buscar os alertas de todas as contas e categorias a fim de passar essa informação para o widget de
+    # notificações. Os gatilhos já foram avaliados nas escritas (alerta_service), então aqui é só uma leitura da tabela alertas.
 
     # conexão com o DB
-    db = SessionLocal()
+    db = SessionLeitura()
+
+    try:
+        return [a.mensagem for a in _alertas(db, id_usuario)]
+
+    except Exception as e:
+        print (f"Erro ao recuperar os alertas: {e}")
+        return []
+
+    finally:
+        db.close()
+
+@em_cache
+def recuperar_alertas(id_usuario):
+    """ Alertas pendentes com id, tipo e data, para o widget de notificações permitir dispensá-los (alerta_service.reconhecer_alerta)."""
 
-    # variável para colocar os alertas
-    todos_os_alertas = []
+    db = SessionLeitura()
 
     try:
-        # verifica a tabela contas e busca todas as contas associadas ao usuário.
-        contas = db.query(Conta).filter(Conta.id_usuario == id_usuario).all()
-
-        # em cada conta, aplica a função de verificação que criamos na classe contas.
-        for conta in contas:
-            alertas_contas = conta.verificar_gatilhos()
-            # caso hajam alertas, nós estendemos a lista de alertas com os gatilhos encontrados em cada conta, de modo que no final do loop teremos uma lista completa de gatilhos.
-            if alertas_contas:
-                todos_os_alertas.extend(alertas_contas)  
-        
-        return todos_os_alertas if todos_os_alertas else []
-    
+        return [asdict(alerta) for alerta in _alertas(db, id_usuario)]
+
     except Exception as e:
         print (f"Erro ao recuperar os alertas: {e}")
         return []
-        
+
+    finally:
+        db.close()
+
+@em_cache
+def recuperar_orcamentos(id_usuario):
+    """ Orçamento do mês corrente de cada categoria e subcategoria de despesa do usuário: gasto até hoje, limite mensal, projeção
+    para o fim do mês pelo ritmo atual e situação (ver orcamento_service). Número fixo de consultas, qualquer que seja a
+    quantidade de categorias."""
+
+    try:
+        return asdict(orcamento_service.orcamentos_do_usuario(id_usuario))
+
+    except Exception as e:
+        print(f"Erro ao recuperar os orçamentos: {e}")
+        return {}
+
+#region VISÃO DA FAMÍLIA
+# Variantes das leituras do painel para todos os membros de uma família. O escopo da família (membros e donos das contas, metas e
+# ativos compartilhados pelo id_familia) é resolvido uma vez e fica em cache pela versão da composição da família, e cada widget
+# faz as mesmas consultas da visão individual, trocando o filtro por id_usuario por um IN com os membros (mais o id_familia, nas
+# contas, metas e ativos) e agrupando também por id_usuario: o resultado traz o total da família e a parte de cada membro, sem uma
+# chamada por membro. O que é compartilhado e não pertence a um membro (ex.: uma meta da família) aparece como a parte da "Família",
+# com id_usuario nulo.
+# O cache é chaveado pela tupla de ids do escopo, então uma escrita de qualquer um deles invalida a visão da família.
+
+PARTE_DA_FAMILIA = "Família" # nome da parte compartilhada que não pertence a nenhum membro
+
+@dataclass(frozen=True)
+class EscopoFamilia:
+    id_familia: int
+    membros: Tuple[Tuple[int, str], ...]   # (id_usuario, nome) de cada membro, em ordem de id
+    ids_usuario: Tuple[int, ...]           # membros e donos das contas e ativos compartilhados: as versões deles entram na chave do cache
+    versao: tuple                          # versão da composição da família (utils/cache.versao_familia)
+
+    @property
+    def ids_membros(self):
+        return tuple(id_usuario for id_usuario, _ in self.membros)
+
+    def parte(self, id_usuario):
+        # a quem o item é atribuído: ao dono, se ele for membro, ou à parte da família
+        return id_usuario if id_usuario in self.ids_membros else None
+
+    def nome(self, id_usuario):
+        return dict(self.membros).get(id_usuario, PARTE_DA_FAMILIA)
+
+@dataclass(frozen=True)
+class SaldoMembro:
+    id_usuario: int
+    membro: str
+    saldo: float
+
+@dataclass(frozen=True)
+class SaldoFamilia:
+    total: float
+    por_membro: Tuple[SaldoMembro, ...]
+
+@dataclass(frozen=True)
+class ComposicaoPatrimonioMembro:
+    subtipo: Optional[str]
+    id_usuario: int
+    membro: str
+    saldo: float
+
+@dataclass(frozen=True)
+class ResumoMensalMembro:
+    id_usuario: int
+    membro: str
+    despesas: float
+    receitas: float
+    despesas_previstas: float
+    receitas_previstas: float
+
+@dataclass(frozen=True)
+class ResumoMensalFamilia:
+    total: ResumoMensal
+    por_membro: Tuple[ResumoMensalMembro, ...]
+
+@dataclass(frozen=True)
+class MetaFamilia:
+    id_meta: int
+    nome: str
+    id_usuario: Optional[int]
+    membro: str
+    valor_alvo: float
+    valor_poupado: float
+    progresso: float
+    prazo_final: Optional[date]
+
+def _escopo_da_familia(id_familia):
+    # membros da família e donos das contas e ativos compartilhados com ela, guardados no cache das consultas pela versão da
+    # composição da família (duas consultas só quando um membro entra ou sai, ou algo passa a ser ou deixa de ser compartilhado)
+    versao = versao_familia(id_familia)
+    chave = ("_escopo_da_familia", id_familia, versao)
+    encontrado, escopo = cache_consultas.obter(chave)
+    if encontrado:
+        return escopo
+
+    db = SessionLeitura()
+    try:
+        membros = tuple((id_usuario, nome) for id_usuario, nome in db.query(Usuario.id_usuario, Usuario.nome)
+                        .filter(Usuario.id_familia == id_familia).order_by(Usuario.id_usuario).all())
+        donos = db.query(Conta.id_usuario).filter(Conta.id_familia == id_familia)\
+            .union(db.query(Ativo.id_usuario).filter(Ativo.id_familia == id_familia)).all()
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+    ids_usuario = tuple(sorted({id_usuario for id_usuario, _ in membros} | {id_usuario for (id_usuario,) in donos if id_usuario}))
+    escopo = EscopoFamilia(id_familia=id_familia, membros=membros, ids_usuario=ids_usuario, versao=versao)
+    cache_consultas.guardar(chave, escopo)
+    return escopo
+
+def _saldos_por_membro_e_subtipo(db, escopo):
+    # saldos das contas que não são ignoradas (dos membros ou compartilhadas com a família), somados por parte e subtipo (a mesma
+    # lista serve ao saldo total e à composição do patrimônio): as contas vêm de um único SELECT e os saldos de uma única consulta
+    # em lote, sem escrita
+    contas = db.query(Conta.id_conta, Conta.id_usuario, Conta.subtipo_conta)\
+        .filter(or_(Conta.id_usuario.in_(escopo.ids_membros), Conta.id_familia == escopo.id_familia),
+                Conta.ignorar_patrimonio.isnot(True)).all()
+    saldos = saldo_service.saldos_em_lote(db, [c.id_conta for c in contas])
+
+    totais = {}
+    for c in contas:
+        chave = (escopo.parte(c.id_usuario), c.subtipo_conta.value if c.subtipo_conta else None)
+        totais[chave] = somar([totais.get(chave, 0.0), saldos[c.id_conta]])
+    return [(parte, subtipo, saldo) for (parte, subtipo), saldo in totais.items()]
+
+def _ativos_por_membro(db, escopo):
+    # valor investido nos ativos dos membros ou compartilhados com a família, somado por parte em uma única consulta agrupada:
+    # as compras de cada ativo, como Ativo.valor_investido_total (quantidade × preço unitário é o valor da transação)
+    linhas = db.query(Ativo.id_usuario, func.sum(Transacao.valor))\
+        .join(Transacao, Transacao.id_ativo == Ativo.id_ativo)\
+        .filter(or_(Ativo.id_usuario.in_(escopo.ids_membros), Ativo.id_familia == escopo.id_familia),
+                Transacao.tipo == TipoTransacao.COMPRA)\
+        .group_by(Ativo.id_usuario).all()
+
+    totais = {}
+    for id_usuario, total in linhas:
+        parte = escopo.parte(id_usuario)
+        totais[parte] = somar([totais.get(parte, 0.0), total])
+    return totais
+
+def recuperar_saldo_familia(id_familia):
+    """ Saldo total da família e a parte de cada membro (contas que não são ignoradas no patrimônio). As contas compartilhadas
+    com a família entram na parte do dono, se ele for membro, ou na parte da "Família"."""
+    escopo = _escopo_da_familia(id_familia)
+    return _saldo_familia(escopo.ids_usuario, escopo)
+
+@em_cache
+def _saldo_familia(ids_usuario, escopo):
+    db = SessionLeitura()
+
+    try:
+        por_parte = {id_usuario: 0.0 for id_usuario in escopo.ids_membros}
+        for parte, _, saldo in _saldos_por_membro_e_subtipo(db, escopo):
+            por_parte[parte] = somar([por_parte.get(parte, 0.0), saldo])
+
+        return asdict(SaldoFamilia(total=somar(por_parte.values()), por_membro=tuple(
+            SaldoMembro(id_usuario=parte, membro=escopo.nome(parte), saldo=saldo) for parte, saldo in por_parte.items())))
+
+    except Exception as e:
+        print(f"Erro ao calcular o saldo da família: {e}")
+        return asdict(SaldoFamilia(total=0.0, por_membro=()))
+
+    finally:
+        db.close()
+
+def recuperar_composicao_patrimonio_familia(id_familia):
+    """ Patrimônio da família agrupado por SubtipoConta, com uma linha por membro em cada subtipo (para gráficos empilhados).
+    Os ativos (valor investido) entram como o subtipo "ativos"."""
+    escopo = _escopo_da_familia(id_familia)
+    return _composicao_patrimonio_familia(escopo.ids_usuario, escopo)
+
+@em_cache
+def _composicao_patrimonio_familia(ids_usuario, escopo):
+    db = SessionLeitura()
+
+    try:
+        linhas = [ComposicaoPatrimonioMembro(subtipo=subtipo, id_usuario=parte, membro=escopo.nome(parte), saldo=saldo or 0.0)
+                  for parte, subtipo, saldo in _saldos_por_membro_e_subtipo(db, escopo)]
+        linhas += [ComposicaoPatrimonioMembro(subtipo="ativos", id_usuario=parte, membro=escopo.nome(parte), saldo=valor)
+                   for parte, valor in _ativos_por_membro(db, escopo).items()]
+
+        # mesma ordem alfabética de subtipos da visão individual; a parte da família vem depois dos membros
+        linhas.sort(key=lambda c: (c.subtipo is None, c.subtipo or "", c.id_usuario is None, c.id_usuario or 0))
+        return [asdict(linha) for linha in linhas]
+
+    except Exception as e:
+        print(f"Erro ao montar a composição do patrimônio da família: {e}")
+        return []
+
+    finally:
+        db.close()
+
+def recuperar_metas_familia(id_familia):
+    """ Metas da família (as da própria família e as de cada membro) com o valor poupado e o progresso, nas mesmas regras de
+    Meta.valor_poupado. O valor poupado de todas as metas sai de uma única consulta agrupada."""
+    escopo = _escopo_da_familia(id_familia)
+    return _metas_familia(escopo.ids_usuario, escopo)
+
+@em_cache
+def _metas_familia(ids_usuario, escopo):
+    db = SessionLeitura()
+
+    try:
+        metas = db.query(Meta.id_meta, Meta.nome_meta, Meta.id_usuario, Meta.valor_alvo, Meta.aporte_inicial, Meta.prazo_final)\
+            .filter(or_(Meta.id_usuario.in_(escopo.ids_membros), Meta.id_familia == escopo.id_familia))\
+            .order_by(Meta.id_meta).all()
+
+        # entradas (receitas, transferências e dividendos) somam e despesas subtraem, como em Meta.valor_poupado
+        movimentos = {}
+        if metas:
+            for id_meta, tipo, total in db.query(Transacao.id_meta, Transacao.tipo, func.sum(Transacao.valor))\
+                    .filter(Transacao.id_meta.in_([m.id_meta for m in metas]),
+                            Transacao.tipo.in_([TipoTransacao.RECEITA, TipoTransacao.TRANSFERENCIA, TipoTransacao.DIVIDENDO, TipoTransacao.DESPESA]))\
+                    .group_by(Transacao.id_meta, Transacao.tipo).all():
+                movimentos.setdefault(id_meta, []).append(-total if tipo == TipoTransacao.DESPESA else total)
+
+        resultado = []
+        for m in metas:
+            poupado = somar([m.aporte_inicial, *movimentos.get(m.id_meta, ())])
+            parte = escopo.parte(m.id_usuario)
+            resultado.append(asdict(MetaFamilia(
+                id_meta=m.id_meta, nome=m.nome_meta, id_usuario=parte, membro=escopo.nome(parte), valor_alvo=m.valor_alvo,
+                valor_poupado=poupado, progresso=poupado / m.valor_alvo * 100 if m.valor_alvo and m.valor_alvo > 0 else 0,
+                prazo_final=m.prazo_final
+            )))
+        return resultado
+
+    except Exception as e:
+        print(f"Erro ao recuperar as metas da família: {e}")
+        return []
+
+    finally:
+        db.close()
+
+def recuperar_resumo_mensal_familia(id_familia):
+    """ Despesas e receitas do mês corrente (realizadas e previstas até o fim do mês) da família e de cada membro."""
+    escopo = _escopo_da_familia(id_familia)
+    return _resumo_mensal_familia(escopo.ids_usuario, escopo)
+
+@em_cache
+def _resumo_mensal_familia(ids_usuario, escopo):
+    db = SessionLeitura()
+
+    try:
+        realizadas, previstas = {}, {}
+        membros = escopo.membros
+        if membros:
+            recorrencias = recorrencia_service.carregar_recorrencias(db, list(escopo.ids_membros))
+            realizadas, previstas = _totais_do_mes(db, list(escopo.ids_membros), datetime.now(), recorrencias, agrupar_por=("tipo", "id_usuario"))
+
+        por_membro = tuple(ResumoMensalMembro(
+            id_usuario=id_usuario,
+            membro=nome,
+            despesas=realizadas.get((TipoTransacao.DESPESA, id_usuario), 0.0),
+            receitas=realizadas.get((TipoTransacao.RECEITA, id_usuario), 0.0),
+            despesas_previstas=previstas.get((TipoTransacao.DESPESA, id_usuario), 0.0),
+            receitas_previstas=previstas.get((TipoTransacao.RECEITA, id_usuario), 0.0)
+        ) for id_usuario, nome in membros)
+
+        total = ResumoMensal(
+            despesas=somar(m.despesas for m in por_membro),
+            receitas=somar(m.receitas for m in por_membro),
+            despesas_previstas=somar(m.despesas_previstas for m in por_membro),
+            receitas_previstas=somar(m.receitas_previstas for m in por_membro)
+        )
+        return asdict(ResumoMensalFamilia(total=total, por_membro=por_membro))
+
+    except Exception as e:
+        print(f"Erro ao montar o resumo mensal da família: {e}")
+        return asdict(ResumoMensalFamilia(total=ResumoMensal(despesas=0.0, receitas=0.0), por_membro=()))
+
+    finally:
+        db.close()
+
+def recuperar_despesas_familia(id_familia, periodo="mensal", data_inicio_custom=None, data_fim_custom=None):
+    """ Despesas da família por categoria no período (as 6 maiores categorias da família), com uma linha por membro em cada
+    categoria. Cada membro tem as próprias categorias: as de mesmo nome são somadas juntas (com a cor e o ícone da primeira)."""
+    escopo = _escopo_da_familia(id_familia)
+    return _despesas_familia(escopo.ids_usuario, escopo, periodo, data_inicio_custom, data_fim_custom)
+
+@em_cache
+def _despesas_familia(ids_usuario, escopo, periodo, data_inicio_custom, data_fim_custom):
+    db = SessionLeitura()
+
+    try:
+        if not escopo.membros:
+            return []
+
+        inicio, fim = calcular_intervalo(periodo, data_inicio_custom, data_fim_custom)
+        totais = agregado_service.somar_periodo(db, list(escopo.ids_membros), inicio, fim, agrupar_por=("id_categoria", "id_usuario"),
+                                                tipos=[TipoTransacao.DESPESA])
+        categorias = _categorias_por_id(db, list({id_cat for id_cat, _ in totais if id_cat}))
+
+        # nome da categoria -> {id_usuario: valor}, e a cor e o ícone usados para cada nome
+        valores, aparencia = {}, {}
+        for (id_cat, id_usuario), (total, _) in sorted(totais.items()):
+            if id_cat in categorias:
+                nome, cor, icone = categorias[id_cat]
+                aparencia.setdefault(nome, (cor, icone))
+                por_membro = valores.setdefault(nome, {})
+                por_membro[id_usuario] = somar([por_membro.get(id_usuario, 0.0), total])
+
+        maiores = sorted(valores.items(), key=lambda item: sum(item[1].values()), reverse=True)[:6]
+        return [{"Categoria": nome, "cor_hex": aparencia[nome][0], "icone": aparencia[nome][1], "id_usuario": id_usuario,
+                 "membro": escopo.nome(id_usuario), "valor": valor}
+                for nome, por_membro in maiores
+                for id_usuario, valor in sorted(por_membro.items())]
+
+    except Exception as e:
+        print(f"Erro ao buscar as despesas da família: {e}")
+        return []
+
+    finally:
+        db.close()
+
+def recuperar_orcamentos_familia(id_familia):
+    """ Orçamentos do mês corrente de todas as categorias e subcategorias de despesa dos membros da família (cada categoria traz o
+    id_usuario do dono), com as mesmas duas consultas da visão individual."""
+    escopo = _escopo_da_familia(id_familia)
+    return _orcamentos_familia(escopo.ids_usuario, escopo)
+
+@em_cache
+def _orcamentos_familia(ids_usuario, escopo):
+    db = SessionLeitura()
+
+    try:
+        orcamento = orcamento_service.montar_orcamentos(db, escopo.ids_membros)
+        return {**asdict(orcamento), "membros": [{"id_usuario": id_usuario, "membro": nome} for id_usuario, nome in escopo.membros]}
+
+    except Exception as e:
+        print(f"Erro ao recuperar os orçamentos da família: {e}")
+        return {}
+
+    finally:
+        db.close()
+
+#endregion
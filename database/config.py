@@ -1,16 +1,97 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import Column, Integer, Float, String, DateTime
 
+#region PERFIS DO SQLITE
+# Cada perfil é um conjunto de PRAGMAs aplicados em toda conexão nova (evento 'connect' da engine).
+# O perfil é escolhido pela variável de ambiente MEUDINHEIRO_PERFIL_DB (padrão: "desempenho").
+PERFIS_SQLITE = {
+    # WAL permite leituras simultâneas a uma escrita (várias sessões do Streamlit) e o busy_timeout espera a trava em vez de
+    # falhar na hora com "database is locked". synchronous=NORMAL em WAL só arrisca a última transação em caso de queda de energia.
+    "desempenho": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,       # valores negativos são em KiB: ~64 MB de cache de páginas por conexão
+        "mmap_size": 268435456,     # 256 MB de leitura via memória mapeada
+        "temp_store": "DEFAULT",    # MEMORY ficou ~30% mais lento nos GROUP BY do benchmark (Scripts_aux/benchmark_perfis_sqlite.py)
+        "busy_timeout": 5000,       # em milissegundos
+    },
+    # mesmo modo WAL, mas com fsync a cada commit (durabilidade máxima) e sem mmap.
+    "seguro": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 10000,
+    },
+    # comportamento original do SQLite (rollback journal, sem ajustes), útil para comparação no benchmark.
+    "compatibilidade": {},
+}
+
+# PRAGMAs que alteram o arquivo do banco e, por isso, não podem ser aplicados por uma conexão somente leitura.
+PRAGMAS_DE_ESCRITA = {"journal_mode", "synchronous"}
+
+def aplicar_pragmas(engine, pragmas, somente_leitura=False):
+    """Registra o evento que aplica os PRAGMAs do perfil em cada conexão aberta pela engine."""
+
+    @event.listens_for(engine, "connect")
+    def _ao_conectar(conexao_dbapi, registro_conexao):
+        cursor = conexao_dbapi.cursor()
+        try:
+            for nome, valor in pragmas.items():
+                if somente_leitura and nome in PRAGMAS_DE_ESCRITA:
+                    continue
+                cursor.execute(f"PRAGMA {nome}={valor}")
+            if somente_leitura:
+                cursor.execute("PRAGMA query_only=ON") # proteção extra: qualquer escrita nesta conexão gera erro
+        finally:
+            cursor.close()
+
+def criar_engine(url, perfil="desempenho", somente_leitura=False):
+    """ Cria a engine do banco aplicando o perfil informado. Para o SQLite, somente_leitura=True abre o arquivo
+    em modo 'ro' (a conexão não consegue escrever nem travar o banco para as outras sessões)."""
+
+    url = make_url(url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url)
+
+    if perfil not in PERFIS_SQLITE:
+        raise ValueError(f"Perfil de banco '{perfil}' desconhecido. Opções: {', '.join(PERFIS_SQLITE)}")
+
+    if somente_leitura and url.database and url.database != ":memory:":
+        # o modo somente leitura do SQLite só é aceito no formato URI: file:caminho?mode=ro
+        url = url.set(database=f"file:{url.database}?mode=ro", query={"uri": "true"})
+
+    nova_engine = create_engine(url, connect_args={"check_same_thread" : False})
+    aplicar_pragmas(nova_engine, PERFIS_SQLITE[perfil], somente_leitura)
+    return nova_engine
+
+#endregion
+
 # configurando a engine do BD
-DATABASE_URL = "sqlite:///database/meudinheiro.db"  # quando migrarmos para o postgreSQL, essa variável será alterada 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread" : False})
+DATABASE_URL = os.getenv("MEUDINHEIRO_DATABASE_URL", "sqlite:///database/meudinheiro.db")  # quando migrarmos para o postgreSQL, basta trocar a variável de ambiente
+PERFIL_DB = os.getenv("MEUDINHEIRO_PERFIL_DB", "desempenho")
+engine = criar_engine(DATABASE_URL, PERFIL_DB)
+
+# engine somente leitura, para as consultas de relatório (painéis, exportações): não disputa a trava de escrita com o restante do app.
+# Um banco em memória só existe na conexão que o criou, então nesse caso as leituras usam a engine principal.
+if make_url(DATABASE_URL).database in (None, "", ":memory:"):
+    engine_leitura = engine
+else:
+    engine_leitura = criar_engine(DATABASE_URL, PERFIL_DB, somente_leitura=True)
 
 # Criando a session, que usaremos para enviar comandos:
 SessionLocal = sessionmaker(autocommit = False, autoflush = False, bind = engine, expire_on_commit=False)
 
+# Session das consultas de relatório, ligada à engine somente leitura (usada pelas funções que só leem, como os gráficos,
+# o histórico de saldos, as faturas e a exportação para Parquet):
+SessionLeitura = sessionmaker(autocommit = False, autoflush = False, bind = engine_leitura, expire_on_commit=False)
+
 # A 'Base' é a "mãe" de todas as classes (Transacao, Conta, etc)
 # Todas as classes que herdarem dela serão transformadas em tabelas no banco
 Base = declarative_base()
-
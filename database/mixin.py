@@ -1,14 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from database.config import SessionLocal
+from utils.cache import incrementar_versao
+
+#region UNIDADE DE TRABALHO
+# Fora de uma unidade de trabalho, cada salvar/modificar/deletar abre a própria sessão e faz o próprio commit (um fsync por operação no SQLite).
+# Dentro de 'with unidade_de_trabalho():', as operações do mixin entram na mesma sessão e o commit acontece uma única vez, na saída do bloco.
+_sessao_da_unidade = ContextVar("sessao_da_unidade", default=None)
+
+@contextmanager
+def unidade_de_trabalho():
+    """ Agrupa as operações do CRUDMixin em uma única sessão e transação. Na saída do bloco é feito um único commit;
+    se qualquer operação falhar (ou o bloco levantar uma exceção), tudo o que foi feito no bloco é desfeito.
+    Devolve a sessão compartilhada, que também pode ser usada para consultas que precisam enxergar o que ainda não foi gravado.
+    Blocos aninhados reaproveitam a unidade mais externa."""
+
+    sessao_externa = _sessao_da_unidade.get()
+    if sessao_externa is not None:
+        yield sessao_externa
+        return
+
+    db = SessionLocal()
+    db.info["apos_commit"] = []
+    token = _sessao_da_unidade.set(db)
+
+    try:
+        yield db
+        if db.info.get("falhou"):
+            raise RuntimeError("Uma operação da unidade de trabalho falhou; nenhuma alteração foi gravada.")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        _sessao_da_unidade.reset(token)
+        db.close()
+
+    # ações que dependem dos dados já gravados (ex.: invalidar caches) só rodam depois do commit
+    for acao in db.info["apos_commit"]:
+        acao()
+
+def sessao_da_unidade():
+    """Retorna a sessão da unidade de trabalho ativa, ou None se não houver nenhuma."""
+    return _sessao_da_unidade.get()
+
+def executar_apos_commit(acao):
+    """Executa a ação agora ou, se houver uma unidade de trabalho ativa, depois que ela fizer o commit."""
+    db = _sessao_da_unidade.get()
+    if db is None:
+        acao()
+    else:
+        db.info["apos_commit"].append(acao)
+
+#endregion
 
 class CRUDMixin:
     """Essa classe servirá para centralizar as operações de banco de dados."""
 
     def salvar(self):
+        db = _sessao_da_unidade.get()
+        if db is not None:
+            # dentro da unidade de trabalho: o flush já gera o id do objeto, mas o commit fica para o fim do bloco
+            return self._executar_na_unidade(db, "salvar", lambda: db.add(self), self)
+
         db = SessionLocal()
         try:
             db.add(self)
             db.commit()
             db.refresh(self)
+            self._registrar_escrita()
             return self
         except Exception as e:
             db.rollback()
@@ -18,10 +78,15 @@ class CRUDMixin:
             db.close()
 
     def modificar(self):
+        db = _sessao_da_unidade.get()
+        if db is not None:
+            return self._executar_na_unidade(db, "atualizar", lambda: db.merge(self), self)
+
         db = SessionLocal()
         try:
             db.merge(self)
             db.commit()
+            self._registrar_escrita()
             return self
         except Exception as e:
             db.rollback()
@@ -31,14 +96,41 @@ class CRUDMixin:
             db.close()
 
     def deletar(self):
+        db = _sessao_da_unidade.get()
+        if db is not None:
+            return self._executar_na_unidade(db, "deletar", lambda: db.delete(db.merge(self)), True)
+
         db = SessionLocal()
         try:
-            db.delete(self)
+            # o merge carrega a linha gravada: os eventos de remoção (saldo da conta, agregados) descontam os valores do banco,
+            # e não o histórico de alterações que o objeto desanexado acumulou desde que foi carregado
+            db.delete(db.merge(self))
             db.commit()
+            self._registrar_escrita()
             return True
         except Exception as e:
             db.rollback()
             print(f"Erro ao deletar {self.__class__.__name__}: {e}")
             raise e
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
+
+    def _executar_na_unidade(self, db, verbo, operacao, retorno):
+        # mesma semântica de erro das operações avulsas: a falha desfaz a transação (aqui, a unidade inteira) e a exceção é repassada.
+        # a unidade fica marcada como falha, para não gravar o restante do bloco caso quem chamou capture a exceção e siga em frente.
+        try:
+            operacao()
+            db.flush()
+            self._registrar_escrita()
+            return retorno
+        except Exception as e:
+            db.rollback()
+            db.info["falhou"] = True
+            print(f"Erro ao {verbo} {self.__class__.__name__}: {e}")
+            raise e
+
+    def _registrar_escrita(self):
+        # invalida os resultados em cache do dono do objeto (ou de todos os usuários, para objetos sem id_usuario, como famílias).
+        # dentro de uma unidade de trabalho, a invalidação só acontece depois do commit.
+        id_usuario = getattr(self, "id_usuario", None)
+        executar_apos_commit(lambda: incrementar_versao(id_usuario))
@@ -1,16 +1,30 @@
+import hashlib
+import io
+import itertools
+import json
+import os
+import numpy as np
 import pandas as pd
 from database.config import SessionLocal
-from datetime import datetime
-from sqlalchemy import func
+from datetime import datetime, date
+from sqlalchemy import func, insert
 from classes.usuarios import Usuario
 from classes.regras import RegraTag
 from classes.contas import Conta
-from classes.transacoes import Transacao
+from classes.transacoes import Transacao, TipoTransacao, TipoRegistro
 from classes.familias import Familia
 from classes.categorias import Categoria
+from classes.agregados import aplicar_deltas, deltas_de_registros
+from services import saldo_service, recorrencia_service, alerta_service
+from utils.cache import incrementar_versao
+from utils.tools import normalizar_descricoes, normalizar_descricao
+from utils.deduplicacao import IndiceDuplicatas, janela_de_busca
+from utils.dinheiro import centavos_array, reais
 
 # Lê um CSV e salva as transações no banco de dados.
 
+LOCAL_EXTRATO = "N/A" # o local geralmente não está presente em extratos bancários: "N/A" indica que a informação não está disponível
+
 def sugerir_tag_inteligente(descricao_csv, id_usuario):
     """Função para sugerir uma tag com base na descrição do CSV, utilizando regras pré-definidas e histórico de transações do usuário."""
     
@@ -19,11 +33,13 @@ def sugerir_tag_inteligente(descricao_csv, id_usuario):
 
     # 1. TENTA PELA TABELA DE REGRAS (Prioridade Máxima)
     # Verifica se alguma palavra-chave cadastrada na classe regras está contida na descrição do CSV
-    regra = db.query(RegraTag).filter(func.instr(desc_limpa, RegraTag.palavra_chave) > 0, RegraTag.id_usuario == id_usuario).first()
+    regra = RegraTag.buscar_regra(desc_limpa, id_usuario)
     
     if regra:
+        # a regra aponta para uma categoria, então usamos o nome dela como tag sugerida
+        tag_regra = db.query(Categoria.nome).filter(Categoria.id_categoria == regra.id_categoria).scalar() or regra.palavra_chave
         db.close()
-        return regra.tag_destino
+        return tag_regra
 
     # 2. TENTA PELO HISTÓRICO DE TRANSAÇÕES
     # Busca a tag mais frequente para descrições similares no passado
@@ -73,30 +89,185 @@ def detectar_mapeamento_universal(df):
 
 def importar_extrato_csv(caminho_arquivo, id_conta):
     """ Função principal para importar um arquivo CSV de extrato bancário. Ela lê o arquivo, detecta as colunas de data, valor e descrição, 
-    e salva as transações no banco de dados, evitando duplicatas."""
+    e salva as transações no banco de dados, evitando duplicatas.
+    O processamento é feito em lote: normalização por colunas, deduplicação (aproximada na própria conta) com uma única consulta
+    indexada e um índice em memória, categorização em lote e inserção em massa em uma única transação do banco.
+    Retorna um dicionário com os contadores de transações novas e duplicadas e a lista das duplicatas encontradas no banco
+    (duplicatas_encontradas), com a pontuação de similaridade e a diferença de dias de cada uma."""
+
+    df = pd.read_csv(caminho_arquivo) # lê o arquivo CSV usando o Pandas, criando um DataFrame com os dados do extrato
 
     db = SessionLocal()
 
-    df = pd.read_csv(caminho_arquivo) # lê o arquivo CSV usando o Pandas, criando um DataFrame com os dados do extrato
-    
-    conta = db.query(Conta).filter_by(id_conta=id_conta).first() # busca a conta no banco de dados usando o id_conta fornecido como argumento da função
-    id_usuario = conta.id_usuario # obtém o id do usuário associado à conta, para usar nas transações importadas
+    try:
+        conta = db.query(Conta).filter_by(id_conta=id_conta).first() # busca a conta no banco de dados usando o id_conta fornecido como argumento da função
 
-    mapa = detectar_mapeamento_universal(df) # chama a função para detectar quais colunas do CSV correspondem a data, valor e descrição, e armazena o resultado no dicionário "mapa"
-    
-    contador_novas = 0 # contador para transações novas importadas
-    contador_duplicatas = 0 # contador para transações que foram detectadas como duplicatas e, portanto, não foram importadas
+        if not conta: # se a conta não for encontrada no banco de dados, imprime uma mensagem de erro e encerra a função
+            print(f"Erro: Conta {id_conta} não encontrada!")
+            return
 
-    if not conta: # se a conta não for encontrada no banco de dados, imprime uma mensagem de erro e encerra a função
-        print(f"Erro: Conta {id_conta} não encontrada!")
+        id_usuario = conta.id_usuario # obtém o id do usuário associado à conta, para usar nas transações importadas
+        id_cat_importada = obter_categoria_importado(db, id_usuario)
+
+        mapa = detectar_mapeamento_universal(df) # chama a função para detectar quais colunas do CSV correspondem a data, valor e descrição, e armazena o resultado no dicionário "mapa"
+
+        print(f"Iniciando importação de {len(df)} transações...")
+
+        resultado = importar_lote(db, df, mapa, id_conta, id_usuario, id_cat_importada)
+        db.commit() # grava todas as transações importadas e o novo saldo da conta de uma só vez
+        incrementar_versao(id_usuario, desde=resultado.pop("desde")) # os resultados em cache do usuário deixam de valer
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao gravar a importação: {e}")
+        raise e
+
+    finally:
         db.close()
-        return
-    
-    id_usuario = conta.id_usuario # obtém o id do usuário associado à conta, para usar nas transações importadas
-    
-    # tenta encontrar uma categoria chamada "Importado" para o usuário, para usar como categoria padrão para as transações importadas. 
-    # Isso ajuda a organizar as transações importadas em uma categoria específica, facilitando a identificação 
-    # e possível reclassificação posterior pelo usuário.
+
+    # detecção incremental de recorrências: só o histórico das descrições que chegaram neste extrato é analisado
+    resultado["recorrencias"] = recorrencia_service.detectar_recorrencias(id_usuario, descricoes=resultado.pop("descricoes"))
+
+    print(f"Importação finalizada: {resultado['novas']} novas, {resultado['duplicatas']} duplicadas ignoradas.")
+    if resultado["recorrencias"]:
+        print(f"{len(resultado['recorrencias'])} possível(is) recorrência(s) encontrada(s).")
+    return resultado
+
+def importar_extrato_csv_em_partes(caminho_arquivo, id_conta, linhas_por_parte=50000):
+    """ Modo de importação em partes (streaming) para extratos muito grandes. O arquivo é lido em blocos de tamanho fixo,
+    cada bloco passa pelo mesmo processamento em lote de importar_extrato_csv e é gravado com commit próprio, então o uso de
+    memória não cresce com o tamanho do arquivo.
+    Depois de cada bloco, grava um checkpoint (hash do arquivo + posição em bytes) ao lado do arquivo: se a importação for
+    interrompida, chamar a função de novo com o mesmo arquivo retoma a partir do último bloco gravado.
+    É um gerador: a cada bloco gravado, entrega um dicionário com o progresso da importação. O dicionário do último bloco traz também
+    as recorrências sugeridas (chave "recorrencias"), detectadas uma única vez no fim com as descrições de todos os blocos.
+    Observação: os blocos são separados por linha, então o modo não suporta campos com quebra de linha entre aspas."""
+
+    caminho_checkpoint = f"{caminho_arquivo}.checkpoint.json"
+    hash_arquivo = calcular_hash_arquivo(caminho_arquivo)
+    total_bytes = os.path.getsize(caminho_arquivo)
+
+    db = SessionLocal()
+
+    try:
+        conta = db.query(Conta).filter_by(id_conta=id_conta).first()
+
+        if not conta:
+            print(f"Erro: Conta {id_conta} não encontrada!")
+            return
+
+        id_usuario = conta.id_usuario
+        id_cat_importada = obter_categoria_importado(db, id_usuario)
+        db.commit()
+
+        # checkpoint de uma importação anterior do mesmo arquivo, na mesma conta, que não terminou
+        checkpoint = ler_checkpoint(caminho_checkpoint)
+        if checkpoint and (checkpoint["hash_arquivo"] != hash_arquivo or checkpoint["id_conta"] != id_conta):
+            checkpoint = None
+
+        progresso = {
+            "linhas_processadas": checkpoint["linhas_processadas"] if checkpoint else 0,
+            "novas": checkpoint["novas"] if checkpoint else 0,
+            "duplicatas": checkpoint["duplicatas"] if checkpoint else 0,
+        }
+        mapa = checkpoint["mapa"] if checkpoint else None
+        descricoes = set(checkpoint.get("descricoes", [])) if checkpoint else set() # descrições normalizadas que chegaram no extrato
+        recorrencias = []
+
+        if checkpoint:
+            print(f"Retomando a importação a partir do byte {checkpoint['posicao']} ({progresso['linhas_processadas']} linhas já processadas)...")
+
+        with open(caminho_arquivo, "rb") as arquivo:
+            cabecalho = arquivo.readline()
+            if checkpoint:
+                arquivo.seek(checkpoint["posicao"])
+
+            linhas = list(itertools.islice(arquivo, linhas_por_parte))
+            while linhas:
+                df = pd.read_csv(io.BytesIO(cabecalho + b"".join(linhas)))
+
+                # o mapeamento de colunas é detectado no primeiro bloco e reaproveitado nos demais
+                if mapa is None:
+                    mapa = detectar_mapeamento_universal(df)
+
+                resultado = importar_lote(db, df, mapa, id_conta, id_usuario, id_cat_importada)
+                db.commit()
+                incrementar_versao(id_usuario, desde=resultado["desde"])
+
+                progresso["linhas_processadas"] += len(df)
+                progresso["novas"] += resultado["novas"]
+                progresso["duplicatas"] += resultado["duplicatas"]
+                descricoes |= resultado["descricoes"]
+                posicao = arquivo.tell()
+
+                gravar_checkpoint(caminho_checkpoint, {
+                    "hash_arquivo": hash_arquivo,
+                    "id_conta": id_conta,
+                    "posicao": posicao,
+                    "mapa": mapa,
+                    "descricoes": sorted(descricoes), # para a detecção de recorrências no fim, mesmo depois de uma retomada
+                    **progresso,
+                })
+
+                dados_progresso = {
+                    **progresso,
+                    "duplicatas_encontradas": resultado["duplicatas_encontradas"], # só as deste bloco
+                    "bytes_lidos": posicao,
+                    "total_bytes": total_bytes,
+                    "percentual": round(posicao / total_bytes * 100, 1) if total_bytes else 100.0,
+                }
+
+                # lê o próximo bloco antes de entregar este, para saber se este é o último
+                linhas = list(itertools.islice(arquivo, linhas_por_parte))
+                if not linhas:
+                    # detecção incremental de recorrências, uma vez para o extrato inteiro: só o histórico das descrições importadas é lido
+                    recorrencias = recorrencia_service.detectar_recorrencias(id_usuario, descricoes=descricoes)
+                    dados_progresso["recorrencias"] = recorrencias
+
+                yield dados_progresso
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro na importação em partes (o checkpoint permite retomar): {e}")
+        raise e
+
+    finally:
+        db.close()
+
+    # importação concluída: o checkpoint não é mais necessário
+    if os.path.exists(caminho_checkpoint):
+        os.remove(caminho_checkpoint)
+
+    print(f"Importação finalizada: {progresso['novas']} novas, {progresso['duplicatas']} duplicadas ignoradas.")
+    if recorrencias:
+        print(f"{len(recorrencias)} possível(is) recorrência(s) encontrada(s).")
+
+def calcular_hash_arquivo(caminho_arquivo, tamanho_bloco=1024 * 1024):
+    """Calcula o SHA-256 do arquivo lendo-o em blocos, sem carregá-lo inteiro na memória."""
+    sha = hashlib.sha256()
+    with open(caminho_arquivo, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def ler_checkpoint(caminho_checkpoint):
+    """Lê o checkpoint de uma importação em partes, se existir."""
+    if not os.path.exists(caminho_checkpoint):
+        return None
+    with open(caminho_checkpoint, "r", encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+def gravar_checkpoint(caminho_checkpoint, dados):
+    """Grava o checkpoint de forma atômica (arquivo temporário + os.replace), para que uma queda no meio da escrita não o corrompa."""
+    temporario = f"{caminho_checkpoint}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo)
+    os.replace(temporario, caminho_checkpoint)
+
+def obter_categoria_importado(db, id_usuario):
+    """ Retorna o id da categoria "Importado" do usuário, criando-a se ainda não existir. Ela é a categoria padrão das transações
+    importadas que não se encaixam em nenhuma regra, facilitando a identificação e a reclassificação posterior pelo usuário."""
+
     categoria_obj = db.query(Categoria).filter_by(nome="Importado", id_usuario=id_usuario).first() 
 
     # se a categoria "Importado" não for encontrada para o usuário, cria uma nova categoria com esse nome, cor neutra e ícone de download.
@@ -107,73 +278,221 @@ def importar_extrato_csv(caminho_arquivo, id_conta):
             cor_hex="#808080", 
             icone="download"
         )
-        categoria_obj.add_categoria()
+        db.add(categoria_obj)
+        db.flush()
         print(f"Categoria 'Importado' criada para o usuário {id_usuario}")
 
-    # armazena o id da categoria "Importado" para usar nas transações importadas, 
-    # garantindo que todas sejam associadas a essa categoria por padrão.
-    id_cat_importada = categoria_obj.id_categoria 
-    mapa = detectar_mapeamento_universal(df) # chama a função para detectar quais colunas do CSV correspondem a data, valor e descrição, e armazena o resultado no dicionário "mapa"
-    
-    print(f"Iniciando importação de {len(df)} transações...")
-    
-    for _, linha in df.iterrows(): # percorre cada linha do DataFrame usando iterrows(), que retorna o índice e a linha como uma série do Pandas. O "_" é usado para ignorar o índice, já que não precisamos dele nesse caso.
-        
-        data_proc = pd.to_datetime(linha[mapa['data']], dayfirst=True) # processa a data convertendo a string para um objeto datetime, assumindo formato dia/mês/ano (dayfirst=True)
-        valor_proc = abs(float(linha[mapa['valor']])) # processa o valor convertendo para float e usando o valor absoluto, já que o tipo (despesa ou receita) será determinado pelo sinal do valor original
-        desc_proc = str(linha[mapa['descricao']]) # processa a descrição convertendo para string, para garantir que seja do tipo correto ao comparar com o banco de dados
-        valor_original = float(linha[mapa['valor']]) # mantém o valor original com sinal para determinar o tipo da transação (despesa ou receita)
-
-        if detectar_duplicata(db, data_proc, valor_proc, desc_proc, id_usuario): # chama a função para detectar se a transação já existe 
-            # no banco de dados, passando a data processada, valor processado, descrição processada e id do usuário como argumentos. 
-            # Se a função retornar True, significa que é uma duplicata.
-            
-            contador_duplicatas += 1 # incrementa o contador de duplicatas, já que essa transação não será importada
-            continue
-
-        # LÓGICA DO TIPO: Se for negativo é despesa, se for positivo é crédito
-        tipo_calculado = "despesa" if valor_original < 0 else "receita"
-    
-        # mantém o valor positivo, já que o tipo da transação (despesa ou receita) é determinado separadamente pela variável tipo_calculado. 
-        # Isso garante que o valor seja armazenado de forma consistente no banco de dados, independentemente do sinal original no CSV.
-        valor_final = abs(valor_original) 
-
-        # chama a função para sugerir uma tag com base na descrição do CSV, passando a descrição processada e o id do usuário como argumentos.
-        tag_sugerida = sugerir_tag_inteligente(str(linha[mapa['descricao']]), id_usuario) 
-
-        # cria uma nova instância da classe Transacao usando os dados processados e calculados, incluindo o valor final, tipo calculado, 
-        # data processada, descrição processada, id da conta, id do usuário, tag sugerida (ou "Geral" se nenhuma sugestão for encontrada), 
-        # e outros atributos necessários para criar a transação no banco de dados.
-        nova_t = Transacao(
-            valor=valor_final,
-            tipo=tipo_calculado,
-            data=pd.to_datetime(linha[mapa['data']], dayfirst=True),
-            descricao=str(linha[mapa['descricao']]),
-            id_conta=id_conta,
-            id_usuario=id_usuario,
-            tag=tag_sugerida or "Geral",  # Preenche a tag
-            id_categoria=id_cat_importada,  
-            id_subcategoria=None,         # Subcategoria pode ser determinada posteriormente pelo usuário, ou por regras adicionais, mas inicialmente deixamos como None
-            local="N/A",                  # O local geralmente não está presente em extratos bancários, então podemos preencher com "N/A" ou deixar como None, dependendo da estrutura da classe Transacao. Aqui optamos por "N/A" para indicar que a informação não está disponível.
-            tipo_registro="comum"         # Definimos o tipo_registro como "comum" para indicar que essa transação é do tipo padrão, e não uma transação recorrente ou de outro tipo específico. Isso é importante para o mapeamento polimórfico definido na classe Transacao, onde o campo tipo_registro é usado para diferenciar entre diferentes tipos de transações.
+    return categoria_obj.id_categoria
+
+def importar_lote(db, df, mapa, id_conta, id_usuario, id_cat_importada):
+    """ Processa um DataFrame de extrato já mapeado e grava as transações novas na sessão recebida (o commit fica com quem chamou).
+    Retorna os contadores de transações novas e duplicadas do lote, as duplicatas encontradas no banco (com a pontuação de
+    similaridade) e a data mais antiga gravada (desde)."""
+
+    df_norm, invalidas = normalizar_extrato(df, mapa)
+    if invalidas:
+        print(f"{invalidas} linha(s) sem data ou valor válidos foram descartadas.")
+
+    df_novas, duplicatas, encontradas = remover_duplicatas(db, df_norm, id_usuario, id_conta)
+
+    if not df_novas.empty:
+        df_novas = categorizar_lote(db, df_novas, id_usuario, id_cat_importada)
+        inserir_lote(db, df_novas, id_conta, id_usuario)
+
+    return {"novas": len(df_novas), "duplicatas": duplicatas, "duplicatas_encontradas": encontradas,
+            "descricoes": set(df_novas["descricao_normalizada"]),
+            "desde": df_novas["data"].min().date() if not df_novas.empty else None}
+
+def normalizar_extrato(df, mapa):
+    """ Converte as colunas mapeadas do extrato de uma vez só (data, valor e descrição) e calcula o tipo de cada transação.
+    Retorna o DataFrame normalizado e a quantidade de linhas descartadas por não terem data ou valor válidos."""
+
+    df_norm = pd.DataFrame({
+        "data": pd.to_datetime(df[mapa['data']], dayfirst=True, errors="coerce").astype("datetime64[ns]"), # datas no formato dia/mês/ano
+        "valor_original": pd.to_numeric(df[mapa['valor']], errors="coerce"), # valor com sinal, usado para determinar o tipo
+        "descricao": df[mapa['descricao']].astype(str),
+    })
+    df_norm["descricao_normalizada"] = normalizar_descricoes(df_norm["descricao"]) # mesma regra do Transacao.descricao_normalizada
+
+    total = len(df_norm)
+    df_norm = df_norm.dropna(subset=["data", "valor_original"])
+
+    # LÓGICA DO TIPO: Se for negativo é despesa, se for positivo é crédito. O valor gravado é sempre positivo.
+    df_norm["tipo"] = np.where(df_norm["valor_original"] < 0, TipoTransacao.DESPESA.value, TipoTransacao.RECEITA.value)
+    df_norm["valor"] = df_norm["valor_original"].abs()
+
+    return df_norm, total - len(df_norm)
+
+def remover_duplicatas(db, df_norm, id_usuario, id_conta):
+    """ Remove as transações que já existem no banco e as repetidas dentro do próprio arquivo, com uma única consulta aos lançamentos
+    da conta na janela de datas do lote (± JANELA_DIAS), no índice ix_transacoes_conta_data:
+    - a comparação é aproximada (utils/deduplicacao.py): os lançamentos viram um índice em memória por (centavos, tipo, dia) e cada
+      linha do extrato procura só nos blocos vizinhos um lançamento de descrição parecida (data deslocada, descrição truncada ou
+      com outro espaçamento);
+    - a mesma impressão digital canônica (Transacao.calcular_impressao_digital) continua sendo duplicata, mesmo com o tipo trocado;
+    - o mesmo hash_unico (coluna UNIQUE) é sempre duplicata, e casa antes da comparação aproximada: senão uma linha parecida do
+      extrato poderia ficar com o lançamento e a linha idêntica a ele seria inserida, violando a unicidade e desfazendo o lote.
+    A impressão digital e o hash_unico de cada linha ficam nas colunas "impressao_digital" e "hash_unico" do DataFrame retornado,
+    para o inserir_lote.
+    Retorna o DataFrame só com as novas, a quantidade de duplicatas e a lista das duplicatas encontradas no banco, com a
+    pontuação de cada uma."""
+
+    chaves = ["data", "valor", "descricao"]
+    total = len(df_norm)
+
+    # duplicatas dentro do próprio arquivo: a primeira ocorrência é importada e as demais contam como duplicadas. A descrição original
+    # é a chave aqui: linhas que só diferem em maiúsculas ou espaços no mesmo arquivo são lançamentos distintos do extrato.
+    df_unicas = df_norm.drop_duplicates(subset=chaves)
+
+    if df_unicas.empty:
+        return df_unicas.assign(impressao_digital=[], hash_unico=[]), total, []
+
+    df_unicas = df_unicas.assign(
+        impressao_digital=[Transacao.calcular_impressao_digital(id_conta, valor, data, descricao)
+                           for valor, data, descricao in zip(df_unicas["valor"], df_unicas["data"], df_unicas["descricao"])],
+        hash_unico=[Transacao.gerar_hash_estatico(valor, data, descricao, LOCAL_EXTRATO, id_conta)
+                    for valor, data, descricao in zip(df_unicas["valor"], df_unicas["data"], df_unicas["descricao"])])
+
+    inicio, fim = janela_de_busca(df_unicas["data"].min().to_pydatetime(), df_unicas["data"].max().to_pydatetime())
+    gravados = db.query(Transacao.id_transacao, Transacao.data, Transacao.valor, Transacao.tipo, Transacao.descricao,
+                        Transacao.descricao_normalizada, Transacao.impressao_digital, Transacao.hash_unico)\
+        .filter(Transacao.id_conta == id_conta, Transacao.data.between(inicio, fim)).all()
+
+    encontradas = []
+    if gravados:
+        indice = IndiceDuplicatas((id_transacao, data, valor, TipoTransacao(tipo).value, normalizada or normalizar_descricao(descricao))
+                                  for id_transacao, data, valor, tipo, descricao, normalizada, _, _ in gravados)
+        # cada lançamento gravado casa com no máximo uma linha do extrato, pelo hash_unico, pelo índice aproximado ou pela impressão
+        # digital: ao casar por um caminho, ele sai dos outros
+        impressoes, impressao_do_id = {}, {}
+        for id_transacao, _, _, _, descricao, _, impressao, _ in gravados:
+            if impressao:
+                impressoes.setdefault(impressao, []).append((id_transacao, descricao))
+                impressao_do_id[id_transacao] = impressao
+        hashes = {hash_unico: (id_transacao, descricao) for id_transacao, _, _, _, descricao, _, _, hash_unico in gravados if hash_unico}
+
+        novas = np.ones(len(df_unicas), dtype=bool)
+        datas, valores, descricoes = df_unicas["data"].tolist(), df_unicas["valor"].tolist(), df_unicas["descricao"].tolist()
+
+        def casar(posicao, achado):
+            id_transacao, descricao_gravada, pontuacao, dias = achado
+            indice.retirar(id_transacao)
+            if id_transacao in impressao_do_id:
+                candidatos = impressoes[impressao_do_id.pop(id_transacao)]
+                candidatos[:] = [item for item in candidatos if item[0] != id_transacao]
+            novas[posicao] = False
+            encontradas.append({"data": datas[posicao].to_pydatetime(), "valor": valores[posicao], "descricao": descricoes[posicao],
+                                "id_transacao": id_transacao, "descricao_gravada": descricao_gravada,
+                                "similaridade": round(pontuacao, 3), "dias": dias})
+
+        # 1. mesmo hash_unico: o lançamento idêntico já está gravado (e uma nova inserção violaria a unicidade)
+        for posicao, hash_unico in enumerate(df_unicas["hash_unico"]):
+            if hash_unico in hashes:
+                casar(posicao, (*hashes[hash_unico], 1.0, 0))
+
+        # 2. as demais linhas: comparação aproximada e, sem candidato parecido, a impressão digital
+        linhas = zip(df_unicas["tipo"], df_unicas["descricao_normalizada"], df_unicas["impressao_digital"])
+        for posicao, (tipo, normalizada, impressao) in enumerate(linhas):
+            if not novas[posicao]:
+                continue
+            achado = indice.procurar(datas[posicao], valores[posicao], tipo, normalizada)
+            if achado is None and impressoes.get(impressao):
+                achado = (*impressoes[impressao][0], 1.0, 0)
+            if achado:
+                casar(posicao, achado)
+
+        df_unicas = df_unicas[novas]
+
+    return df_unicas, total - len(df_unicas), encontradas
+
+def categorizar_lote(db, df_novas, id_usuario, id_cat_importada):
+    """ Categoriza todas as transações do lote de uma vez. As regras do usuário (RegraTag) definem categoria e subcategoria,
+    usando o autômato de palavras-chave em cache; as que não casam com nenhuma regra ficam na categoria "Importado".
+    A tag vem do histórico do usuário: a tag mais frequente entre as transações cujos 10 primeiros caracteres da descrição coincidem."""
+
+    df_novas = df_novas.copy()
+    chaves_desc = df_novas["descricao"].str.upper()
+
+    # 1. REGRAS: o autômato compilado das regras do usuário classifica todas as descrições em uma única passada
+    regras = RegraTag.classificar_lote(chaves_desc.tolist(), id_usuario)
+
+    df_novas["id_categoria"] = [regra.id_categoria if regra else id_cat_importada for regra in regras]
+    df_novas["id_subcategoria"] = [regra.id_subcategoria if regra else None for regra in regras]
+
+    # 2. HISTÓRICO: tag mais frequente por prefixo de 10 caracteres, com uma única consulta agrupada
+    prefixo = func.upper(func.substr(Transacao.descricao, 1, 10))
+    historico = db.query(prefixo.label("prefixo"), Transacao.tag, func.count(Transacao.id_transacao).label("qtd")).filter(
+        Transacao.id_usuario == id_usuario,
+        Transacao.tag != None
+    ).group_by(prefixo, Transacao.tag).all()
+
+    tags = {}
+    if historico:
+        df_hist = pd.DataFrame(historico, columns=["prefixo", "tag", "qtd"]).sort_values("qtd", ascending=False)
+        tags = df_hist.drop_duplicates("prefixo").set_index("prefixo")["tag"].to_dict()
+
+    df_novas["tag"] = chaves_desc.str.slice(0, 10).map(tags).fillna("Geral")
+
+    return df_novas
+
+def inserir_lote(db, df_novas, id_conta, id_usuario):
+    """ Insere todas as transações do lote com um único INSERT em massa (executemany) e aplica o efeito agregado no saldo
+    materializado da conta. Tudo acontece na sessão recebida, dentro da mesma transação do banco."""
+
+    datas = df_novas["data"].astype(object).tolist() # Timestamps do pandas (subclasse de datetime)
+    valores = df_novas["valor"].tolist()
+    descricoes = df_novas["descricao"].tolist()
+    hoje = date.today()
+
+    registros = [
+        {
+            "valor": valor,
+            "tipo": TipoTransacao(tipo),
+            "data": data,
+            "descricao": descricao,
+            "descricao_normalizada": descricao_normalizada,
+            "local": LOCAL_EXTRATO,
+            "id_conta": id_conta,
+            "id_usuario": id_usuario,
+            "tag": tag,
+            "id_categoria": None if pd.isna(id_categoria) else int(id_categoria),
+            "id_subcategoria": None if pd.isna(id_subcategoria) else int(id_subcategoria),
+            "tipo_registro": TipoRegistro.COMUM,
+            "data_inicio": hoje,
+            "hash_unico": hash_unico, # calculados em remover_duplicatas
+            "impressao_digital": impressao_digital,
+        }
+        for valor, tipo, data, descricao, descricao_normalizada, hash_unico, impressao_digital, tag, id_categoria, id_subcategoria in zip(
+            valores, df_novas["tipo"], datas, descricoes, df_novas["descricao_normalizada"], df_novas["hash_unico"], df_novas["impressao_digital"],
+            df_novas["tag"], df_novas["id_categoria"], df_novas["id_subcategoria"]
         )
-        
-        # chama o método add_transacao() da nova transação para salvar a transação no banco de dados, e incrementa o contador de novas transações importadas.
-        nova_t.add_transacao()
-        contador_novas += 1
-    
-    db.close()
-    print(f"Importação finalizada: {contador_novas} novas, {contador_duplicatas} duplicadas ignoradas.")
+    ]
+
+    db.execute(insert(Transacao.__table__), registros) # INSERT do Core: evita o custo de montar objetos ORM para cada linha
+
+    # o INSERT do Core não dispara os eventos do ORM, então os agregados mensais recebem o lote já somado por mês e categoria
+    aplicar_deltas(db.connection(), deltas_de_registros(registros))
+
+    # todas as transações importadas são quitadas: receitas somam e despesas subtraem, então o efeito no saldo é a soma dos valores com sinal
+    # (somada em centavos, sem o erro de arredondamento de somar milhares de floats).
+    saldo_service.aplicar_delta_no_saldo(db, id_conta, reais(int(centavos_array(df_novas["valor_original"]).sum())), df_novas["data"].max().date())
+
+    # gatilhos da conta e do orçamento de cada categoria e mês que receberam despesas, avaliados uma vez para o lote inteiro
+    alerta_service.avaliar(db, id_usuario, [id_conta], {(r["id_categoria"], r["data"]) for r in registros if r["tipo"] == TipoTransacao.DESPESA})
 
 def detectar_duplicata(db, data, valor, descricao, id_usuario): 
     """função para detectar se a transação já existe no banco de dados, comparando data, valor, descrição e id do usuário. 
-    Retorna True se encontrar uma transação similar, ou seja, é uma duplicata."""
-    return db.query(Transacao).filter(
-        Transacao.data == data,
-        Transacao.valor == valor,
-        Transacao.descricao == descricao,
-        Transacao.id_usuario == id_usuario
-    ).first() is not None
+    Retorna True se encontrar uma transação similar, ou seja, é uma duplicata.
+    Usa a mesma comparação aproximada da importação (utils/deduplicacao.py), sobre os lançamentos do usuário com o mesmo valor
+    em até JANELA_DIAS dias (uma consulta no índice ix_transacoes_usuario_data)."""
+    inicio, fim = janela_de_busca(data, data)
+    gravados = db.query(Transacao.id_transacao, Transacao.data, Transacao.valor, Transacao.descricao_normalizada).filter(
+        Transacao.id_usuario == id_usuario,
+        Transacao.data.between(inicio, fim)
+    ).all()
+
+    indice = IndiceDuplicatas((id_transacao, data_t, valor_t, None, normalizada) for id_transacao, data_t, valor_t, normalizada in gravados)
+    return indice.procurar(data, valor, None, normalizar_descricao(descricao)) is not None
 
 
 # if __name__ == "__main__":
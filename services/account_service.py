@@ -1,6 +1,8 @@
 from classes.contas import Conta, SubtipoConta, TipoInstituicao, Conta_Corrente, Conta_Cartao
 from classes.transacoes import Transacao
 from database.config import SessionLocal
+from utils.cache import incrementar_versao
+from services import agregado_service, alerta_service
 
 def cadastrar_conta(id_usuario, 
                     nome_conta, 
@@ -95,14 +97,21 @@ def editar_conta(id_conta,
                 if campo == 'tipo_instituicao' and isinstance(valor, str):
                     valor = TipoInstituicao(valor.lower().strip())
 
+                # o saldo materializado acompanha a mudança do saldo inicial
+                if campo == 'saldo_inicial':
+                    conta.saldo_materializado = (conta.saldo_materializado or 0.0) + ((valor or 0.0) - (conta.saldo_inicial or 0.0))
+
                 setattr(conta, campo, valor)
-        
-        conta.salvar()
+
+        # limites, cheque especial e saldo inicial mudam os gatilhos da conta: eles são reavaliados no commit (classes/alertas.py)
+        db.commit()
+        incrementar_versao(conta.id_usuario) # os resultados em cache do usuário deixam de valer
 
         print(f"Conta {conta.nome_conta} atualizada com sucesso!")
         return True
     
     except Exception as e:
+        db.rollback()
         print (f"Erro ao tentar alterar a conta solicitada: {e}")
         return False
     
@@ -132,13 +141,17 @@ def deletar_conta_e_historico(id_conta,
                 print(f"ATENÇÃO: Essa conta possui {total_transacoes} no histórico. Tem certeza que quer deletar a conta e todas as transações nela?")
                 return {"status": "request_confirmation", "total": total_transacoes}
             
-            # se confirmado, deletamos as transações primeiro:
+            # se confirmado, deletamos as transações primeiro (retirando-as dos agregados mensais, já que a remoção em massa não passa pelo ORM):
+            agregado_service.retirar_transacoes(db, Transacao.id_conta == id_conta)
             db.query(Transacao).filter_by(id_conta=id_conta).delete()
             print(f"{total_transacoes} removidas.")
 
-        # deleta a conta:
-        conta.deletar()
+        # deleta a conta (na mesma sessão em que ela foi carregada, junto com o histórico; os alertas dela saem no after_delete da conta):
+        db.delete(conta)
+        db.flush()
+        alerta_service.reavaliar_usuario(db, conta.id_usuario) # o histórico removido pode ter mudado o orçamento das categorias
         db.commit()
+        incrementar_versao(conta.id_usuario)
         print(f"Conta{id_conta} e seu hisórico foram apagados.")
         return {"status":"success"}
     
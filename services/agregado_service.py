@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, delete, insert, select, literal_column
+from classes.agregados import AgregadoMensal, aplicar_deltas, inicio_do_mes
+from classes.transacoes import Transacao
+from database.config import SessionLocal
+from utils.cache import incrementar_versao
+from utils.dinheiro import centavos, reais
+
+# colunas pelas quais os totais de um período podem ser agrupados
+AGRUPAMENTOS_VALIDOS = ("id_categoria", "id_subcategoria", "tipo", "id_usuario")
+
+
+def _mes_da_transacao():
+    # primeiro dia do mês da transação, calculado no SQLite (mesmo formato 'AAAA-MM-01' gravado pela coluna Date)
+    return func.date(Transacao.data, "start of month")
+
+
+def consulta_reconstrucao(id_usuario=None):
+    """ Monta o INSERT ... SELECT que recalcula os agregados a partir das transações, em uma única passada no banco."""
+
+    selecao = select(
+        Transacao.id_usuario,
+        _mes_da_transacao(),
+        func.coalesce(Transacao.id_categoria, 0),
+        func.coalesce(Transacao.id_subcategoria, 0),
+        Transacao.tipo,
+        func.sum(Transacao.valor),
+        func.count()
+    ).where(Transacao.id_usuario != None, Transacao.tipo != None, Transacao.data != None)\
+     .group_by(Transacao.id_usuario, literal_column("2"), literal_column("3"), literal_column("4"), Transacao.tipo)
+
+    if id_usuario is not None:
+        selecao = selecao.where(Transacao.id_usuario == id_usuario)
+
+    return insert(AgregadoMensal).from_select(
+        ["id_usuario", "mes", "id_categoria", "id_subcategoria", "tipo", "total", "quantidade"], selecao
+    )
+
+
+def reconstruir_agregados(id_usuario=None, conexao=None):
+    """ Comando de reconstrução completa: apaga os agregados (de um usuário ou de todos) e os recalcula a partir das transações.
+    Recebe opcionalmente uma conexão já aberta (usada pelas migrações); sem ela, abre a própria sessão e faz o commit."""
+
+    comando_remocao = delete(AgregadoMensal)
+    if id_usuario is not None:
+        comando_remocao = comando_remocao.where(AgregadoMensal.id_usuario == id_usuario)
+
+    if conexao is not None:
+        conexao.execute(comando_remocao)
+        conexao.execute(consulta_reconstrucao(id_usuario))
+        return
+
+    db = SessionLocal()
+    try:
+        db.execute(comando_remocao)
+        db.execute(consulta_reconstrucao(id_usuario))
+        db.commit()
+        incrementar_versao(id_usuario)
+        print("Agregados mensais reconstruídos com sucesso.")
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao reconstruir os agregados mensais: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+
+def retirar_transacoes(db, *filtros):
+    """ Retira dos agregados as transações que atendem aos filtros, antes de uma remoção em massa pelo Core
+    (ex.: db.query(Transacao).filter(...).delete()), que não dispara os eventos do ORM."""
+
+    linhas = db.query(
+        Transacao.id_usuario,
+        _mes_da_transacao(),
+        func.coalesce(Transacao.id_categoria, 0),
+        func.coalesce(Transacao.id_subcategoria, 0),
+        Transacao.tipo,
+        func.sum(Transacao.valor),
+        func.count()
+    ).filter(Transacao.id_usuario != None, Transacao.tipo != None, Transacao.data != None, *filtros)\
+     .group_by(Transacao.id_usuario, literal_column("2"), literal_column("3"), literal_column("4"), Transacao.tipo).all()
+
+    deltas = {}
+    for id_usuario, mes, id_cat, id_sub, tipo, total, quantidade in linhas:
+        chave = (id_usuario, datetime.strptime(mes, "%Y-%m-%d").date(), id_cat, id_sub, tipo)
+        deltas[chave] = (-(total or 0.0), -quantidade)
+
+    aplicar_deltas(db.connection(), deltas)
+
+
+def _limites_meses_completos(inicio, fim):
+    # devolve (primeiro mês completo, mês de fim exclusivo): os meses m com primeiro_mes <= m < mes_final estão inteiros no período.
+    # o início e o fim do período (bordas) ficam fora desse intervalo e são lidos das transações.
+    primeiro_mes = inicio_do_mes(inicio)
+    if datetime.combine(primeiro_mes, datetime.min.time()) < inicio:
+        primeiro_mes = inicio_do_mes(primeiro_mes + timedelta(days=32))
+
+    mes_final = inicio_do_mes(fim)
+    return primeiro_mes, mes_final
+
+
+def somar_periodo(db, id_usuario, inicio=None, fim=None, agrupar_por=("id_categoria",), tipos=None):
+    """ Soma as transações do usuário entre inicio e fim (inclusivos, como o between das consultas do data_provider), agrupando
+    pelas colunas pedidas. Os meses inteiros do período vêm dos agregados mensais e só as bordas (dias soltos no começo e no fim)
+    são lidas das transações, então um relatório de cinco anos lê ~60 linhas por categoria.
+    Retorna {tupla com os valores de agrupar_por: [total, quantidade]}. Transações sem categoria/subcategoria aparecem com id 0.
+    id_usuario também pode ser uma lista de usuários (ex.: os membros de uma família); agrupando por "id_usuario", cada membro
+    aparece em linhas próprias, na mesma consulta."""
+
+    if any(coluna not in AGRUPAMENTOS_VALIDOS for coluna in agrupar_por):
+        raise ValueError(f"Agrupamento inválido: {agrupar_por}. Opções: {AGRUPAMENTOS_VALIDOS}")
+
+    colunas_transacao = {
+        "id_categoria": func.coalesce(Transacao.id_categoria, 0),
+        "id_subcategoria": func.coalesce(Transacao.id_subcategoria, 0),
+        "tipo": Transacao.tipo,
+        "id_usuario": Transacao.id_usuario,
+    }
+
+    # um único usuário ou uma lista deles (ex.: os membros de uma família)
+    if isinstance(id_usuario, (list, tuple, set)):
+        filtro_transacoes = Transacao.id_usuario.in_(list(id_usuario))
+        filtro_agregados = AgregadoMensal.id_usuario.in_(list(id_usuario))
+    else:
+        filtro_transacoes = Transacao.id_usuario == id_usuario
+        filtro_agregados = AgregadoMensal.id_usuario == id_usuario
+
+    resultado = defaultdict(lambda: [0, 0]) # totais em centavos enquanto as partes (meses e bordas) são somadas
+
+    def acumular(linhas):
+        for *chave, total, quantidade in linhas:
+            resultado[tuple(chave)][0] += centavos(total or 0)
+            resultado[tuple(chave)][1] += quantidade
+
+    def em_reais():
+        return {chave: [reais(total), quantidade] for chave, (total, quantidade) in resultado.items()}
+
+    def somar_transacoes(*filtros):
+        colunas = [colunas_transacao[c] for c in agrupar_por]
+        consulta = db.query(*colunas, func.sum(Transacao.valor), func.count()).filter(filtro_transacoes, *filtros)
+        if tipos:
+            consulta = consulta.filter(Transacao.tipo.in_(tipos))
+        acumular(consulta.group_by(*colunas).all())
+
+    def somar_agregados(*filtros):
+        colunas = [getattr(AgregadoMensal, c) for c in agrupar_por]
+        consulta = db.query(*colunas, func.sum(AgregadoMensal.total), func.sum(AgregadoMensal.quantidade))\
+            .filter(filtro_agregados, *filtros)
+        if tipos:
+            consulta = consulta.filter(AgregadoMensal.tipo.in_(tipos))
+        acumular(consulta.group_by(*colunas).all())
+
+    if inicio is None or fim is None:
+        # sem período: todo o histórico está nos agregados
+        somar_agregados()
+        return em_reais()
+
+    primeiro_mes, mes_final = _limites_meses_completos(inicio, fim)
+
+    if primeiro_mes >= mes_final:
+        # período menor que um mês completo: lemos direto das transações
+        somar_transacoes(Transacao.data.between(inicio, fim))
+        return em_reais()
+
+    inicio_meses = datetime.combine(primeiro_mes, datetime.min.time())
+    fim_meses = datetime.combine(mes_final, datetime.min.time())
+
+    somar_agregados(AgregadoMensal.mes >= primeiro_mes, AgregadoMensal.mes < mes_final)
+    somar_transacoes(Transacao.data >= inicio, Transacao.data < inicio_meses) # borda inicial
+    somar_transacoes(Transacao.data >= fim_meses, Transacao.data <= fim)      # borda final
+
+    return em_reais()
+
+
+if __name__ == "__main__":
+    reconstruir_agregados()
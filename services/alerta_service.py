@@ -0,0 +1,207 @@
+from datetime import date, datetime
+from sqlalchemy import func, tuple_
+from classes.alertas import Alerta
+from classes.agregados import AgregadoMensal, inicio_do_mes
+from classes.categorias import Categoria
+from classes.contas import Conta
+from classes.transacoes import TipoTransacao
+from database.config import SessionLocal
+from services import saldo_service, fatura_service
+from utils.cache import incrementar_versao
+
+# Motor de alertas: os gatilhos são avaliados na própria transação do banco de cada escrita, só para o que a escrita pode ter
+# mudado (a conta da transação e o orçamento da categoria no mês dela), e o resultado fica gravado na tabela alertas.
+# As escritas do ORM (transações, limites das contas e das categorias, por qualquer caminho: services, CRUDMixin, scripts) são
+# reavaliadas automaticamente no commit da sessão (eventos em classes/alertas.py); as escritas em massa pelo Core chamam avaliar.
+# Quem lê os alertas (data_provider.rastreador_gatilhos e o painel) faz uma única consulta indexada, sem recalcular saldos.
+# Situações que mudam sem escrita (transações futuras que passam a contar com a virada do dia) são reavaliadas quando os saldos
+# vencidos são consolidados (data_provider._carregar_contas).
+
+TIPOS_ALERTA_CONTA = ("limite_seguranca", "cheque_especial", "limite_cartao")
+TIPOS_ALERTA = TIPOS_ALERTA_CONTA + ("orcamento_categoria",)
+
+LIMIAR_USO_CARTAO = 0.8 # fração do limite do cartão a partir da qual o uso gera alerta
+
+#region GATILHOS
+def gatilhos_da_conta(conta, saldo, utilizado_cartao=None):
+    """ Gatilhos que valem para a conta com o saldo informado: lista de (tipo, mensagem, valor em reais, percentual de uso ou None).
+    utilizado_cartao é o valor pendente
+    do cartão (fatura_service); sem ele, o uso do limite do cartão não é verificado. Regras:
+    - limite de segurança: saldo positivo, mas abaixo do limite estipulado (quando maior que 0);
+    - cheque especial: saldo negativo em conta com cheque especial, com o percentual usado;
+    - limite do cartão: LIMIAR_USO_CARTAO ou mais do limite comprometido."""
+
+    gatilhos = []
+
+    limite = conta.limite_seguranca or 0
+    if limite > 0 and 0 < saldo < limite:
+        gatilhos.append(("limite_seguranca",
+                         f"Atenção! O saldo da conta {conta.nome_conta} está abaixo do limite estipulado de R${limite:.2f}.", saldo, None))
+
+    cheque = conta.cheque_especial or 0
+    if cheque > 0 and saldo < 0:
+        percentual_uso = (abs(saldo) / cheque) * 100
+        gatilhos.append(("cheque_especial",
+                         f"Alerta: Você está usando {percentual_uso:.1f}% do seu cheque especial na conta {conta.nome_conta}.", abs(saldo), percentual_uso))
+
+    limite_cartao = conta.limite or 0
+    if conta.tipo_conta == "cartao" and utilizado_cartao is not None and limite_cartao > 0 and utilizado_cartao >= LIMIAR_USO_CARTAO * limite_cartao:
+        percentual_uso = utilizado_cartao / limite_cartao * 100
+        gatilhos.append(("limite_cartao",
+                         f"Atenção! Você já comprometeu {percentual_uso:.1f}% do limite do cartão {conta.nome_conta}.", utilizado_cartao, percentual_uso))
+
+    return gatilhos
+
+def _gatilho_orcamento(nome_categoria, limite, gasto, mes):
+    if limite and limite > 0 and gasto > limite:
+        return ("orcamento_categoria",
+                f"Alerta: os gastos com {nome_categoria} em {mes:%m/%Y} (R${gasto:.2f}) passaram do limite mensal de R${limite:.2f}.", gasto,
+                gasto / limite * 100)
+    return None
+#endregion
+
+#region AVALIAÇÃO INCREMENTAL
+def _avaliar_contas(db, ids_conta):
+    # {chave: (tipo, mensagem, valor, percentual, id_conta, id_categoria, referencia) ou None} para as contas informadas: o saldo de todas sai
+    # de saldos_em_lote e o uso dos cartões de uma única consulta do fatura_service.
+    contas = db.query(Conta.id_conta, Conta.nome_conta, Conta.tipo_conta, Conta.limite_seguranca, Conta.cheque_especial,
+                      Conta.limite, Conta.fechamento_cartao, Conta.vencimento_cartao)\
+        .filter(Conta.id_conta.in_(ids_conta)).all()
+    if not contas:
+        return {}
+
+    saldos = saldo_service.saldos_em_lote(db, [c.id_conta for c in contas])
+    cartoes = fatura_service.resumir_cartoes(db, [c for c in contas if c.tipo_conta == "cartao" and c.limite], ciclos_anteriores=0)
+
+    avaliados = {}
+    for c in contas:
+        # toda chave de conta avaliada entra no resultado: as que não dispararam (None) desativam um alerta anterior
+        for tipo in TIPOS_ALERTA_CONTA:
+            avaliados[f"{tipo}:{c.id_conta}"] = None
+
+        resumo = cartoes.get(c.id_conta)
+        for tipo, mensagem, valor, percentual in gatilhos_da_conta(c, saldos[c.id_conta], resumo.utilizado if resumo else None):
+            avaliados[f"{tipo}:{c.id_conta}"] = (tipo, mensagem, valor, percentual, c.id_conta, None, None)
+
+    return avaliados
+
+def _avaliar_orcamentos(db, id_usuario, categorias):
+    # mesmo formato de _avaliar_contas para os pares (id_categoria, mês): o gasto do mês vem dos agregados mensais (uma linha por
+    # subcategoria), não das transações.
+    categorias = {(id_categoria, inicio_do_mes(mes)) for id_categoria, mes in categorias if id_categoria}
+    if not categorias:
+        return {}
+
+    limites = {id_categoria: (nome, limite) for id_categoria, nome, limite in db.query(
+        Categoria.id_categoria, Categoria.nome, Categoria.limite_gastos_mensal)
+        .filter(Categoria.id_categoria.in_({id_categoria for id_categoria, _ in categorias}), Categoria.limite_gastos_mensal > 0).all()}
+    categorias = {(id_categoria, mes) for id_categoria, mes in categorias if id_categoria in limites}
+    if not categorias:
+        return {}
+
+    gastos = dict(((id_categoria, mes), total) for id_categoria, mes, total in db.query(
+        AgregadoMensal.id_categoria, AgregadoMensal.mes, func.sum(AgregadoMensal.total))
+        .filter(AgregadoMensal.id_usuario == id_usuario,
+                AgregadoMensal.tipo == TipoTransacao.DESPESA,
+                tuple_(AgregadoMensal.id_categoria, AgregadoMensal.mes).in_(list(categorias)))
+        .group_by(AgregadoMensal.id_categoria, AgregadoMensal.mes).all())
+
+    avaliados = {}
+    for id_categoria, mes in categorias:
+        nome, limite = limites[id_categoria]
+        gatilho = _gatilho_orcamento(nome, limite, gastos.get((id_categoria, mes), 0.0), mes)
+        avaliados[f"orcamento_categoria:{id_categoria}:{mes:%Y-%m}"] = (*gatilho, None, id_categoria, mes) if gatilho else None
+
+    return avaliados
+
+def _gravar(db, id_usuario, avaliados):
+    # aplica o resultado da avaliação na tabela: cria os alertas novos, atualiza os que continuam valendo, reativa (como não
+    # reconhecidos) os que voltaram a valer e desativa os que deixaram de valer. Uma consulta pelas chaves avaliadas.
+    if not avaliados:
+        return
+
+    existentes = {a.chave: a for a in db.query(Alerta).filter(Alerta.id_usuario == id_usuario, Alerta.chave.in_(list(avaliados))).all()}
+    agora = datetime.now()
+
+    for chave, gatilho in avaliados.items():
+        alerta = existentes.get(chave)
+
+        if gatilho is None:
+            if alerta is not None and alerta.ativo:
+                alerta.ativo = False
+            continue
+
+        tipo, mensagem, valor, percentual, id_conta, id_categoria, referencia = gatilho
+        if alerta is None:
+            db.add(Alerta(chave=chave, tipo=tipo, mensagem=mensagem, valor=valor, percentual=percentual, referencia=referencia, ativo=True,
+                          reconhecido=False, criado_em=agora, id_usuario=id_usuario, id_conta=id_conta, id_categoria=id_categoria))
+            continue
+
+        if not alerta.ativo:
+            # a situação tinha sido resolvida e voltou: é um alerta novo para o usuário
+            alerta.ativo, alerta.reconhecido, alerta.criado_em = True, False, agora
+        alerta.mensagem, alerta.valor, alerta.percentual = mensagem, valor, percentual
+
+    db.flush()
+
+def avaliar(db, id_usuario, ids_conta=(), categorias=()):
+    """ Reavalia os gatilhos afetados por uma escrita e grava o resultado na tabela alertas, na sessão recebida (o commit fica com
+    quem chamou, na mesma transação da escrita). Chamado no commit das escritas do ORM e diretamente pelas escritas em massa. ids_conta são as contas cujo saldo ou fatura mudou e categorias os pares
+    (id_categoria, data) das despesas gravadas, para o orçamento do mês de cada uma."""
+
+    avaliados = {}
+    if ids_conta:
+        avaliados.update(_avaliar_contas(db, list(set(ids_conta))))
+    if categorias:
+        avaliados.update(_avaliar_orcamentos(db, id_usuario, categorias))
+    _gravar(db, id_usuario, avaliados)
+
+def reavaliar_usuario(db, id_usuario, hoje=None):
+    """ Avaliação completa de um usuário: todas as contas e o orçamento do mês corrente de todas as categorias com limite.
+    Usada para preencher a tabela (migração) e depois de escritas amplas, como a remoção de uma conta com histórico."""
+
+    hoje = hoje or date.today()
+    ids_conta = [id_conta for (id_conta,) in db.query(Conta.id_conta).filter(Conta.id_usuario == id_usuario).all()]
+    ids_categoria = [id_categoria for (id_categoria,) in db.query(Categoria.id_categoria)
+                     .filter(Categoria.id_usuario == id_usuario, Categoria.limite_gastos_mensal > 0).all()]
+    avaliar(db, id_usuario, ids_conta, [(id_categoria, hoje) for id_categoria in ids_categoria])
+#endregion
+
+#region LEITURA E RECONHECIMENTO
+def consultar_pendentes(db, id_usuario, hoje=None):
+    """ Alertas ativos e ainda não reconhecidos do usuário, do mais recente para o mais antigo, com uma única consulta no índice
+    ix_alertas_usuario_pendentes. Os de orçamento de meses anteriores ficam de fora."""
+
+    mes_atual = inicio_do_mes(hoje or date.today())
+    return db.query(Alerta.id_alerta, Alerta.tipo, Alerta.mensagem, Alerta.valor, Alerta.percentual, Alerta.criado_em, Alerta.id_conta,
+                    Alerta.id_categoria)\
+        .filter(Alerta.id_usuario == id_usuario,
+                Alerta.ativo == True,
+                Alerta.reconhecido == False,
+                (Alerta.referencia == None) | (Alerta.referencia >= mes_atual))\
+        .order_by(Alerta.criado_em.desc()).all()
+
+def reconhecer_alerta(id_alerta):
+    """ Marca o alerta como reconhecido (dispensado pelo usuário). Ele só volta a aparecer se a situação deixar de valer e se repetir."""
+
+    db = SessionLocal()
+
+    try:
+        alerta = db.query(Alerta).filter_by(id_alerta=id_alerta).first()
+        if not alerta:
+            print(f"Alerta {id_alerta} não encontrado.")
+            return False
+
+        alerta.reconhecido = True
+        db.commit()
+        incrementar_versao(alerta.id_usuario) # os alertas em cache do usuário deixam de valer
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao reconhecer o alerta: {e}")
+        return False
+
+    finally:
+        db.close()
+#endregion
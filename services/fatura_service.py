@@ -0,0 +1,208 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_, func
+from classes.contas import Conta
+from classes.transacoes import Transacao, TipoTransacao, TipoRegistro
+from database.config import SessionLeitura
+from utils.dinheiro import centavos, reais
+
+# Ciclos de faturamento dos cartões: cada lançamento do cartão entra na fatura que fecha no próximo dia de fechamento
+# (inclusive) e é cobrado no primeiro dia de vencimento depois desse fechamento. Compras parceladas (TipoRegistro.PARCELADO,
+# com o número de parcelas na coluna quantidade) são divididas em parcelas, uma por ciclo, a partir do ciclo da compra.
+# Como no restante do app, os lançamentos de fatura são os que não são receitas, e "pendente" é o que ainda não foi quitado.
+
+CICLOS_ANTERIORES_PADRAO = 3 # quantos ciclos já vencidos aparecem no histórico de cada cartão
+
+# situação de cada fatura em relação a hoje
+STATUS_FATURA = ("paga", "vencida", "fechada", "aberta", "futura")
+
+#region ESTRUTURAS
+@dataclass(frozen=True)
+class Fatura:
+    id_conta: int
+    fechamento: date
+    vencimento: date
+    total: float            # tudo o que foi lançado no ciclo (inclusive as parcelas de compras anteriores)
+    pendente: float         # parte ainda não quitada
+    status: str             # um de STATUS_FATURA
+
+@dataclass(frozen=True)
+class ResumoCartao:
+    id_conta: int
+    nome: str
+    limite: float
+    utilizado: float                    # tudo o que ainda não foi quitado, inclusive as parcelas futuras (compromete o limite)
+    disponivel: float
+    utilizacao: Optional[float]         # utilizado / limite, ou None para cartões sem limite cadastrado
+    em_atraso: float                    # soma pendente das faturas vencidas
+    fatura_atual: Fatura                # fatura do ciclo em andamento (aberta)
+    proxima_fatura: Optional[Fatura]    # próxima fatura a pagar (fechada ou aberta, com valor pendente)
+    faturas: Tuple[Fatura, ...]         # faturas recentes, em aberto e futuras, em ordem de vencimento
+#endregion
+
+#region CICLOS
+def _dia_no_mes(ano, mes, dia):
+    # o dia pedido, limitado ao último dia do mês (fechamento no dia 31 cai em 30/04, por exemplo)
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+def _proximo_dia(data, dia, estritamente_depois=False):
+    # primeira data a partir de `data` (ou depois dela) que cai no dia do mês informado
+    candidata = _dia_no_mes(data.year, data.month, dia)
+    if candidata < data or (estritamente_depois and candidata == data):
+        ano, mes = (data.year + 1, 1) if data.month == 12 else (data.year, data.month + 1)
+        candidata = _dia_no_mes(ano, mes, dia)
+    return candidata
+
+def ciclo_da_compra(data_compra, fechamento, vencimento):
+    """ (data de fechamento, data de vencimento) da fatura em que entra um lançamento feito em data_compra no cartão com os
+    dias de fechamento e vencimento informados."""
+    data_compra = data_compra.date() if isinstance(data_compra, datetime) else data_compra
+    data_fechamento = _proximo_dia(data_compra, fechamento)
+    return data_fechamento, _proximo_dia(data_fechamento, vencimento, estritamente_depois=True)
+
+def vencimento_da_fatura(data_compra, fechamento, vencimento):
+    """ Data de vencimento da fatura em que entra uma compra no cartão."""
+    return ciclo_da_compra(data_compra, fechamento, vencimento)[1]
+
+def _ciclo_seguinte(ciclo, fechamento, vencimento):
+    # o ciclo que começa no dia seguinte ao fechamento do ciclo informado
+    return ciclo_da_compra(ciclo[0] + timedelta(days=1), fechamento, vencimento)
+
+def _tem_ciclo(conta):
+    return bool(conta.fechamento_cartao and conta.vencimento_cartao)
+
+def ciclo_atual(conta, hoje=None):
+    """ Ciclo em andamento do cartão (o que ainda não fechou). Cartões sem dias de fechamento e vencimento cadastrados têm um
+    único ciclo, que vence no próximo dia de vencimento (ou hoje, sem ele)."""
+    hoje = hoje or date.today()
+    if _tem_ciclo(conta):
+        return ciclo_da_compra(hoje, conta.fechamento_cartao, conta.vencimento_cartao)
+    return hoje, _proximo_dia(hoje, conta.vencimento_cartao) if conta.vencimento_cartao else hoje
+#endregion
+
+#region DISTRIBUIÇÃO DOS LANÇAMENTOS
+def distribuir_em_faturas(conta, lancamentos, hoje=None):
+    """ Distribui os lançamentos de um cartão pelos ciclos. lancamentos é uma sequência de (data, valor, quitada, tipo_registro,
+    quantidade); compras parceladas viram uma parcela por ciclo (a primeira absorve os centavos da divisão).
+    Retorna {(fechamento, vencimento): [total, pendente]}."""
+
+    hoje = hoje or date.today()
+    faturas = {}
+    ciclos = {} # data do lançamento -> ciclo, para converter cada dia uma vez só
+    seguintes = {} # ciclo -> ciclo seguinte
+
+    for data_lancamento, valor, quitada, tipo_registro, quantidade in lancamentos:
+        if not valor or data_lancamento is None:
+            continue
+
+        dia = data_lancamento.date() if isinstance(data_lancamento, datetime) else data_lancamento
+        if dia not in ciclos:
+            ciclos[dia] = ciclo_da_compra(dia, conta.fechamento_cartao, conta.vencimento_cartao) if _tem_ciclo(conta) else ciclo_atual(conta, hoje)
+        ciclo = ciclos[dia]
+
+        # a divisão e as somas são feitas em centavos inteiros e convertidas para reais só no retorno
+        parcelas = quantidade if tipo_registro == TipoRegistro.PARCELADO and quantidade and quantidade > 1 else 1
+        valor_parcela = round(centavos(valor) / parcelas)
+        primeira_parcela = centavos(valor) - valor_parcela * (parcelas - 1)
+
+        for k in range(parcelas):
+            parte = primeira_parcela if k == 0 else valor_parcela
+            acumulado = faturas.setdefault(ciclo, [0, 0])
+            acumulado[0] += parte
+            if not quitada:
+                acumulado[1] += parte
+
+            if k < parcelas - 1:
+                if ciclo not in seguintes:
+                    seguintes[ciclo] = _ciclo_seguinte(ciclo, conta.fechamento_cartao, conta.vencimento_cartao) if _tem_ciclo(conta) else ciclo
+                ciclo = seguintes[ciclo]
+
+    return {ciclo: [reais(total), reais(pendente)] for ciclo, (total, pendente) in faturas.items()}
+
+def _status(fechamento, vencimento, pendente, atual, hoje):
+    if fechamento > atual[0]:
+        return "futura"
+    if fechamento == atual[0]:
+        return "aberta"
+    if pendente <= 0:
+        return "paga"
+    return "vencida" if vencimento < hoje else "fechada"
+
+def _resumir_cartao(conta, faturas, hoje, ciclos_anteriores):
+    atual = ciclo_atual(conta, hoje)
+    faturas.setdefault(atual, [0.0, 0.0])
+
+    # histórico: os últimos ciclos já vencidos, além de tudo o que ainda tem valor pendente
+    vencidas = sorted(ciclo for ciclo in faturas if ciclo[1] < hoje)
+    recentes = set(vencidas[-ciclos_anteriores:]) if ciclos_anteriores else set()
+
+    lista = tuple(Fatura(id_conta=conta.id_conta, fechamento=fechamento, vencimento=vencimento, total=round(total, 2),
+                         pendente=round(pendente, 2), status=_status(fechamento, vencimento, round(pendente, 2), atual, hoje))
+                  for (fechamento, vencimento), (total, pendente) in sorted(faturas.items(), key=lambda item: item[0][1])
+                  if vencimento >= hoje or pendente > 0 or (fechamento, vencimento) in recentes)
+
+    limite = conta.limite or 0.0
+    utilizado = reais(sum(centavos(f.pendente) for f in lista))
+    return ResumoCartao(
+        id_conta=conta.id_conta,
+        nome=conta.nome_conta,
+        limite=limite,
+        utilizado=utilizado,
+        disponivel=round(limite - utilizado, 2),
+        utilizacao=utilizado / limite if limite else None,
+        em_atraso=reais(sum(centavos(f.pendente) for f in lista if f.status == "vencida")),
+        fatura_atual=next(f for f in lista if (f.fechamento, f.vencimento) == atual),
+        proxima_fatura=next((f for f in lista if f.status in ("fechada", "aberta") and f.pendente > 0), None),
+        faturas=lista
+    )
+#endregion
+
+def resumir_cartoes(db, contas, hoje=None, ciclos_anteriores=CICLOS_ANTERIORES_PADRAO):
+    """ Monta o resumo (faturas por ciclo, uso do limite e valores a vencer) de todos os cartões informados com uma única consulta.
+    contas são objetos ou linhas com id_conta, nome_conta, limite, fechamento_cartao e vencimento_cartao.
+    Retorna {id_conta: ResumoCartao}."""
+
+    hoje = hoje or date.today()
+    cartoes = {c.id_conta: c for c in contas}
+    if not cartoes:
+        return {}
+
+    # janela: os lançamentos dos últimos ciclos (cerca de um mês por ciclo, com folga), qualquer lançamento ainda não quitado e as
+    # compras parceladas anteriores cujas parcelas (uma por ciclo, quantidade meses depois da compra) ainda caem na janela
+    desde = datetime.combine(hoje - timedelta(days=31 * (ciclos_anteriores + 2)), datetime.min.time())
+    fim_das_parcelas = func.datetime(Transacao.data, func.printf("+%d months", func.coalesce(Transacao.quantidade, 0) + 1))
+    linhas = db.query(Transacao.id_conta, Transacao.data, Transacao.valor, Transacao.quitada, Transacao.tipo_registro, Transacao.quantidade)\
+        .filter(Transacao.id_conta.in_(list(cartoes)),
+                Transacao.tipo != TipoTransacao.RECEITA,
+                Transacao.ignore == False,
+                or_(Transacao.data >= desde, Transacao.quitada == False,
+                    and_(Transacao.tipo_registro == TipoRegistro.PARCELADO, fim_das_parcelas >= desde)))\
+        .all()
+
+    lancamentos = {id_conta: [] for id_conta in cartoes}
+    for id_conta, *lancamento in linhas:
+        lancamentos[id_conta].append(lancamento)
+
+    return {id_conta: _resumir_cartao(conta, distribuir_em_faturas(conta, lancamentos[id_conta], hoje), hoje, ciclos_anteriores)
+            for id_conta, conta in cartoes.items()}
+
+def resumir_cartoes_do_usuario(id_usuario, hoje=None, ciclos_anteriores=CICLOS_ANTERIORES_PADRAO):
+    """ Resumo de todos os cartões ativos do usuário (ver resumir_cartoes), em ordem de id."""
+
+    db = SessionLeitura() # só leitura: não disputa a trava de escrita
+
+    try:
+        contas = db.query(Conta.id_conta, Conta.nome_conta, Conta.limite, Conta.fechamento_cartao, Conta.vencimento_cartao)\
+            .filter(Conta.id_usuario == id_usuario, Conta.tipo_conta == "cartao", Conta.ativa == True)\
+            .order_by(Conta.id_conta).all()
+        resumos = resumir_cartoes(db, contas, hoje, ciclos_anteriores)
+        return [resumos[c.id_conta] for c in contas]
+
+    except Exception as e:
+        print(f"Erro ao montar as faturas dos cartões: {e}")
+        raise e
+
+    finally:
+        db.close()
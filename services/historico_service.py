@@ -0,0 +1,177 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Tuple
+import numpy as np
+from sqlalchemy import func
+from classes.contas import Conta
+from classes.transacoes import Transacao
+from database.config import SessionLeitura
+from services import saldo_service
+from utils.cache import CacheLRU, versao_dados, primeira_data_alterada
+from utils.dinheiro import centavos_array, reais_array
+
+# Histórico de saldos: saldo de cada conta e patrimônio total, dia a dia (ou mês a mês), em qualquer período.
+# O movimento diário de cada conta vem de uma consulta agrupada por conta e dia, e os saldos são montados de trás para frente a
+# partir do saldo no fim do período (saldos_em_lote, que parte do saldo materializado): saldo(d) = saldo(fim) - movimentos
+# depois de d. Os movimentos dos meses já fechados ficam em cache por (conta, mês) e só são relidos quando uma escrita atinge
+# aquele mês (utils.cache.primeira_data_alterada), então um gráfico de dez anos só relê o mês corrente.
+# Os movimentos e as somas acumuladas são matrizes int64 de centavos (exatas); a conversão para reais é feita só no resultado.
+
+FREQUENCIAS = ("diaria", "mensal")
+
+# movimentos diários dos meses fechados: (id_usuario, id_conta, mês) -> (versão dos dados, vetor com o efeito de cada dia do mês, em centavos)
+cache_meses = CacheLRU(tamanho_maximo=16384)
+
+@dataclass(frozen=True, eq=False)
+class HistoricoSaldos:
+    datas: np.ndarray                   # datetime64[D]: todos os dias do período, ou o último dia de cada mês na frequência mensal
+    ids_conta: Tuple[int, ...]          # ordem das colunas da matriz
+    nomes: Tuple[str, ...]
+    saldos: np.ndarray                  # matriz datas × contas com o saldo de cada conta ao fim de cada data
+    patrimonio: np.ndarray              # soma das contas que não são ignoradas no patrimônio, em cada data
+
+    def saldos_da_conta(self, id_conta):
+        return self.saldos[:, self.ids_conta.index(id_conta)]
+
+def _inicio_do_mes(data):
+    return data.replace(day=1)
+
+def _fim_do_mes(data):
+    return data.replace(day=calendar.monthrange(data.year, data.month)[1])
+
+def _meses_entre(inicio, fim):
+    mes = _inicio_do_mes(inicio)
+    while mes <= fim:
+        yield mes
+        mes = _fim_do_mes(mes) + timedelta(days=1)
+
+def _carregar_movimentos(db, ids_conta, inicio, fim):
+    # efeito diário de cada conta entre inicio e fim (datas inclusivas), em centavos, numa matriz dias × contas: uma consulta agrupada
+    # por conta e dia, no índice ix_transacoes_conta_data, com a mesma regra de saldo de saldos_em_lote.
+    dia = func.date(Transacao.data)
+    linhas = db.query(Transacao.id_conta, dia, func.sum(saldo_service.expressao_efeito()))\
+        .filter(Transacao.id_conta.in_(ids_conta),
+                Transacao.data >= datetime.combine(inicio, datetime.min.time()),
+                Transacao.data < datetime.combine(fim + timedelta(days=1), datetime.min.time()))\
+        .group_by(Transacao.id_conta, dia).all()
+
+    movimentos = np.zeros(((fim - inicio).days + 1, len(ids_conta)), dtype=np.int64)
+    if linhas:
+        colunas = {id_conta: i for i, id_conta in enumerate(ids_conta)}
+        id_contas, dias, valores = zip(*linhas)
+        indices = (np.array(dias, dtype="datetime64[D]") - np.datetime64(inicio, "D")).astype(np.int64)
+        np.add.at(movimentos, (indices, [colunas[c] for c in id_contas]), centavos_array(valores))
+    return movimentos
+
+def _movimentos_do_periodo(db, id_usuario, ids_conta, inicio, fim, hoje):
+    # matriz dias × contas com o efeito de cada dia, do primeiro dia do mês de inicio até fim. Os meses fechados válidos vêm do
+    # cache; os demais são lidos do banco em trechos contíguos (normalmente um só: o mês corrente).
+    versao = versao_dados(id_usuario)
+    blocos, pendentes = {}, []
+    em_dia = {} # mês pendente -> contas cuja entrada no cache já está na versão atual (não precisam ser regravadas depois da leitura)
+
+    for mes in _meses_entre(inicio, fim):
+        fim_mes = _fim_do_mes(mes)
+        if fim_mes >= hoje or fim_mes > fim:
+            pendentes.append(mes) # mês aberto (ou cortado pelo fim do período): sempre recalculado, nunca guardado
+            continue
+
+        vetores, revalidar = [], []
+        for id_conta in ids_conta:
+            encontrado, item = cache_meses.obter((id_usuario, id_conta, mes))
+            if not encontrado:
+                break
+            versao_bloco, vetor = item
+            alterada = primeira_data_alterada(id_usuario, versao_bloco)
+            if alterada is not None and alterada <= fim_mes:
+                break
+            if versao_bloco != versao:
+                revalidar.append((id_conta, vetor)) # continua válido na versão atual
+            vetores.append(vetor)
+
+        if len(vetores) == len(ids_conta):
+            # o mês inteiro veio do cache: só agora as entradas antigas passam para a versão atual
+            for id_conta, vetor in revalidar:
+                cache_meses.guardar((id_usuario, id_conta, mes), (versao, vetor))
+            blocos[mes] = np.column_stack(vetores) if vetores else np.zeros((fim_mes.day, 0), dtype=np.int64)
+        else:
+            pendentes.append(mes)
+            revalidadas = {id_conta for id_conta, _ in revalidar}
+            em_dia[mes] = set(ids_conta[:len(vetores)]) - revalidadas
+
+    # lê os meses pendentes agrupando os que são consecutivos em uma única consulta
+    trechos = []
+    for mes in pendentes:
+        if trechos and _fim_do_mes(trechos[-1][1]) + timedelta(days=1) == mes:
+            trechos[-1][1] = mes
+        else:
+            trechos.append([mes, mes])
+
+    for primeiro, ultimo in trechos:
+        movimentos = _carregar_movimentos(db, ids_conta, primeiro, min(_fim_do_mes(ultimo), fim))
+        for mes in _meses_entre(primeiro, ultimo):
+            deslocamento = (mes - primeiro).days
+            bloco = movimentos[deslocamento:deslocamento + (min(_fim_do_mes(mes), fim) - mes).days + 1]
+            blocos[mes] = bloco
+            if _fim_do_mes(mes) < hoje and _fim_do_mes(mes) <= fim:
+                for coluna, id_conta in enumerate(ids_conta):
+                    if id_conta in em_dia.get(mes, ()):
+                        continue
+                    cache_meses.guardar((id_usuario, id_conta, mes), (versao, bloco[:, coluna].copy()))
+
+    return np.concatenate([blocos[mes] for mes in sorted(blocos)])
+
+def historico_saldos(id_usuario, inicio, fim=None, frequencia="diaria"):
+    """ Saldo de cada conta do usuário e patrimônio total (contas com ignorar_patrimonio ficam de fora do total) ao fim de cada
+    dia entre inicio e fim (hoje, por padrão), ou ao fim de cada mês com frequencia="mensal". Segue as mesmas regras de
+    saldo_atual: transações ignoradas não contam e despesas e transferências só contam quando quitadas."""
+
+    if frequencia not in FREQUENCIAS:
+        raise ValueError(f"Frequência inválida: {frequencia}. Opções: {FREQUENCIAS}")
+
+    hoje = date.today()
+    inicio = inicio.date() if isinstance(inicio, datetime) else inicio
+    fim = fim.date() if isinstance(fim, datetime) else (fim or hoje)
+    if inicio > fim:
+        raise ValueError("A data inicial deve ser anterior à final.")
+
+    db = SessionLeitura() # só leitura: não disputa a trava de escrita
+
+    try:
+        contas = db.query(Conta.id_conta, Conta.nome_conta, Conta.ignorar_patrimonio)\
+            .filter(Conta.id_usuario == id_usuario).order_by(Conta.id_conta).all()
+        ids_conta = tuple(c.id_conta for c in contas)
+
+        if ids_conta:
+            saldos_finais = saldo_service.saldos_em_lote(db, ids_conta, fim)
+            movimentos = _movimentos_do_periodo(db, id_usuario, ids_conta, inicio, fim, hoje)
+        else:
+            saldos_finais, movimentos = {}, np.zeros(((fim - _inicio_do_mes(inicio)).days + 1, 0), dtype=np.int64)
+
+    except Exception as e:
+        print(f"Erro ao montar o histórico de saldos: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+    # saldo(d) = saldo(fim) - (movimentos acumulados até fim - movimentos acumulados até d), em centavos
+    acumulado = np.cumsum(movimentos, axis=0)
+    saldo_fim = centavos_array([saldos_finais.get(id_conta, 0.0) for id_conta in ids_conta])
+    saldos = saldo_fim[None, :] - (acumulado[-1] - acumulado)
+
+    # recorta o período pedido (a matriz começa no primeiro dia do mês de inicio)
+    deslocamento = (inicio - _inicio_do_mes(inicio)).days
+    saldos = saldos[deslocamento:]
+    datas = np.arange(np.datetime64(inicio, "D"), np.datetime64(fim, "D") + 1)
+
+    if frequencia == "mensal":
+        # último dia de cada mês (ou o próprio fim, no último mês)
+        meses = datas.astype("datetime64[M]")
+        ultimos = np.flatnonzero(np.r_[meses[1:] != meses[:-1], True])
+        datas, saldos = datas[ultimos], saldos[ultimos]
+
+    no_patrimonio = np.array([not c.ignorar_patrimonio for c in contas], dtype=bool)
+    return HistoricoSaldos(datas=datas, ids_conta=ids_conta, nomes=tuple(c.nome_conta for c in contas), saldos=reais_array(saldos),
+                           patrimonio=reais_array(saldos[:, no_patrimonio].sum(axis=1)))
@@ -0,0 +1,129 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_
+from classes.categorias import Categoria, Subcategoria
+from classes.transacoes import TipoTransacao
+from database.config import SessionLocal
+from services import agregado_service
+from utils.dinheiro import somar
+
+# Orçamentos do mês: quanto já foi gasto em cada categoria e subcategoria de despesa, o limite mensal (limite_gastos_mensal) e a
+# projeção para o fim do mês pelo ritmo de gastos até hoje (gasto / dias decorridos × dias do mês).
+# São sempre duas consultas, independentemente da quantidade de categorias ou de membros: as categorias com as subcategorias
+# (um LEFT JOIN) e os gastos do mês agrupados por categoria e subcategoria (agregado_service.somar_periodo).
+
+# situação de cada orçamento: sem limite cadastrado, dentro do limite, projeção acima do limite ou limite já ultrapassado
+SITUACOES = (None, "ok", "atencao", "estourado")
+
+#region ESTRUTURAS
+@dataclass(frozen=True)
+class OrcamentoSubcategoria:
+    id_subcategoria: int
+    nome: str
+    limite: Optional[float]
+    gasto: float
+    projetado: float                        # gasto projetado para o fim do mês pelo ritmo atual
+    percentual: Optional[float]             # gasto / limite, ou None sem limite
+    situacao: Optional[str]                 # um de SITUACOES
+
+@dataclass(frozen=True)
+class OrcamentoCategoria:
+    id_categoria: int
+    id_usuario: int
+    nome: str
+    cor_hex: Optional[str]
+    icone: Optional[str]
+    limite: Optional[float]
+    gasto: float                            # inclui as despesas da categoria sem subcategoria
+    projetado: float
+    percentual: Optional[float]
+    situacao: Optional[str]
+    subcategorias: Tuple[OrcamentoSubcategoria, ...]
+
+@dataclass(frozen=True)
+class OrcamentoMes:
+    mes: date                               # primeiro dia do mês
+    dias_decorridos: int                    # dias do mês até hoje, inclusive (base da projeção)
+    dias_no_mes: int
+    categorias: Tuple[OrcamentoCategoria, ...]
+#endregion
+
+def _situacao(limite, gasto, projetado):
+    if not limite or limite <= 0:
+        return None
+    if gasto > limite:
+        return "estourado"
+    return "atencao" if projetado > limite else "ok"
+
+def _orcamento(limite, gasto, fator_projecao):
+    # (gasto, projetado, percentual, situacao) de uma linha de orçamento
+    gasto = round(gasto, 2)
+    projetado = round(gasto * fator_projecao, 2)
+    percentual = gasto / limite if limite and limite > 0 else None
+    return gasto, projetado, percentual, _situacao(limite, gasto, projetado)
+
+def montar_orcamentos(db, ids_usuario, hoje=None):
+    """ Orçamento do mês de hoje para todas as categorias e subcategorias de despesa ativas dos usuários informados (um usuário
+    ou os membros de uma família), com duas consultas. Retorna um OrcamentoMes com as categorias em ordem de usuário e nome."""
+
+    hoje = hoje or date.today()
+    hoje = hoje.date() if isinstance(hoje, datetime) else hoje
+    ids_usuario = list(ids_usuario)
+    mes = hoje.replace(day=1)
+    dias_no_mes = calendar.monthrange(hoje.year, hoje.month)[1]
+    fator_projecao = dias_no_mes / hoje.day
+
+    if not ids_usuario:
+        return OrcamentoMes(mes=mes, dias_decorridos=hoje.day, dias_no_mes=dias_no_mes, categorias=())
+
+    linhas = db.query(Categoria.id_categoria, Categoria.id_usuario, Categoria.nome, Categoria.cor_hex, Categoria.icone,
+                      Categoria.limite_gastos_mensal, Subcategoria.id_subcategoria, Subcategoria.nome, Subcategoria.limite_gastos_mensal)\
+        .outerjoin(Subcategoria, and_(Subcategoria.id_usuario == Categoria.id_usuario, # usa o índice de subcategorias por usuário
+                                      Subcategoria.id_categoria == Categoria.id_categoria, Subcategoria.ativa == True))\
+        .filter(Categoria.id_usuario.in_(ids_usuario), Categoria.tipo == TipoTransacao.DESPESA, Categoria.ativa == True)\
+        .order_by(Categoria.id_usuario, Categoria.nome, Subcategoria.nome).all()
+
+    # gastos do mês até o fim de hoje, por (categoria, subcategoria); despesas sem subcategoria vêm com id 0
+    gastos = agregado_service.somar_periodo(db, ids_usuario, datetime.combine(mes, datetime.min.time()),
+                                            datetime.combine(hoje, datetime.max.time()),
+                                            agrupar_por=("id_categoria", "id_subcategoria"), tipos=[TipoTransacao.DESPESA])
+    gasto_categoria = {}
+    for (id_categoria, _), (total, _) in gastos.items():
+        gasto_categoria[id_categoria] = somar([gasto_categoria.get(id_categoria, 0.0), total])
+
+    categorias, subcategorias = {}, {}
+    for id_categoria, id_usuario, nome, cor_hex, icone, limite, id_subcategoria, nome_sub, limite_sub in linhas:
+        if id_categoria not in categorias:
+            categorias[id_categoria] = (id_usuario, nome, cor_hex, icone, limite)
+            subcategorias[id_categoria] = []
+        if id_subcategoria is not None:
+            gasto, projetado, percentual, situacao = _orcamento(limite_sub, gastos.get((id_categoria, id_subcategoria), (0.0, 0))[0], fator_projecao)
+            subcategorias[id_categoria].append(OrcamentoSubcategoria(
+                id_subcategoria=id_subcategoria, nome=nome_sub, limite=limite_sub, gasto=gasto, projetado=projetado,
+                percentual=percentual, situacao=situacao))
+
+    resultado = []
+    for id_categoria, (id_usuario, nome, cor_hex, icone, limite) in categorias.items():
+        gasto, projetado, percentual, situacao = _orcamento(limite, gasto_categoria.get(id_categoria, 0.0), fator_projecao)
+        resultado.append(OrcamentoCategoria(
+            id_categoria=id_categoria, id_usuario=id_usuario, nome=nome, cor_hex=cor_hex, icone=icone, limite=limite, gasto=gasto,
+            projetado=projetado, percentual=percentual, situacao=situacao, subcategorias=tuple(subcategorias[id_categoria])))
+
+    return OrcamentoMes(mes=mes, dias_decorridos=hoje.day, dias_no_mes=dias_no_mes, categorias=tuple(resultado))
+
+def orcamentos_do_usuario(id_usuario, hoje=None):
+    """ montar_orcamentos para um único usuário, com a própria sessão."""
+
+    db = SessionLocal()
+
+    try:
+        return montar_orcamentos(db, [id_usuario], hoje)
+
+    except Exception as e:
+        print(f"Erro ao montar os orçamentos: {e}")
+        raise e
+
+    finally:
+        db.close()
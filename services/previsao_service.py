@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+import numpy as np
+from sqlalchemy import func, and_, or_
+from classes.contas import Conta
+from classes.transacoes import Transacao
+from classes.usuarios import Usuario
+from database.config import SessionLeitura
+from services import saldo_service, recorrencia_service, fatura_service
+from utils.dinheiro import centavos_array, reais_array
+
+# Previsão do fluxo de caixa: saldo de cada conta, dia a dia, nos próximos meses.
+# As entradas (saldo atual, transações pendentes, ocorrências das recorrências e faturas dos cartões) viram uma matriz densa
+# dia × conta de movimentos, e a projeção inteira é uma soma acumulada (cumsum) do NumPy sobre ela, em centavos int64. O banco é consultado um
+# número fixo de vezes, independentemente da quantidade de contas ou do horizonte.
+
+HORIZONTE_PADRAO_DIAS = 180
+
+#region ESTRUTURAS
+@dataclass(frozen=True)
+class PrevisaoConta:
+    id_conta: int
+    nome: str
+    tipo_conta: str
+    saldo_atual: float
+    saldo_final: float                          # saldo no último dia do horizonte
+    saldo_minimo: float
+    data_saldo_minimo: date
+    limite_seguranca: Optional[float]
+    cheque_especial: float
+    data_abaixo_seguranca: Optional[date]       # primeiro dia com saldo abaixo do limite de segurança
+    data_cheque_especial: Optional[date]        # primeiro dia com saldo negativo (entrada no cheque especial), só contas correntes
+    data_estouro_cheque: Optional[date]         # primeiro dia além do limite do cheque especial, só contas correntes
+
+@dataclass(frozen=True, eq=False)
+class PrevisaoFluxo:
+    datas: np.ndarray                           # datetime64[D] com os dias projetados (o dia 0 é hoje)
+    ids_conta: Tuple[int, ...]                  # ordem das colunas da matriz
+    saldos: np.ndarray                          # matriz dias × contas com o saldo de cada conta ao fim de cada dia
+    contas: Tuple[PrevisaoConta, ...]
+
+    def saldos_da_conta(self, id_conta):
+        return self.saldos[:, self.ids_conta.index(id_conta)]
+
+    def saldo_total(self):
+        # soma de todas as contas, dia a dia
+        return self.saldos.sum(axis=1)
+#endregion
+
+def _movimentos_pendentes(db, ids_conta, hoje, fim):
+    # efeito previsto das transações gravadas que ainda não entraram no saldo, somado por conta e dia em uma única consulta:
+    # as com data futura dentro do horizonte e as saídas passadas ainda não quitadas (que contam a partir de hoje).
+    amanha = datetime.combine(hoje + timedelta(days=1), datetime.min.time())
+    depois_do_fim = datetime.combine(fim + timedelta(days=1), datetime.min.time())
+    dia = func.date(Transacao.data)
+
+    return db.query(Transacao.id_conta, dia, func.sum(saldo_service.expressao_efeito_previsto()))\
+        .filter(Transacao.id_conta.in_(ids_conta),
+                Transacao.ignore == False,
+                or_(and_(Transacao.data >= amanha, Transacao.data < depois_do_fim),
+                    and_(Transacao.data < amanha, Transacao.quitada == False, Transacao.tipo.in_(saldo_service.TIPOS_SAIDA))))\
+        .group_by(Transacao.id_conta, dia).all()
+
+def _primeiro_dia(mascara, datas):
+    # para cada coluna da máscara (dias × contas), a data da primeira linha verdadeira, ou None se nenhuma for
+    primeiros = mascara.argmax(axis=0)
+    return [datas[i].astype(date) if mascara[i, coluna] else None for coluna, i in enumerate(primeiros)]
+
+def montar_previsao(contas, saldos, movimentos, hoje, dias):
+    """ Monta a matriz de saldos a partir das contas (linhas com id_conta, nome_conta, tipo_conta, limite_seguranca e
+    cheque_especial), do saldo atual de cada uma ({id_conta: saldo}) e dos movimentos previstos (id_conta, data, valor), já nas
+    datas em que afetam o saldo (os dos cartões, no vencimento da fatura)."""
+
+    datas = np.arange(np.datetime64(hoje, "D"), np.datetime64(hoje, "D") + dias + 1)
+    ids_conta = tuple(c.id_conta for c in contas)
+    colunas = {id_conta: i for i, id_conta in enumerate(ids_conta)}
+
+    fluxo = np.zeros((len(datas), len(ids_conta)), dtype=np.int64) # centavos: a soma acumulada é exata
+    movimentos = [(id_conta, data_mov, valor) for id_conta, data_mov, valor in movimentos if id_conta in colunas and valor]
+    if movimentos:
+        id_contas, linhas, valores = zip(*movimentos)
+        cols = [colunas[id_conta] for id_conta in id_contas]
+
+        # o que já venceu conta hoje (dia 0) e o que passa do horizonte fica de fora
+        indices = (np.array(linhas, dtype="datetime64[D]") - datas[0]).astype(np.int64).clip(min=0)
+        dentro = indices < len(datas)
+        np.add.at(fluxo, (indices[dentro], np.array(cols, dtype=np.int64)[dentro]), centavos_array(valores)[dentro])
+
+    partida = centavos_array([saldos.get(c.id_conta) or 0.0 for c in contas])
+    saldo_atual = reais_array(partida)
+    saldos = reais_array(partida[None, :] + np.cumsum(fluxo, axis=0)) # de volta para reais só depois da soma acumulada
+
+    # gatilhos: limite de segurança (quando definido) e cheque especial (contas correntes)
+    limites = np.array([c.limite_seguranca if c.limite_seguranca else np.nan for c in contas], dtype=float)
+    cheques = np.array([c.cheque_especial or 0.0 for c in contas], dtype=float)
+    correntes = np.array([c.tipo_conta == "corrente" for c in contas])
+
+    abaixo_seguranca = _primeiro_dia(saldos < limites[None, :], datas)
+    no_cheque = _primeiro_dia((saldos < 0) & correntes[None, :], datas)
+    estouro = _primeiro_dia((saldos < -cheques[None, :]) & correntes[None, :], datas)
+    minimos = saldos.argmin(axis=0)
+
+    return PrevisaoFluxo(datas=datas, ids_conta=ids_conta, saldos=saldos, contas=tuple(PrevisaoConta(
+        id_conta=c.id_conta,
+        nome=c.nome_conta,
+        tipo_conta=c.tipo_conta,
+        saldo_atual=float(saldo_atual[i]),
+        saldo_final=float(saldos[-1, i]),
+        saldo_minimo=float(saldos[minimos[i], i]),
+        data_saldo_minimo=datas[minimos[i]].astype(date),
+        limite_seguranca=c.limite_seguranca,
+        cheque_especial=float(cheques[i]),
+        data_abaixo_seguranca=abaixo_seguranca[i],
+        data_cheque_especial=no_cheque[i],
+        data_estouro_cheque=estouro[i],
+    ) for i, c in enumerate(contas)))
+
+def prever_fluxo(id_usuario=None, id_familia=None, dias=HORIZONTE_PADRAO_DIAS, hoje=None):
+    """ Projeta o saldo de cada conta ativa do usuário (ou de todos os membros da família e das contas compartilhadas com ela) para cada um dos próximos `dias` dias.
+    Considera o saldo atual, as transações pendentes (futuras e saídas não quitadas), as ocorrências das recorrências e as
+    faturas dos cartões (fatura_service: cada compra pendente, ou parcela, é cobrada no vencimento da sua fatura).
+    Retorna um PrevisaoFluxo com a matriz dias × contas e, por conta, o saldo mínimo e os primeiros dias abaixo do limite de segurança e no cheque especial."""
+
+    if (id_usuario is None) == (id_familia is None):
+        raise ValueError("Informe id_usuario ou id_familia.")
+
+    hoje = hoje or date.today()
+    fim = hoje + timedelta(days=dias)
+    db = SessionLeitura() # só leitura: não disputa a trava de escrita
+
+    try:
+        if id_usuario is not None:
+            ids_usuario = [id_usuario]
+            escopo = Conta.id_usuario == id_usuario
+        else:
+            ids_usuario = [u for (u,) in db.query(Usuario.id_usuario).filter(Usuario.id_familia == id_familia).all()]
+            escopo = or_(Conta.id_usuario.in_(ids_usuario), Conta.id_familia == id_familia)
+
+        contas = db.query(Conta.id_conta, Conta.id_usuario, Conta.nome_conta, Conta.tipo_conta, Conta.limite_seguranca,
+                          Conta.cheque_especial, Conta.limite, Conta.fechamento_cartao, Conta.vencimento_cartao)\
+            .filter(escopo, Conta.ativa == True).order_by(Conta.id_conta).all()
+        ids_usuario = sorted(set(ids_usuario) | {c.id_usuario for c in contas}) # donos das contas compartilhadas (para as recorrências)
+        ids_conta = [c.id_conta for c in contas]
+        saldos = saldo_service.saldos_em_lote(db, ids_conta, hoje) # saldo de hoje a partir do materializado, sem escrita
+
+        movimentos = []
+        if ids_conta:
+            # cartões com ciclo cadastrado: o que está pendente é cobrado no vencimento de cada fatura (com as parcelas
+            # distribuídas pelos ciclos); as demais contas recebem os movimentos pendentes na própria data.
+            cartoes = {c.id_conta: c for c in contas if c.tipo_conta == "cartao" and c.fechamento_cartao and c.vencimento_cartao}
+            outras = [id_conta for id_conta in ids_conta if id_conta not in cartoes]
+
+            if outras:
+                movimentos = [(id_conta, date.fromisoformat(dia), valor) for id_conta, dia, valor in _movimentos_pendentes(db, outras, hoje, fim)]
+            for resumo in fatura_service.resumir_cartoes(db, cartoes.values(), hoje, ciclos_anteriores=0).values():
+                movimentos.extend((f.id_conta, f.vencimento, -f.pendente) for f in resumo.faturas if f.pendente)
+
+            recorrencias = recorrencia_service.carregar_recorrencias(db, ids_usuario, ids_conta)
+            for o in recorrencia_service.ocorrencias_no_periodo(recorrencias, hoje, fim):
+                id_conta, data_mov = o.recorrencia.id_conta, o.data.date()
+                if id_conta in cartoes:
+                    data_mov = fatura_service.vencimento_da_fatura(data_mov, cartoes[id_conta].fechamento_cartao, cartoes[id_conta].vencimento_cartao)
+                movimentos.append((id_conta, data_mov, saldo_service.efeito_no_saldo(o.recorrencia.tipo, o.recorrencia.valor, True, False)))
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao montar a previsão do fluxo de caixa: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+    return montar_previsao(contas, saldos, movimentos, hoje, dias)
@@ -0,0 +1,373 @@
+import calendar
+import heapq
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, update, func, type_coerce, String
+from classes.transacoes import Transacao, TipoTransacao, TipoRegistro
+from classes.categorias import Categoria
+from database.config import SessionLocal
+from utils.cache import incrementar_versao
+
+# Recorrências: detecção automática ("Análise de Recorrência Automática" do documento de funcionalidades) e expansão das
+# ocorrências futuras sob demanda.
+# Na detecção, o histórico do usuário é lido em uma única consulta, já ordenado por descrição normalizada e data pelo índice
+# ix_transacoes_usuario_descricao_data, e todas as séries são avaliadas de uma vez com NumPy/pandas, sem laço por transação.
+# Na expansão, só as ocorrências já realizadas ficam gravadas em transacoes; as próximas são geradas na hora, para a janela pedida.
+
+#region CICLOS
+# ciclo: (intervalo médio em dias, tolerância em dias, passo em meses — 0 para os ciclos contados em dias)
+CICLOS = {
+    "semanal": (7.0, 1.5, 0),
+    "quinzenal": (14.0, 2.5, 0),
+    "mensal": (30.44, 4.0, 1),
+    "bimestral": (60.88, 6.0, 2),
+    "trimestral": (91.31, 8.0, 3),
+    "semestral": (182.62, 12.0, 6),
+    "anual": (365.25, 20.0, 12),
+}
+
+def avancar_ciclo(data, ciclo, passos=1):
+    """ Retorna a data `passos` ciclos depois de `data`. Os ciclos mensais em diante avançam por meses do calendário
+    (dia 31 vira o último dia dos meses mais curtos); os demais, por dias."""
+
+    intervalo, _, meses = CICLOS[ciclo]
+    if not meses:
+        return data + timedelta(days=intervalo * passos)
+
+    total_meses = data.month - 1 + meses * passos
+    ano, mes = data.year + total_meses // 12, total_meses % 12 + 1
+    return data.replace(year=ano, month=mes, day=min(data.day, calendar.monthrange(ano, mes)[1]))
+#endregion
+
+#region SUGESTÕES
+@dataclass(frozen=True)
+class SugestaoRecorrencia:
+    descricao: str                  # descrição normalizada que identifica a série
+    tipo: TipoTransacao
+    ciclo: str                      # uma das chaves de CICLOS
+    intervalo_dias: float           # intervalo mediano entre as ocorrências
+    valor: float                    # valor mediano das ocorrências
+    ocorrencias: int
+    primeira_data: date
+    ultima_data: date
+    proxima_data: date
+    confianca: float                # de 0 a 1 (pontualidade, estabilidade do valor e quantidade de ocorrências)
+    ativa: bool                     # False se a série parou (sem ocorrência há mais de dois ciclos)
+    id_conta: Optional[int]         # conta e categoria da ocorrência mais recente
+    id_categoria: Optional[int]
+    ids_transacao: Tuple[int, ...]
+
+# pesos da confiança: pontualidade dos intervalos, estabilidade do valor e quantidade de intervalos observados
+PESO_PONTUALIDADE = 0.5
+PESO_VALOR = 0.3
+PESO_SUPORTE = 0.2
+INTERVALOS_PARA_SUPORTE_TOTAL = 4
+VARIACAO_VALOR_TOLERADA = 0.10 # ocorrências a até 10% do valor mediano contam como "mesmo valor"
+
+# limite de descrições por consulta no modo incremental (o SQLite limita a quantidade de parâmetros)
+DESCRICOES_POR_CONSULTA = 5000
+#endregion
+
+def _carregar_historico(db, id_usuario, descricoes=None):
+    # transações candidatas do usuário (ainda não vinculadas a uma recorrência), ordenadas por descrição e data.
+    # Todas as colunas lidas estão no índice ix_transacoes_usuario_descricao_data (covering index), e tipo e data chegam como
+    # texto puro (sem a conversão linha a linha do SQLAlchemy): o pandas converte a coluna inteira de uma vez.
+    colunas = ["id_transacao", "descricao", "tipo", "data", "valor"]
+    consulta = select(Transacao.id_transacao, Transacao.descricao_normalizada, type_coerce(Transacao.tipo, String),
+                      type_coerce(Transacao.data, String), Transacao.valor)\
+        .where(Transacao.id_usuario == id_usuario,
+               Transacao.descricao_normalizada != None,
+               Transacao.descricao_normalizada != "",
+               Transacao.id_recorrencia == None)\
+        .order_by(Transacao.descricao_normalizada, Transacao.data)
+
+    conexao = db.connection()
+    if descricoes is None:
+        return pd.DataFrame(conexao.execute(consulta).all(), columns=colunas)
+
+    descricoes = sorted(d for d in descricoes if d)
+    partes = [pd.DataFrame(conexao.execute(consulta.where(Transacao.descricao_normalizada.in_(descricoes[i:i + DESCRICOES_POR_CONSULTA]))).all(), columns=colunas)
+              for i in range(0, len(descricoes), DESCRICOES_POR_CONSULTA)]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+
+def avaliar_series(df, hoje=None, min_ocorrencias=3):
+    """ Avalia, de forma vetorizada, todas as séries (descrição normalizada + tipo) de um DataFrame de transações.
+    Retorna um DataFrame com uma linha por série candidata: ciclo, intervalo e valor medianos, datas e confiança."""
+
+    hoje = hoje or date.today()
+    if df.empty:
+        return pd.DataFrame()
+
+    df = df.copy()
+    df["data"] = pd.to_datetime(df["data"], format="ISO8601").astype("datetime64[ns]")
+    df["tipo"] = df["tipo"].astype(str) # nome do TipoTransacao, como gravado pela coluna Enum
+    df["serie"] = df.groupby(["descricao", "tipo"], sort=False).ngroup()
+
+    # ordem por série e data (o banco já entrega quase tudo nessa ordem, então a ordenação estável é barata)
+    df = df.sort_values(["serie", "data"], kind="stable", ignore_index=True)
+
+    serie = df["serie"].to_numpy()
+    dias = df["data"].to_numpy().astype("int64") / 86_400e9
+    inicio_serie = np.r_[True, serie[1:] != serie[:-1]]
+
+    # intervalo (em dias) entre cada ocorrência e a anterior da mesma série. A primeira de cada série não tem intervalo.
+    intervalos = np.where(inicio_serie, np.nan, np.diff(dias, prepend=dias[0]))
+    df["intervalo"] = intervalos
+
+    grupos = df.groupby("serie", sort=False)
+    resumo = pd.DataFrame({
+        "descricao": grupos["descricao"].first(),
+        "tipo": grupos["tipo"].first(),
+        "ocorrencias": grupos.size(),
+        "intervalo_dias": grupos["intervalo"].median(),
+        "valor": grupos["valor"].median(),
+        "primeira_data": grupos["data"].min(),
+        "ultima_data": grupos["data"].max(),
+        "id_ultima": grupos["id_transacao"].last(),
+    })
+    resumo = resumo[(resumo["ocorrencias"] >= min_ocorrencias) & resumo["intervalo_dias"].notna()]
+    if resumo.empty:
+        return pd.DataFrame()
+
+    # ciclo mais próximo do intervalo mediano; séries cujo intervalo não se encaixa em nenhum ciclo são descartadas
+    nomes = np.array(list(CICLOS))
+    medias = np.array([c[0] for c in CICLOS.values()])
+    tolerancias = np.array([c[1] for c in CICLOS.values()])
+    mais_proximo = np.abs(resumo["intervalo_dias"].to_numpy()[:, None] - medias[None, :]).argmin(axis=1)
+    encaixa = np.abs(resumo["intervalo_dias"].to_numpy() - medias[mais_proximo]) <= tolerancias[mais_proximo]
+
+    resumo["ciclo"] = nomes[mais_proximo]
+    resumo["media_ciclo"] = medias[mais_proximo]
+    resumo["tolerancia"] = tolerancias[mais_proximo]
+    resumo = resumo[encaixa]
+    if resumo.empty:
+        return pd.DataFrame()
+
+    # pontualidade: fração dos intervalos dentro da tolerância do ciclo. Estabilidade: fração dos valores próximos do mediano.
+    df = df[df["serie"].isin(resumo.index)]
+    ciclo_da_linha = df["serie"].map(resumo["media_ciclo"])
+    tolerancia_da_linha = df["serie"].map(resumo["tolerancia"])
+    valor_mediano = df["serie"].map(resumo["valor"])
+
+    pontual = (df["intervalo"] - ciclo_da_linha).abs() <= tolerancia_da_linha
+    mesmo_valor = (df["valor"] - valor_mediano).abs() <= valor_mediano.abs() * VARIACAO_VALOR_TOLERADA
+
+    pontualidade = pontual[df["intervalo"].notna()].groupby(df["serie"]).mean()
+    estabilidade = mesmo_valor.groupby(df["serie"]).mean()
+    suporte = ((resumo["ocorrencias"] - 1) / INTERVALOS_PARA_SUPORTE_TOTAL).clip(upper=1.0)
+
+    resumo["confianca"] = (PESO_PONTUALIDADE * pontualidade.reindex(resumo.index).fillna(0.0)
+                           + PESO_VALOR * estabilidade.reindex(resumo.index).fillna(0.0)
+                           + PESO_SUPORTE * suporte).round(3)
+
+    # uma série está ativa se a última ocorrência não tem mais de dois ciclos (mais a tolerância)
+    dias_desde_ultima = (pd.Timestamp(hoje) - resumo["ultima_data"]).dt.days
+    resumo["ativa"] = dias_desde_ultima <= 2 * resumo["media_ciclo"] + resumo["tolerancia"]
+
+    resumo["ids_transacao"] = df.groupby("serie", sort=False)["id_transacao"].agg(tuple)
+    return resumo.drop(columns=["media_ciclo", "tolerancia"]).sort_values("confianca", ascending=False)
+
+def detectar_recorrencias(id_usuario, descricoes=None, confianca_minima=0.6, incluir_encerradas=False, min_ocorrencias=3):
+    """ Analisa o histórico do usuário e sugere séries recorrentes (ex.: NETFLIX todo mês com o mesmo valor), ordenadas pela confiança.
+    Sem `descricoes`, faz a passada completa em todo o histórico. Com `descricoes` (normalizadas), é o modo incremental:
+    só o histórico dessas descrições é lido, pelo índice, então pode rodar depois de cada importação.
+    Transações já vinculadas a uma recorrência (id_recorrencia preenchido) não entram na análise."""
+
+    db = SessionLocal()
+
+    try:
+        resumo = avaliar_series(_carregar_historico(db, id_usuario, descricoes), min_ocorrencias=min_ocorrencias)
+        if resumo.empty:
+            return []
+
+        resumo = resumo[resumo["confianca"] >= confianca_minima]
+        if not incluir_encerradas:
+            resumo = resumo[resumo["ativa"]]
+
+        # conta e categoria só das ocorrências mais recentes das séries sugeridas, em uma consulta pela chave primária
+        ids_ultimas = [int(i) for i in resumo["id_ultima"]]
+        ultimas = {id_t: (id_conta, id_cat) for id_t, id_conta, id_cat in db.query(
+            Transacao.id_transacao, Transacao.id_conta, Transacao.id_categoria).filter(Transacao.id_transacao.in_(ids_ultimas)).all()} if ids_ultimas else {}
+
+    except Exception as e:
+        print(f"Erro na detecção de recorrências: {e}")
+        return []
+
+    finally:
+        db.close()
+
+    return [SugestaoRecorrencia(
+        descricao=linha.descricao,
+        tipo=TipoTransacao[linha.tipo],
+        ciclo=linha.ciclo,
+        intervalo_dias=float(linha.intervalo_dias),
+        valor=float(linha.valor),
+        ocorrencias=int(linha.ocorrencias),
+        primeira_data=linha.primeira_data.date(),
+        ultima_data=linha.ultima_data.date(),
+        proxima_data=avancar_ciclo(linha.ultima_data.date(), linha.ciclo),
+        confianca=float(linha.confianca),
+        ativa=bool(linha.ativa),
+        id_conta=ultimas.get(linha.id_ultima, (None, None))[0],
+        id_categoria=ultimas.get(linha.id_ultima, (None, None))[1],
+        ids_transacao=tuple(int(i) for i in linha.ids_transacao),
+    ) for linha in resumo.itertuples()]
+
+def confirmar_recorrencia(id_usuario, sugestao):
+    """ Transforma uma sugestão aceita pelo usuário em recorrência: as transações da série passam a ser RECORRENTE,
+    com o ciclo detectado, a data de início da primeira ocorrência e o mesmo id_recorrencia (o id da primeira transação).
+    Retorna o id_recorrencia."""
+
+    db = SessionLocal()
+
+    try:
+        id_recorrencia = min(sugestao.ids_transacao)
+
+        db.execute(
+            update(Transacao)
+            .where(Transacao.id_transacao.in_(sugestao.ids_transacao), Transacao.id_usuario == id_usuario)
+            .values(tipo_registro=TipoRegistro.RECORRENTE, ciclo=sugestao.ciclo, data_inicio=sugestao.primeira_data, id_recorrencia=id_recorrencia)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        incrementar_versao(id_usuario)
+        print(f"Recorrência '{sugestao.descricao}' ({sugestao.ciclo}) confirmada com {len(sugestao.ids_transacao)} transações.")
+        return id_recorrencia
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao confirmar a recorrência: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+#region EXPANSÃO DAS OCORRÊNCIAS
+# Uma recorrência é o conjunto de transações RECORRENTE com o mesmo id_recorrencia (o id_transacao da primeira, gravado também
+# nela; a consulta ainda aceita a primeira com id_recorrencia nulo). A transação mais recente da série serve de modelo (valor,
+# conta, categoria) para as próximas ocorrências, que caem em data_inicio + k ciclos, até data_termino. A série está gravada até a sua última ocorrência realizada: só as datas
+# depois dela (com folga de meio ciclo, para pagamentos adiantados ou atrasados) são geradas.
+
+@dataclass(frozen=True)
+class Recorrencia:
+    id_recorrencia: int
+    id_usuario: int
+    descricao: Optional[str]
+    valor: float
+    tipo: TipoTransacao
+    ciclo: str
+    inicio: date                    # âncora das ocorrências (data_inicio da série)
+    termino: Optional[date]         # última data possível (data_termino), ou None para séries sem fim
+    ultima_realizada: date          # data da ocorrência gravada mais recente
+    id_conta: Optional[int]
+    id_categoria: Optional[int]
+    id_subcategoria: Optional[int]
+    categoria: Optional[str]
+    cor_hex: Optional[str]
+
+@dataclass(frozen=True)
+class Ocorrencia:
+    data: datetime
+    recorrencia: Recorrencia        # série de origem (valor, tipo, conta e categoria da ocorrência)
+
+def _como_data(valor):
+    # as colunas de data podem vir como datetime ou date
+    return valor.date() if isinstance(valor, datetime) else valor
+
+def carregar_recorrencias(db, id_usuario, ids_conta=None):
+    """ Carrega as recorrências ativas do usuário (uma linha por série), com uma única consulta agrupada pelo índice
+    ix_transacoes_usuario_registro_data. O custo depende da quantidade de transações recorrentes, não do histórico todo.
+    id_usuario também pode ser uma lista de usuários (ex.: os membros de uma família)."""
+
+    ids_usuario = list(id_usuario) if isinstance(id_usuario, (list, tuple, set)) else [id_usuario]
+    serie = func.coalesce(Transacao.id_recorrencia, Transacao.id_transacao)
+
+    # no SQLite, as colunas sem agregação de um GROUP BY com MAX() vêm da linha que tem o valor máximo:
+    # assim cada série já chega com os campos da sua transação mais recente (o modelo das próximas ocorrências).
+    consulta = db.query(serie, func.max(Transacao.data), Transacao.id_usuario, Transacao.descricao, Transacao.valor, Transacao.tipo, Transacao.ciclo,
+                        Transacao.data_inicio, Transacao.data_termino, Transacao.id_conta, Transacao.id_categoria,
+                        Transacao.id_subcategoria, Categoria.nome, Categoria.cor_hex)\
+        .outerjoin(Categoria, Transacao.id_categoria == Categoria.id_categoria)\
+        .filter(Transacao.id_usuario.in_(ids_usuario),
+                Transacao.tipo_registro == TipoRegistro.RECORRENTE,
+                Transacao.ciclo.in_(list(CICLOS)),
+                Transacao.ignore == False)
+
+    if ids_conta is not None:
+        consulta = consulta.filter(Transacao.id_conta.in_(ids_conta))
+
+    recorrencias = []
+    for id_rec, ultima, dono, descricao, valor, tipo, ciclo, inicio, termino, id_conta, id_cat, id_sub, categoria, cor in consulta.group_by(serie).all():
+        recorrencias.append(Recorrencia(
+            id_recorrencia=id_rec, id_usuario=dono, descricao=descricao, valor=valor, tipo=tipo, ciclo=ciclo,
+            inicio=_como_data(inicio) or _como_data(ultima), termino=_como_data(termino), ultima_realizada=_como_data(ultima),
+            id_conta=id_conta, id_categoria=id_cat, id_subcategoria=id_sub, categoria=categoria, cor_hex=cor
+        ))
+    return recorrencias
+
+def _primeiro_passo(recorrencia, data):
+    # estimativa (por baixo) do índice k da primeira ocorrência a partir de `data`, para não percorrer as ocorrências anteriores
+    intervalo, _, meses = CICLOS[recorrencia.ciclo]
+    if meses:
+        decorridos = (data.year - recorrencia.inicio.year) * 12 + data.month - recorrencia.inicio.month
+        return max(0, decorridos // meses - 1)
+    return max(0, int((data - recorrencia.inicio).days // intervalo) - 1)
+
+def gerar_ocorrencias(recorrencia, inicio, fim):
+    """ Gerador das ocorrências ainda não realizadas de uma recorrência entre inicio e fim (datas inclusivas), em ordem de data.
+    Começa direto na primeira ocorrência da janela, então o custo é proporcional às ocorrências da janela."""
+
+    inicio, fim = _como_data(inicio), _como_data(fim)
+    intervalo = CICLOS[recorrencia.ciclo][0]
+
+    # as ocorrências até meio ciclo depois da última realizada já estão gravadas (pagamento atrasado) ou foram antecipadas
+    limite_realizadas = recorrencia.ultima_realizada + timedelta(days=intervalo / 2)
+    primeira_data = max(inicio, limite_realizadas + timedelta(days=1))
+    if recorrencia.termino:
+        fim = min(fim, recorrencia.termino)
+
+    k = _primeiro_passo(recorrencia, primeira_data)
+    while True:
+        data = avancar_ciclo(recorrencia.inicio, recorrencia.ciclo, k)
+        if data > fim:
+            return
+        if data >= primeira_data:
+            yield Ocorrencia(data=datetime.combine(data, datetime.min.time()), recorrencia=recorrencia)
+        k += 1
+
+def ocorrencias_no_periodo(recorrencias, inicio, fim):
+    """ Junta, em ordem de data e sem montar listas intermediárias, as ocorrências de todas as recorrências na janela."""
+    return heapq.merge(*(gerar_ocorrencias(r, inicio, fim) for r in recorrencias), key=lambda o: o.data)
+
+def criar_recorrencia(valor, tipo, id_usuario, id_conta, descricao, data_inicio, ciclo, data_termino=None, **kwargs):
+    """ Cadastra uma recorrência (ex.: aluguel todo dia 5). Só a primeira ocorrência é gravada; as seguintes são geradas sob
+    demanda por gerar_ocorrencias e gravadas uma a uma com realizar_ocorrencia."""
+
+    from services import transaction_service
+
+    if ciclo not in CICLOS:
+        raise ValueError(f"Ciclo inválido: {ciclo}. Opções: {list(CICLOS)}")
+
+    return transaction_service.criar_movimentacao(
+        valor, tipo, id_usuario, id_conta, descricao, datetime.combine(data_inicio, datetime.min.time()),
+        tipo_registro=TipoRegistro.RECORRENTE, ciclo=ciclo, data_inicio=data_inicio, data_termino=data_termino, **kwargs
+    )
+
+def realizar_ocorrencia(id_usuario, ocorrencia, quitada=True, valor=None):
+    """ Grava uma ocorrência gerada (ex.: o usuário confirmou o pagamento do mês). O valor pode ser ajustado; a ocorrência gravada
+    passa a ser o modelo das próximas."""
+
+    from services import transaction_service
+
+    serie = ocorrencia.recorrencia
+    return transaction_service.criar_movimentacao(
+        valor if valor is not None else serie.valor, serie.tipo, id_usuario, serie.id_conta, serie.descricao, ocorrencia.data,
+        id_categoria=serie.id_categoria, id_subcategoria=serie.id_subcategoria, quitada=quitada,
+        tipo_registro=TipoRegistro.RECORRENTE, ciclo=serie.ciclo, data_inicio=serie.inicio, data_termino=serie.termino,
+        id_recorrencia=serie.id_recorrencia
+    )
+
+#endregion
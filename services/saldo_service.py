@@ -0,0 +1,308 @@
+from datetime import datetime, date, timedelta
+from sqlalchemy import case, and_, or_, func, select, update
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from classes.contas import Conta
+from classes.transacoes import Transacao, TipoTransacao
+from database.config import SessionLocal
+from utils.cache import incrementar_versao
+from utils.dinheiro import como_dinheiro
+
+# tipos de transação que reduzem o saldo (somente quando quitados), seguindo a mesma regra da antiga property saldo_atual.
+TIPOS_SAIDA = [TipoTransacao.DESPESA, TipoTransacao.TRANSFERENCIA]
+
+
+def efeito_no_saldo(tipo, valor, quitada, ignore):
+    """ Retorna quanto uma transação soma (ou subtrai) do saldo da conta: receitas somam, despesas e transferências
+    subtraem apenas quando quitadas e transações ignoradas não contam. A data é tratada à parte, pelo saldo_referencia."""
+
+    if ignore or not valor:
+        return 0.0
+
+    if tipo == TipoTransacao.RECEITA:
+        return valor
+
+    if tipo in TIPOS_SAIDA and quitada:
+        return -valor
+
+    return 0.0
+
+
+def expressao_efeito():
+    """ Versão em SQL da função efeito_no_saldo, usada nas somas feitas direto no banco (SUM(CASE ...)). Soma centavos inteiros
+    e devolve reais (como_dinheiro), como as colunas monetárias."""
+    return como_dinheiro(case(
+        (Transacao.ignore == True, 0),
+        (Transacao.tipo == TipoTransacao.RECEITA, Transacao.valor),
+        (and_(Transacao.tipo.in_(TIPOS_SAIDA), Transacao.quitada == True), -Transacao.valor),
+        else_=0
+    ))
+
+
+def expressao_efeito_previsto():
+    """ Efeito que uma transação ainda pendente terá no saldo quando for quitada (usado nas projeções): receitas somam e
+    despesas e transferências subtraem, independentemente do status de quitação."""
+    return como_dinheiro(case(
+        (Transacao.tipo == TipoTransacao.RECEITA, Transacao.valor),
+        (Transacao.tipo.in_(TIPOS_SAIDA), -Transacao.valor),
+        else_=0
+    ))
+
+
+def _data_da_transacao(transacao):
+    # a coluna data é DateTime, mas alguns scripts gravam objetos date. Aqui normalizamos para date.
+    if isinstance(transacao.data, datetime):
+        return transacao.data.date()
+    return transacao.data
+
+
+def aplicar_no_saldo(db, transacao, sinal=1):
+    """ Atualiza o saldo materializado da conta da transação dentro da sessão ou conexão recebida (o commit fica com quem chamou).
+    Use sinal=1 ao inserir a transação e sinal=-1 ao remover (ou antes de alterar) a transação.
+    Transações posteriores ao saldo_referencia da conta não entram agora: elas serão somadas quando o saldo for
+    atualizado para a nova data de referência.
+    As escritas do ORM já passam por aqui nos eventos de classes/contas.py; chamar diretamente só faz sentido para transações
+    gravadas sem o ORM."""
+
+    delta = efeito_no_saldo(transacao.tipo, transacao.valor, transacao.quitada, transacao.ignore) * sinal
+
+    if not delta or transacao.id_conta is None or transacao.data is None:
+        return
+
+    db.execute(
+        update(Conta)
+        .where(Conta.id_conta == transacao.id_conta, Conta.saldo_referencia >= _data_da_transacao(transacao))
+        .values(saldo_materializado=Conta.saldo_materializado + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def aplicar_delta_no_saldo(db, id_conta, delta, data_mais_recente):
+    """ Soma um delta já agregado (ex.: um lote inteiro de importação) ao saldo materializado da conta.
+    Só é seguro quando todas as transações do lote são anteriores ou iguais ao saldo_referencia da conta, por isso
+    recebemos a data mais recente do lote; caso contrário, a conta é reconstruída."""
+
+    if not delta:
+        return
+
+    resultado = db.execute(
+        update(Conta)
+        .where(Conta.id_conta == id_conta, Conta.saldo_referencia >= data_mais_recente)
+        .values(saldo_materializado=Conta.saldo_materializado + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+    # se a conta não foi atualizada (lote com transações futuras em relação à referência), refazemos o saldo dela.
+    if resultado.rowcount == 0:
+        db.execute(comando_reconstrucao([id_conta]))
+
+
+def subconsulta_saldo_calculado(hoje=None):
+    """ Subconsulta correlacionada que calcula o saldo 'verdadeiro' de cada conta a partir das transações,
+    ignorando as transações futuras (posteriores a hoje)."""
+
+    hoje = hoje or date.today()
+    amanha = datetime.combine(hoje + timedelta(days=1), datetime.min.time())
+
+    soma = select(func.coalesce(func.sum(expressao_efeito()), 0.0))\
+        .where(Transacao.id_conta == Conta.id_conta, Transacao.data < amanha)\
+        .correlate(Conta)\
+        .scalar_subquery()
+
+    return func.coalesce(Conta.saldo_inicial, 0.0) + soma
+
+
+def comando_reconstrucao(ids_conta=None, hoje=None):
+    """ Monta o UPDATE que reconstrói, em uma única passada no banco, o saldo materializado das contas informadas
+    (ou de todas, se ids_conta for None)."""
+
+    hoje = hoje or date.today()
+
+    comando = update(Conta).values(
+        saldo_materializado=subconsulta_saldo_calculado(hoje),
+        saldo_referencia=hoje
+    ).execution_options(synchronize_session=False)
+
+    if ids_conta is not None:
+        comando = comando.where(Conta.id_conta.in_(ids_conta))
+
+    return comando
+
+
+def saldos_em_lote(db, ids_conta, ate_data=None):
+    """ Saldo de várias contas ao fim do dia ate_data (hoje, por padrão) em uma única consulta SUM(CASE ...) agrupada por conta,
+    com as mesmas regras de saldo_atual: transações ignoradas não contam, as posteriores a ate_data ficam de fora e despesas e
+    transferências só contam quando quitadas. Retorna {id_conta: saldo}.
+    O ponto de partida é o saldo materializado de cada conta: somamos (ou retiramos) só as transações entre o saldo_referencia
+    e ate_data, que o índice ix_transacoes_conta_data alcança direto. Para o dia de referência isso não lê nenhuma transação;
+    contas sem saldo materializado partem do saldo inicial e somam todo o histórico até ate_data."""
+
+    if not ids_conta:
+        return {}
+
+    ate_data = ate_data.date() if isinstance(ate_data, datetime) else (ate_data or date.today())
+
+    # fim do dia pedido e do dia de referência de cada conta, no mesmo formato ('AAAA-MM-DD 00:00:00' do dia seguinte)
+    fim_do_dia = func.datetime(ate_data.isoformat(), "+1 day")
+    fim_da_referencia = func.datetime(Conta.saldo_referencia, "+1 day")
+    materializado = and_(Conta.saldo_materializado != None, Conta.saldo_referencia != None)
+
+    # janela [início, fim) de transações a aplicar sobre o ponto de partida, e o sentido: para frente (+) quando ate_data é
+    # posterior à referência, para trás (-) quando é anterior. Sem saldo materializado, a janela é todo o histórico até ate_data.
+    inicio_janela = case((materializado, func.min(fim_do_dia, fim_da_referencia)), else_="")
+    fim_janela = case((materializado, func.max(fim_do_dia, fim_da_referencia)), else_=fim_do_dia)
+    sentido = case((and_(materializado, fim_do_dia < fim_da_referencia), -1), else_=1)
+    partida = case((materializado, Conta.saldo_materializado), else_=func.coalesce(Conta.saldo_inicial, 0.0))
+
+    linhas = db.query(Conta.id_conta, partida + func.coalesce(func.sum(como_dinheiro(expressao_efeito() * sentido)), 0))\
+        .outerjoin(Transacao, and_(Transacao.id_conta == Conta.id_conta, Transacao.data >= inicio_janela, Transacao.data < fim_janela))\
+        .filter(Conta.id_conta.in_(list(ids_conta)))\
+        .group_by(Conta.id_conta).all()
+
+    return {id_conta: saldo or 0.0 for id_conta, saldo in linhas}
+
+
+def subconsulta_saldo_rolado(hoje=None):
+    """ Saldo de cada conta ao fim de hoje a partir do saldo materializado: soma só as transações entre o saldo_referencia e hoje,
+    que o índice ix_transacoes_conta_data alcança direto. Contas sem saldo materializado são calculadas do zero."""
+
+    hoje = hoje or date.today()
+    amanha = datetime.combine(hoje + timedelta(days=1), datetime.min.time())
+
+    soma = select(func.coalesce(func.sum(expressao_efeito()), 0.0))\
+        .where(Transacao.id_conta == Conta.id_conta,
+               Transacao.data >= func.datetime(Conta.saldo_referencia, "+1 day"), Transacao.data < amanha)\
+        .correlate(Conta)\
+        .scalar_subquery()
+
+    materializado = and_(Conta.saldo_materializado != None, Conta.saldo_referencia != None)
+    return case((materializado, Conta.saldo_materializado + soma), else_=subconsulta_saldo_calculado(hoje))
+
+
+def atualizar_saldos_vencidos(db, id_usuario=None, hoje=None, ids_conta=None):
+    """ Leva até hoje o saldo materializado das contas cujo saldo_referencia ficou para trás (transações que eram futuras passam
+    a contar), somando só as transações do intervalo, sem percorrer o histórico. Escreve na sessão recebida (o commit fica com
+    quem chamou): não deve ser usada pelas leituras, que calculam o mesmo valor com saldos_em_lote.
+    Retorna {id_conta: saldo materializado} das contas atualizadas (normalmente vazio, exceto na primeira escrita do dia)."""
+
+    hoje = hoje or date.today()
+
+    comando = update(Conta).values(
+        saldo_materializado=subconsulta_saldo_rolado(hoje),
+        saldo_referencia=hoje
+    ).where(
+        or_(Conta.saldo_referencia == None, Conta.saldo_referencia < hoje)
+    ).returning(Conta.id_conta, Conta.saldo_materializado).execution_options(synchronize_session=False)
+
+    if isinstance(id_usuario, (list, tuple, set)):
+        comando = comando.where(Conta.id_usuario.in_(list(id_usuario))) # vários usuários (ex.: os membros de uma família) no mesmo UPDATE
+    elif id_usuario is not None:
+        comando = comando.where(Conta.id_usuario == id_usuario)
+
+    if ids_conta is not None:
+        comando = comando.where(Conta.id_conta.in_(list(ids_conta)))
+
+    return dict(db.execute(comando).all())
+
+
+def consolidar_saldos(id_usuario, ids_conta=None, hoje=None):
+    """ Passo de escrita que antecede as leituras do dia: leva até hoje os saldos materializados vencidos do usuário (ou só das
+    contas informadas) e reavalia os gatilhos dessas contas, já que na virada do dia transações que eram futuras passam a contar
+    sem nenhuma escrita. Abre a própria sessão e faz o commit. Retorna {id_conta: saldo materializado} das contas atualizadas."""
+
+    from services import alerta_service # import local para evitar importação circular (o serviço de alertas importa este)
+
+    db = SessionLocal()
+    hoje = hoje or date.today()
+
+    try:
+        atualizadas = atualizar_saldos_vencidos(db, id_usuario, hoje, ids_conta)
+        if atualizadas:
+            alerta_service.avaliar(db, id_usuario, list(atualizadas))
+        db.commit()
+
+        if atualizadas:
+            incrementar_versao(id_usuario, hoje) # os alertas podem ter mudado; os meses anteriores do histórico continuam valendo
+        return atualizadas
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao consolidar os saldos: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+
+def rolar_saldo(conta, hoje=None):
+    """ Saldo atual de uma conta cujo saldo materializado não é de hoje, sem percorrer as transações da conta.
+    Conta ligada a uma sessão: o saldo é levado até hoje só em leitura (saldos_em_lote), sem escrever na sessão de quem chamou,
+    que pode ser somente leitura ou uma unidade de trabalho em andamento. Conta desligada: o saldo materializado é levado até
+    hoje no banco (consolidar_saldos) e o objeto recebe os valores novos, então as próximas leituras são O(1)."""
+
+    hoje = hoje or date.today()
+    db = object_session(conta)
+    if db is not None:
+        return saldos_em_lote(db, [conta.id_conta], hoje)[conta.id_conta]
+
+    consolidar_saldos(conta.id_usuario, [conta.id_conta], hoje)
+
+    db = SessionLocal()
+    try:
+        saldo, referencia = db.query(Conta.saldo_materializado, Conta.saldo_referencia).filter(Conta.id_conta == conta.id_conta).one()
+    finally:
+        db.close()
+
+    # valores gravados no banco: o objeto não fica marcado como alterado
+    set_committed_value(conta, "saldo_materializado", saldo)
+    set_committed_value(conta, "saldo_referencia", referencia)
+    return saldo
+
+
+def reconciliar_saldos(ids_conta=None, tolerancia=0.005):
+    """ Comando de reconciliação: compara o saldo materializado de cada conta com o saldo recalculado a partir das
+    transações, reconstrói todos os saldos com um único UPDATE e retorna a lista das contas que apresentaram divergência."""
+
+    db = SessionLocal()
+    hoje = date.today()
+
+    try:
+        calculado = subconsulta_saldo_calculado(hoje).label("saldo_calculado")
+        consulta = db.query(Conta.id_conta, Conta.nome_conta, Conta.saldo_materializado, calculado)
+
+        if ids_conta is not None:
+            consulta = consulta.filter(Conta.id_conta.in_(ids_conta))
+
+        divergencias = []
+        for id_conta, nome_conta, materializado, saldo_calculado in consulta.all():
+            diferenca = (saldo_calculado or 0.0) - (materializado or 0.0)
+            if materializado is None or abs(diferenca) > tolerancia:
+                divergencias.append({
+                    "id_conta": id_conta,
+                    "nome": nome_conta,
+                    "saldo_materializado": materializado,
+                    "saldo_calculado": saldo_calculado,
+                    "diferenca": diferenca
+                })
+
+        db.execute(comando_reconstrucao(ids_conta, hoje))
+        db.commit()
+        incrementar_versao() # os saldos de qualquer usuário podem ter mudado
+
+        for d in divergencias:
+            print(f"Divergência na conta {d['id_conta']} ({d['nome']}): materializado {d['saldo_materializado']} / calculado {d['saldo_calculado']:.2f}")
+        print(f"Reconciliação concluída: {len(divergencias)} conta(s) com divergência corrigida(s).")
+
+        return divergencias
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro na reconciliação dos saldos: {e}")
+        raise e
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    reconciliar_saldos()
@@ -1,7 +1,10 @@
-from classes.transacoes import Transacao
+from datetime import datetime
+from sqlalchemy import select, text
+from classes.transacoes import Transacao, TipoRegistro
 from classes.regras import RegraTag
 from classes.metas import Meta
 from database.config import SessionLocal
+from utils.cache import incrementar_versao
 
 
 def criar_movimentacao(valor, 
@@ -18,12 +21,17 @@ def criar_movimentacao(valor,
     usando o método criado para isso na classe transações, depois ela vai categorizar a transação usando o método criado 
     na classe RegraTag. Caso a transação já exista, ela não chega a adicionar a nova movimentação no Banco de Dados"""
 
+    # sem data, vale o momento atual (o mesmo padrão do construtor da Transacao): o hash e a impressão digital precisam dela
+    if data is None:
+        data = datetime.now()
+
     db = SessionLocal()
 
     try:
-        # 1. Gerar hash e verificar duplicidade
-        hash_temp = Transacao.gerar_hash_estatico(valor, data, descricao, local)
-        if db.query(Transacao).filter_by(hash_unico=hash_temp).first():
+        # 1. Gerar hash e verificar duplicidade pela impressão digital canônica (uma consulta no índice ix_transacoes_impressao_digital)
+        hash_temp = Transacao.gerar_hash_estatico(valor, data, descricao, local, id_conta)
+        impressao = Transacao.calcular_impressao_digital(id_conta, valor, data, descricao)
+        if db.query(Transacao.id_transacao).filter(Transacao.impressao_digital == impressao).first():
             print (f"Transação duplicada ignorada: {descricao}")
             return None
                 
@@ -37,7 +45,7 @@ def criar_movimentacao(valor,
                 id_cat = regra.id_categoria
                 id_subcat = regra.id_subcategoria
 
-        # 3. Criar objeto Transacao e usar .salvar()
+        # 3. Criar objeto Transacao e gravar (o saldo da conta e os agregados mensais são atualizados na mesma transação do banco, pelos eventos do ORM)
         nova_transacao = Transacao(
             valor=valor,
             tipo=tipo,
@@ -50,14 +58,28 @@ def criar_movimentacao(valor,
             id_categoria=id_cat,
             id_subcategoria=id_subcat,
             id_meta=kwargs.get('id_meta'),
-            quitada=kwargs.get('quitada', True)
+            quitada=kwargs.get('quitada', True),
+            # campos das recorrências (usados por recorrencia_service ao criar uma recorrência ou gravar uma ocorrência)
+            tipo_registro=kwargs.get('tipo_registro', TipoRegistro.COMUM),
+            ciclo=kwargs.get('ciclo'),
+            data_inicio=kwargs.get('data_inicio'),
+            data_termino=kwargs.get('data_termino'),
+            id_recorrencia=kwargs.get('id_recorrencia')
         )
 
-        nova_transacao.salvar()
+        db.add(nova_transacao)
+        if nova_transacao.tipo_registro == TipoRegistro.RECORRENTE and nova_transacao.id_recorrencia is None:
+            # primeira ocorrência de uma recorrência nova: a série é identificada pelo id dela, gravado na própria linha para que a
+            # detecção de recorrências (que só lê transações sem id_recorrencia) não a sugira de novo
+            db.flush()
+            nova_transacao.id_recorrencia = nova_transacao.id_transacao
+        db.commit() # os gatilhos da conta e do orçamento da categoria são reavaliados no commit (classes/alertas.py)
+        incrementar_versao(id_usuario, desde=nova_transacao.data) # os resultados em cache do usuário deixam de valer
     
         return nova_transacao
  
     except Exception as e:
+        db.rollback()
         print(f"Erro: {e}")
         return None
 
@@ -118,16 +140,22 @@ def alterar_status_quitacao(id_transacao, status=True):
     try:
         transacao = db.query(Transacao).filter_by(id_transacao=id_transacao).first()
         if transacao:
+            # o efeito antigo da transação no saldo é trocado pelo novo no flush (evento de alteração em classes/contas.py)
             transacao.quitada = status
-            transacao.salvar()
+            db.commit()
+            incrementar_versao(transacao.id_usuario, desde=transacao.data)
             return True
         return False
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao alterar o status da transação: {e}")
+        return False
     finally:
         db.close()
   
 def deletar_movimentacao(id_transacao):
     """ Remove uma transação do banco de dados. 
-    O saldo da conta será recalculado automaticamente na próxima leitura pela @property saldo_atual de Contas."""
+    O efeito da transação é retirado do saldo materializado da conta na mesma operação (evento de remoção do ORM)."""
 
     db = SessionLocal()
     try:
@@ -135,7 +163,9 @@ def deletar_movimentacao(id_transacao):
         transacao = db.query(Transacao).filter_by(id_transacao=id_transacao).first()
         
         if transacao:
-            transacao.deletar()
+            db.delete(transacao)
+            db.commit() # a remoção sai do saldo da conta e dos agregados mensais no flush, antes da reavaliação dos alertas
+            incrementar_versao(transacao.id_usuario, desde=transacao.data)
             print(f"Transação {id_transacao} removida com sucesso.")
             return True
             
@@ -143,6 +173,7 @@ def deletar_movimentacao(id_transacao):
         return False
         
     except Exception as e:
+        db.rollback()
         print(f"Erro ao deletar movimentação: {e}")
         return False
     
@@ -167,3 +198,58 @@ def processar_lote_movimentacoes(lista_dados):
             
     print(f"📊 Processamento concluído: {sucesso} criadas, {falhas} ignoradas (duplicatas ou erros).")
     return {"sucesso": sucesso, "falhas": falhas}
+
+def _preencher_bloco(executar, ultimo_id, linhas_por_bloco, apenas_vazias):
+    # calcula e grava a impressão digital de um bloco de transações depois de ultimo_id; retorna o último id do bloco (ou None no fim)
+    tabela = Transacao.__table__
+    consulta = select(tabela.c.id_transacao, tabela.c.id_conta, tabela.c.valor, tabela.c.data, tabela.c.descricao)\
+        .where(tabela.c.id_transacao > ultimo_id, tabela.c.valor.is_not(None), tabela.c.data.is_not(None))\
+        .order_by(tabela.c.id_transacao).limit(linhas_por_bloco)
+    if apenas_vazias:
+        consulta = consulta.where(tabela.c.impressao_digital.is_(None))
+
+    bloco = executar(consulta).all()
+    if not bloco:
+        return None
+
+    # UPDATE textual (sem o onupdate do Core): atualizado_em é mantido, porque a impressão digital é derivada dos outros campos e a
+    # linha não mudou para quem a exporta. Também funciona nas migrações anteriores à coluna atualizado_em.
+    executar(text("UPDATE transacoes SET impressao_digital = :impressao WHERE id_transacao = :id_transacao"),
+             [{"id_transacao": id_transacao, "impressao": Transacao.calcular_impressao_digital(id_conta, valor, data, descricao)}
+              for id_transacao, id_conta, valor, data, descricao in bloco])
+    return bloco[-1].id_transacao
+
+def preencher_impressoes_digitais(conexao=None, linhas_por_bloco=50000, apenas_vazias=True):
+    """ Comando de preenchimento da impressão digital (Transacao.calcular_impressao_digital) das transações já gravadas, em blocos
+    de linhas_por_bloco em ordem de id, sem carregar a tabela inteira na memória. Por padrão só as transações sem impressão digital
+    são preenchidas; com apenas_vazias=False todas são recalculadas (ex.: depois de mudar a forma canônica das descrições).
+    Recebe opcionalmente uma conexão já aberta (usada pelas migrações); sem ela, abre a própria sessão e faz o commit de cada bloco,
+    então uma interrupção não perde o que já foi preenchido. Retorna a quantidade de blocos processados."""
+
+    if conexao is not None:
+        blocos, ultimo_id = 0, 0
+        while True:
+            ultimo_id = _preencher_bloco(conexao.execute, ultimo_id, linhas_por_bloco, apenas_vazias)
+            if ultimo_id is None:
+                return blocos
+            blocos += 1
+
+    db = SessionLocal()
+    try:
+        blocos, ultimo_id = 0, 0
+        while True:
+            ultimo_id = _preencher_bloco(db.execute, ultimo_id, linhas_por_bloco, apenas_vazias)
+            if ultimo_id is None:
+                break
+            db.commit()
+            blocos += 1
+        print(f"Impressões digitais preenchidas em {blocos} bloco(s).")
+        return blocos
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao preencher as impressões digitais: {e}")
+        raise e
+
+    finally:
+        db.close()
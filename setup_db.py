@@ -1,23 +1,245 @@
-from database.config import engine, Base  
+from database.config import engine, Base
 from classes.usuarios import Usuario
 from classes.familias import Familia
 from classes.contas import Conta
 from classes.transacoes import Transacao
 from classes.metas import Meta
 from classes.regras import RegraTag
-from classes.indices import IndiceFinanceiro 
+from classes.indices import IndiceFinanceiro
 from classes.categorias import Categoria, Subcategoria
-from classes.ativos import Ativo 
+from classes.ativos import Ativo
 from classes.convites_familia import ConviteFamilia
+from classes.agregados import AgregadoMensal
+from classes.alertas import Alerta
+from sqlalchemy import inspect, text
+
+#region MIGRAÇÕES
+# O create_all só cria tabelas que ainda não existem, então bancos antigos não recebem colunas e índices novos.
+# Cada migração abaixo é idempotente e numerada; a versão aplicada fica gravada no PRAGMA user_version do SQLite.
+
+def _adicionar_coluna(conexao, tabela, coluna, tipo_sql):
+    # adiciona a coluna apenas se ela ainda não existir na tabela (bancos criados pelo create_all já a possuem).
+    colunas = [c["name"] for c in inspect(conexao).get_columns(tabela)]
+    if coluna not in colunas:
+        conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo_sql}"))
+
+def _migracao_001_saldo_materializado(conexao):
+    # colunas do saldo materializado das contas, preenchidas com uma reconstrução completa dos saldos.
+    from services.saldo_service import comando_reconstrucao
+
+    _adicionar_coluna(conexao, "contas", "saldo_materializado", "FLOAT")
+    _adicionar_coluna(conexao, "contas", "saldo_referencia", "DATE")
+    conexao.execute(comando_reconstrucao())
+
+def _criar_indices(conexao, nomes):
+    # cria os índices declarados nos modelos cujo nome está na lista (os que já existirem são ignorados).
+    for tabela in Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            if indice.name in nomes:
+                indice.create(conexao, checkfirst=True)
+
+def _migracao_002_indices(conexao):
+    # índices compostos e de cobertura das consultas do data_provider, do importador e das transações pendentes.
+    _criar_indices(conexao, [
+        "ix_transacoes_usuario_tipo_data",
+        "ix_transacoes_usuario_data",
+        "ix_transacoes_usuario_quitada_data",
+        "ix_transacoes_conta_data",
+        "ix_transacoes_conta_pendentes",
+        "ix_contas_id_usuario",
+        "ix_categorias_id_usuario",
+        "ix_subcategorias_id_usuario",
+        "ix_regras_tags_id_usuario",
+    ])
+    conexao.execute(text("ANALYZE")) # atualiza as estatísticas usadas pelo planejador de consultas do SQLite
+
+def _migracao_003_agregados_mensais(conexao):
+    # tabela de agregados mensais (usuário × mês × categoria × subcategoria × tipo), preenchida a partir das transações existentes.
+    from services.agregado_service import reconstruir_agregados
+
+    AgregadoMensal.__table__.create(conexao, checkfirst=True)
+    reconstruir_agregados(conexao=conexao)
+
+def _migracao_004_descricao_normalizada(conexao, linhas_por_bloco=50000):
+    # descrição normalizada das transações (detecção de recorrências): coluna, preenchimento em blocos e índice.
+    import pandas as pd
+    from utils.tools import normalizar_descricoes
+
+    _adicionar_coluna(conexao, "transacoes", "descricao_normalizada", "VARCHAR")
+
+    ultimo_id = 0
+    while True:
+        bloco = conexao.execute(text(
+            "SELECT id_transacao, descricao FROM transacoes WHERE id_transacao > :ultimo_id AND descricao IS NOT NULL "
+            "ORDER BY id_transacao LIMIT :limite"), {"ultimo_id": ultimo_id, "limite": linhas_por_bloco}).all()
+        if not bloco:
+            break
+
+        df = pd.DataFrame(bloco, columns=["id_transacao", "descricao"])
+        df["normalizada"] = normalizar_descricoes(df["descricao"])
+        conexao.execute(text("UPDATE transacoes SET descricao_normalizada = :normalizada WHERE id_transacao = :id_transacao"),
+                        df[["id_transacao", "normalizada"]].to_dict("records"))
+        ultimo_id = int(df["id_transacao"].iloc[-1])
+
+    _criar_indices(conexao, ["ix_transacoes_usuario_descricao_data"])
+
+def _migracao_005_indice_recorrencias(conexao):
+    # índice das transações recorrentes do usuário, lido a cada expansão das ocorrências (agendamentos, resumo e projeção).
+    _criar_indices(conexao, ["ix_transacoes_usuario_registro_data"])
+
+def _migracao_006_alertas(conexao):
+    # tabela de alertas (gatilhos avaliados a cada escrita), preenchida com uma avaliação completa de cada usuário.
+    from sqlalchemy.orm import Session
+    from services.alerta_service import reavaliar_usuario
+
+    Alerta.__table__.create(conexao, checkfirst=True)
+    with Session(bind=conexao) as db:
+        for (id_usuario,) in db.query(Usuario.id_usuario).all():
+            reavaliar_usuario(db, id_usuario)
+        db.flush()
+
+def _migracao_007_impressao_digital(conexao):
+    # impressão digital canônica das transações (verificação de duplicatas): coluna, preenchimento em blocos e índice.
+    from services.transaction_service import preencher_impressoes_digitais
+
+    _adicionar_coluna(conexao, "transacoes", "impressao_digital", "VARCHAR")
+    preencher_impressoes_digitais(conexao=conexao)
+    _criar_indices(conexao, ["ix_transacoes_impressao_digital"])
+
+# colunas monetárias (tipo utils.dinheiro.Dinheiro), gravadas em centavos inteiros a partir da migração 008
+COLUNAS_MONETARIAS = {
+    "transacoes": ["valor"],
+    "contas": ["saldo_inicial", "saldo_materializado", "limite_seguranca", "cheque_especial", "limite"],
+    "categorias": ["limite_gastos_mensal"],
+    "subcategorias": ["limite_gastos_mensal"],
+    "metas": ["valor_alvo", "aporte_inicial"],
+    "usuarios": ["renda_mensal", "objetivo_reserva"],
+}
+
+def _separar_percentual_dos_alertas(conexao):
+    # alertas.valor guardava em reais (float) tanto valores monetários quanto percentuais de uso: os percentuais passam para a coluna
+    # percentual e os valores para centavos (tipo Dinheiro). Só converte bancos em que a coluna percentual ainda não existe (tabelas
+    # criadas com o modelo atual já estão no formato novo); o valor usado nos alertas de percentual é preenchido na reavaliação.
+    colunas = [c["name"] for c in inspect(conexao).get_columns("alertas")]
+    if "percentual" in colunas:
+        return False
+
+    _adicionar_coluna(conexao, "alertas", "percentual", "FLOAT")
+    conexao.execute(text("UPDATE alertas SET percentual = valor, valor = NULL WHERE tipo IN ('cheque_especial', 'limite_cartao')"))
+    conexao.execute(text("UPDATE alertas SET valor = CAST(ROUND(valor * 100) AS INTEGER) WHERE valor IS NOT NULL"))
+    return True
+
+def _migracao_008_centavos(conexao):
+    # valores monetários em centavos inteiros: converte as colunas (um UPDATE por tabela) e refaz o que foi calculado a partir dos
+    # valores em reais nas migrações anteriores: os agregados mensais (somados de novo, agora exatos), as impressões digitais e os alertas.
+    # O SQLite não altera o tipo declarado de uma coluna existente: em bancos antigos as colunas continuam FLOAT, mas guardam
+    # centavos inteiros, que o float representa exatamente; bancos novos já são criados com INTEGER.
+    from sqlalchemy.orm import Session
+    from services.agregado_service import reconstruir_agregados
+    from services.transaction_service import preencher_impressoes_digitais
+    from services.alerta_service import reavaliar_usuario
+
+    for tabela, colunas in COLUNAS_MONETARIAS.items():
+        atribuicoes = ", ".join(f"{coluna} = CAST(ROUND({coluna} * 100) AS INTEGER)" for coluna in colunas)
+        conexao.execute(text(f"UPDATE {tabela} SET {atribuicoes}"))
+
+    _separar_percentual_dos_alertas(conexao) # a reavaliação abaixo já grava os alertas no formato da migração 013
+    reconstruir_agregados(conexao=conexao)
+    preencher_impressoes_digitais(conexao=conexao, apenas_vazias=False)
+    with Session(bind=conexao) as db:
+        for (id_usuario,) in db.query(Usuario.id_usuario).all():
+            reavaliar_usuario(db, id_usuario)
+        db.flush()
+
+def _migracao_009_atualizado_em(conexao):
+    # momento da última gravação de cada transação (exportação incremental). As transações existentes ficam com nulo: a primeira
+    # exportação é sempre completa, e daí em diante qualquer alteração preenche a coluna.
+    _adicionar_coluna(conexao, "transacoes", "atualizado_em", "DATETIME")
+    _criar_indices(conexao, ["ix_transacoes_atualizado_em"])
+
+def _migracao_010_impressao_digital_com_numeros(conexao):
+    # a impressão digital passou a usar a descrição canônica com os números (utils.tools.canonizar_descricao), em vez da descrição
+    # normalizada usada nas recorrências: todas as impressões digitais são recalculadas, em blocos.
+    from services.transaction_service import preencher_impressoes_digitais
+
+    preencher_impressoes_digitais(conexao=conexao, apenas_vazias=False)
+
+def _migracao_011_id_recorrencia_da_primeira_ocorrencia(conexao):
+    # a primeira ocorrência das recorrências criadas por criar_recorrencia ficava com id_recorrencia nulo (a série usava o próprio
+    # id_transacao) e voltava a ser sugerida pela detecção de recorrências: passa a guardar o próprio id, como as demais.
+    from sqlalchemy import update
+    from classes.transacoes import TipoRegistro
+
+    conexao.execute(update(Transacao)
+                    .where(Transacao.tipo_registro == TipoRegistro.RECORRENTE, Transacao.id_recorrencia == None)
+                    .values(id_recorrencia=Transacao.id_transacao))
+
+def _migracao_012_indices_da_familia(conexao):
+    # índices das visões da família: contas, metas e ativos compartilhados (id_familia) ou dos membros (id_usuario), e as transações
+    # de cada ativo e de cada meta, somadas na composição do patrimônio e no progresso das metas.
+    _criar_indices(conexao, [
+        "ix_contas_id_familia",
+        "ix_ativos_id_usuario",
+        "ix_ativos_id_familia",
+        "ix_metas_id_usuario",
+        "ix_metas_id_familia",
+        "ix_transacoes_ativo_tipo",
+        "ix_transacoes_meta_tipo",
+    ])
+
+def _migracao_013_valor_e_percentual_dos_alertas(conexao):
+    # valor monetário dos alertas em centavos e percentual de uso em uma coluna própria, com uma reavaliação completa de cada
+    # usuário para preencher o valor dos alertas de percentual (os alertas existentes são atualizados, não recriados).
+    from sqlalchemy.orm import Session
+    from services.alerta_service import reavaliar_usuario
+
+    if not _separar_percentual_dos_alertas(conexao):
+        return
+    with Session(bind=conexao) as db:
+        for (id_usuario,) in db.query(Usuario.id_usuario).all():
+            reavaliar_usuario(db, id_usuario)
+        db.flush()
+
+MIGRACOES = [
+    (1, "saldo materializado das contas", _migracao_001_saldo_materializado),
+    (2, "índices das consultas principais", _migracao_002_indices),
+    (3, "agregados mensais das transações", _migracao_003_agregados_mensais),
+    (4, "descrição normalizada das transações", _migracao_004_descricao_normalizada),
+    (5, "índice das recorrências", _migracao_005_indice_recorrencias),
+    (6, "tabela de alertas", _migracao_006_alertas),
+    (7, "impressão digital das transações", _migracao_007_impressao_digital),
+    (8, "valores monetários em centavos", _migracao_008_centavos),
+    (9, "data de atualização das transações", _migracao_009_atualizado_em),
+    (10, "impressão digital com os números da descrição", _migracao_010_impressao_digital_com_numeros),
+    (11, "id_recorrencia da primeira ocorrência das recorrências", _migracao_011_id_recorrencia_da_primeira_ocorrencia),
+    (12, "índices das visões da família", _migracao_012_indices_da_familia),
+    (13, "valor e percentual dos alertas", _migracao_013_valor_e_percentual_dos_alertas),
+]
+
+def aplicar_migracoes():
+    """Aplica, em ordem, as migrações ainda não registradas no banco."""
+    with engine.begin() as conexao:
+        versao_atual = conexao.execute(text("PRAGMA user_version")).scalar() or 0
+
+        for numero, descricao, migracao in MIGRACOES:
+            if numero <= versao_atual:
+                continue
+
+            print(f"Aplicando migração {numero:03d}: {descricao}...")
+            migracao(conexao)
+            conexao.execute(text(f"PRAGMA user_version = {numero}"))
+
+#endregion
 
 def criar_banco():
     print("Iniciando a criação do banco de dados MeuDinheiro...")
     try:
         # Este comando lê todas as classes que herdam de 'Base' e cria as tabelas
         Base.metadata.create_all(bind=engine)
+        aplicar_migracoes()
         print("Sucesso! O arquivo do banco de dados foi gerado com todas as tabelas.")
     except Exception as e:
         print(f"Erro ao criar o banco de dados: {e}")
 
 if __name__ == "__main__":
-    criar_banco()
\ No newline at end of file
+    criar_banco()
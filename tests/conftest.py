@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+import database.config as config
+from database.config import Base, SessionLocal, SessionLeitura
+from classes import RegraTag
+from services import historico_service
+from services.account_service import cadastrar_conta
+from services.user_service import realizar_cadastro
+from utils.cache import cache_consultas, incrementar_versao
+
+# Cada teste roda contra um banco SQLite em memória novo. Como em Scripts_aux/verificar_planos_consulta.py, as duas fábricas de
+# sessão (SessionLocal e SessionLeitura) e a engine somente leitura passam a usar a engine de teste, e os caches em memória
+# (consultas, meses do histórico e autômatos das regras) são descartados: os ids recomeçam do 1 a cada banco.
+
+@pytest.fixture
+def banco():
+    engine_teste = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine_teste)
+
+    engine_original = config.engine_leitura
+    SessionLocal.configure(bind=engine_teste)
+    SessionLeitura.configure(bind=engine_teste)
+    config.engine_leitura = engine_teste
+
+    incrementar_versao() # versão global nova: nada do que ficou em cache vale para este banco
+    cache_consultas.limpar()
+    historico_service.cache_meses.limpar()
+    RegraTag.invalidar_cache()
+
+    yield engine_teste
+
+    SessionLocal.configure(bind=config.engine)
+    SessionLeitura.configure(bind=engine_original)
+    config.engine_leitura = engine_original
+    engine_teste.dispose()
+
+@pytest.fixture
+def conta(banco):
+    """Usuário com as categorias padrão e uma conta corrente com saldo inicial de R$ 1.000,00. Retorna (id_usuario, id_conta)."""
+    usuario = realizar_cadastro("Teste", "teste@teste.com", "123")
+    nova_conta = cadastrar_conta(usuario.id_usuario, "Corrente", "corrente", saldo_inicial=1000.0)
+    return usuario.id_usuario, nova_conta.id_conta
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import func
+import importadorCSV
+from database.config import SessionLocal
+from classes import AgregadoMensal, Categoria, Transacao
+from classes.transacoes import TipoTransacao
+from services import agregado_service
+from services.transaction_service import criar_movimentacao, deletar_movimentacao
+
+def _agregados(id_usuario):
+    # {(mês, categoria, subcategoria, tipo): (total, quantidade)} como está na tabela de agregados
+    db = SessionLocal()
+    try:
+        return {(m, c, s, t): (total, qtd) for m, c, s, t, total, qtd in db.query(
+            AgregadoMensal.mes, AgregadoMensal.id_categoria, AgregadoMensal.id_subcategoria, AgregadoMensal.tipo,
+            AgregadoMensal.total, AgregadoMensal.quantidade).filter(AgregadoMensal.id_usuario == id_usuario).all()}
+    finally:
+        db.close()
+
+def _reconstruidos(id_usuario):
+    # os mesmos agregados recalculados do zero a partir das transações (agregado_service.reconstruir_agregados)
+    agregado_service.reconstruir_agregados(id_usuario)
+    return _agregados(id_usuario)
+
+def _categorias(id_usuario):
+    db = SessionLocal()
+    try:
+        return [id_categoria for (id_categoria,) in db.query(Categoria.id_categoria).filter(Categoria.id_usuario == id_usuario)
+                .order_by(Categoria.id_categoria).limit(2).all()]
+    finally:
+        db.close()
+
+def test_agregados_acompanham_insercao_alteracao_e_remocao(conta):
+    id_usuario, id_conta = conta
+    mercado, lazer = _categorias(id_usuario)
+    mes_passado = datetime.now().replace(day=1) - timedelta(days=10)
+
+    primeira = criar_movimentacao(10.1, "despesa", id_usuario, id_conta, "A", mes_passado, id_categoria=mercado)
+    segunda = criar_movimentacao(20.2, "despesa", id_usuario, id_conta, "B", mes_passado, id_categoria=mercado)
+    criar_movimentacao(0.3, "receita", id_usuario, id_conta, "C", datetime.now(), id_categoria=lazer)
+
+    # muda a chave (categoria, mês e tipo) e o valor da primeira, e remove a segunda
+    db = SessionLocal()
+    transacao = db.get(Transacao, primeira.id_transacao)
+    transacao.id_categoria, transacao.data, transacao.tipo, transacao.valor = lazer, datetime.now(), TipoTransacao.RECEITA, 5.55
+    db.commit()
+    db.close()
+    deletar_movimentacao(segunda.id_transacao)
+
+    incrementais = _agregados(id_usuario)
+    assert incrementais == _reconstruidos(id_usuario)
+    assert len(incrementais) == 1 # só sobrou a linha do mês corrente (as do mês passado ficaram sem transações e foram removidas)
+    assert list(incrementais.values()) == [(5.85, 2)]
+
+def test_agregados_recebem_o_lote_importado(conta, tmp_path):
+    id_usuario, id_conta = conta
+    caminho = tmp_path / "extrato.csv"
+    pd.DataFrame([("28/09/2026", -0.1, "TARIFA"), ("01/10/2026", -0.2, "TARIFA 2"), ("02/10/2026", -0.3, "TARIFA 3")],
+                 columns=["Data", "Valor", "Descricao"]).to_csv(caminho, index=False)
+
+    importadorCSV.importar_extrato_csv(str(caminho), id_conta)
+
+    incrementais = _agregados(id_usuario)
+    assert incrementais == _reconstruidos(id_usuario)
+    assert sorted(incrementais.values()) == [(0.1, 1), (0.5, 2)]
+
+def test_somar_periodo_longo_bate_com_as_transacoes(conta):
+    id_usuario, id_conta = conta
+    mercado, _ = _categorias(id_usuario)
+    agora = datetime.now()
+    for i in range(120):
+        criar_movimentacao(1.01 + i, "despesa", id_usuario, id_conta, f"COMPRA {i}", agora - timedelta(days=3 * i), id_categoria=mercado)
+
+    inicio, fim = agora - timedelta(days=250), agora
+    db = SessionLocal()
+    try:
+        somado = agregado_service.somar_periodo(db, id_usuario, inicio, fim)
+        total, quantidade = db.query(func.sum(Transacao.valor), func.count()).filter(
+            Transacao.id_usuario == id_usuario, Transacao.data.between(inicio, fim)).one()
+    finally:
+        db.close()
+
+    assert somado == {(mercado,): [total, quantidade]}
@@ -0,0 +1,70 @@
+from datetime import datetime
+import pandas as pd
+import importadorCSV
+from database.config import SessionLocal
+from classes import Transacao
+from services.transaction_service import criar_movimentacao
+from utils.deduplicacao import IndiceDuplicatas, similaridade
+
+def _extrato(tmp_path, nome, linhas):
+    caminho = tmp_path / nome
+    pd.DataFrame(linhas, columns=["Data", "Valor", "Descricao"]).to_csv(caminho, index=False)
+    return str(caminho)
+
+def _descricoes(id_conta):
+    db = SessionLocal()
+    try:
+        return sorted(d for (d,) in db.query(Transacao.descricao).filter(Transacao.id_conta == id_conta).all())
+    finally:
+        db.close()
+
+def test_similaridade_tolera_espacos_e_truncamento():
+    assert similaridade("MERCADO CENTRAL", "MERCADOCENTRAL") == 1.0
+    assert similaridade("SUPERMERCADO", "SUPERMERCADO CENTRAL") > 0.9
+    assert similaridade("POSTO", "FARMACIA") < 0.8
+
+def test_indice_casa_cada_lancamento_uma_vez_com_data_deslocada():
+    indice = IndiceDuplicatas([(1, datetime(2026, 10, 1), 50.0, "despesa", "MERCADO CENTRAL")])
+
+    assert indice.procurar(datetime(2026, 10, 3), 50.0, "despesa", "MERCADO CENTRA") == (1, "MERCADO CENTRAL", 0.95, 2)
+    assert indice.procurar(datetime(2026, 10, 1), 50.0, "despesa", "MERCADO CENTRAL") is None # já casou com a linha anterior
+    assert len(indice) == 0
+
+def test_reimportar_o_mesmo_extrato_nao_duplica(conta, tmp_path):
+    _, id_conta = conta
+    caminho = _extrato(tmp_path, "extrato.csv", [("01/10/2026", -50.0, "MERCADO A"), ("02/10/2026", 3000.0, "SALARIO")])
+
+    assert importadorCSV.importar_extrato_csv(caminho, id_conta)["novas"] == 2
+    resultado = importadorCSV.importar_extrato_csv(caminho, id_conta)
+
+    assert (resultado["novas"], resultado["duplicatas"]) == (0, 2)
+    assert _descricoes(id_conta) == ["MERCADO A", "SALARIO"]
+
+def test_linha_identica_casa_pelo_hash_antes_da_parecida(conta, tmp_path):
+    # a linha parecida (só espaçamento e maiúsculas) vem antes da idêntica ao lançamento gravado: a idêntica precisa casar com ele,
+    # senão o INSERT em massa viola a unicidade do hash_unico e o lote inteiro é desfeito
+    _, id_conta = conta
+    importadorCSV.importar_extrato_csv(_extrato(tmp_path, "a.csv", [("01/10/2026", -50.0, "MERCADO A")]), id_conta)
+
+    resultado = importadorCSV.importar_extrato_csv(
+        _extrato(tmp_path, "b.csv", [("01/10/2026", -50.0, "Mercado  a"), ("01/10/2026", -50.0, "MERCADO A")]), id_conta)
+
+    assert (resultado["novas"], resultado["duplicatas"]) == (1, 1)
+    assert resultado["duplicatas_encontradas"][0]["descricao"] == "MERCADO A"
+    assert _descricoes(id_conta) == ["MERCADO A", "Mercado  a"]
+
+def test_criar_movimentacao_ignora_a_mesma_impressao_digital(conta):
+    id_usuario, id_conta = conta
+    data = datetime(2026, 10, 5, 12, 30)
+
+    assert criar_movimentacao(25.0, "despesa", id_usuario, id_conta, "Padaria  Pão", data) is not None
+    assert criar_movimentacao(25.0, "despesa", id_usuario, id_conta, "PADARIA PAO", data) is None
+    assert criar_movimentacao(25.0, "despesa", id_usuario, id_conta, "PADARIA PAO", data.replace(hour=18)) is not None
+
+def test_criar_movimentacao_sem_data_usa_o_momento_atual(conta):
+    id_usuario, id_conta = conta
+    antes = datetime.now()
+
+    transacao = criar_movimentacao(10.0, "despesa", id_usuario, id_conta, "SEM DATA", None)
+
+    assert transacao is not None and transacao.data >= antes
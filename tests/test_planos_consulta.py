@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "Scripts_aux", "verificar_planos_consulta.py"))
+
+def test_planos_de_consulta_sem_varredura_e_sem_erros():
+    # roda a suíte de planos de consulta em um processo próprio (ela liga as sessões ao próprio banco em memória): o script falha
+    # se algum cenário der erro, se o número de consultas mudar ou se alguma consulta varrer uma tabela inteira
+    resultado = subprocess.run([sys.executable, SCRIPT], capture_output=True, text=True, timeout=300)
+
+    assert resultado.returncode == 0, resultado.stdout[-3000:] + resultado.stderr[-3000:]
+    assert "✅ Nenhuma consulta varre tabelas inteiras." in resultado.stdout
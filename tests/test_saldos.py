@@ -0,0 +1,82 @@
+from datetime import date, datetime, timedelta
+import pandas as pd
+import importadorCSV
+from database.config import SessionLocal
+from classes import Conta, Transacao
+from services import saldo_service
+from services.transaction_service import criar_movimentacao, alterar_status_quitacao, deletar_movimentacao
+
+def _materializado(id_conta):
+    db = SessionLocal()
+    try:
+        return db.query(Conta.saldo_materializado, Conta.saldo_referencia).filter(Conta.id_conta == id_conta).one()
+    finally:
+        db.close()
+
+def _saldo_de(id_conta, ate_data=None):
+    db = SessionLocal()
+    try:
+        return saldo_service.saldos_em_lote(db, [id_conta], ate_data)[id_conta]
+    finally:
+        db.close()
+
+def test_saldo_materializado_acompanha_as_escritas(conta):
+    id_usuario, id_conta = conta
+    ontem = datetime.now() - timedelta(days=1)
+
+    receita = criar_movimentacao(500.10, "receita", id_usuario, id_conta, "SALARIO", ontem)
+    despesa = criar_movimentacao(200.20, "despesa", id_usuario, id_conta, "MERCADO", ontem)
+    assert _materializado(id_conta)[0] == 1299.90
+
+    alterar_status_quitacao(despesa.id_transacao, False) # despesa não quitada não conta no saldo
+    assert _materializado(id_conta)[0] == 1500.10
+
+    db = SessionLocal()
+    transacao = db.get(Transacao, receita.id_transacao)
+    transacao.valor = 600.0
+    db.commit()
+    db.close()
+    assert _materializado(id_conta)[0] == 1600.0
+
+    deletar_movimentacao(receita.id_transacao)
+    assert _materializado(id_conta)[0] == 1000.0
+    assert saldo_service.reconciliar_saldos() == [] # o materializado bate com o recalculado a partir das transações
+
+def test_importacao_aplica_o_lote_no_saldo(conta, tmp_path):
+    _, id_conta = conta
+    caminho = tmp_path / "extrato.csv"
+    pd.DataFrame([("01/10/2026", -0.1, "TARIFA"), ("01/10/2026", -0.2, "TARIFA 2"), ("02/10/2026", 250.0, "PIX")],
+                 columns=["Data", "Valor", "Descricao"]).to_csv(caminho, index=False)
+
+    importadorCSV.importar_extrato_csv(str(caminho), id_conta)
+
+    assert _materializado(id_conta)[0] == 1249.7
+    assert saldo_service.reconciliar_saldos() == []
+
+def test_transacao_futura_entra_no_saldo_quando_a_data_chega(conta):
+    id_usuario, id_conta = conta
+    hoje = date.today()
+    criar_movimentacao(100.0, "receita", id_usuario, id_conta, "FUTURA", datetime.now() + timedelta(days=2))
+
+    assert _saldo_de(id_conta) == 1000.0
+    assert _saldo_de(id_conta, hoje + timedelta(days=2)) == 1100.0 # leitura rolada para frente, sem escrita
+    assert _materializado(id_conta) == (1000.0, hoje)
+
+    assert saldo_service.consolidar_saldos(id_usuario, hoje=hoje + timedelta(days=2)) == {id_conta: 1100.0}
+    assert _materializado(id_conta) == (1100.0, hoje + timedelta(days=2))
+    assert _saldo_de(id_conta, hoje) == 1000.0 # leitura rolada para trás a partir do novo materializado
+
+def test_saldo_atual_de_conta_desligada_e_levado_ate_hoje(conta):
+    id_usuario, id_conta = conta
+    criar_movimentacao(50.0, "receita", id_usuario, id_conta, "ONTEM", datetime.now() - timedelta(days=1))
+
+    db = SessionLocal()
+    db.query(Conta).filter(Conta.id_conta == id_conta).update({"saldo_referencia": date.today() - timedelta(days=3),
+                                                               "saldo_materializado": 1000.0})
+    db.commit()
+    objeto = db.get(Conta, id_conta)
+    db.expunge(objeto)
+    db.close()
+
+    assert objeto.saldo_atual == 1050.0
+    assert _materializado(id_conta) == (1050.0, date.today())
@@ -0,0 +1,76 @@
+from collections import deque
+
+
+class AutomatoPalavrasChave:
+    """ Autômato de Aho-Corasick para procurar várias palavras-chave de uma só vez em um texto.
+    O texto é percorrido uma única vez, independentemente da quantidade de palavras-chave cadastradas.
+    Cada palavra-chave carrega um 'valor' (ex.: a regra associada) e uma 'prioridade'; quando várias palavras-chave
+    aparecem no texto, vence a de maior prioridade."""
+
+    def __init__(self, itens):
+        # itens: iterável de (palavra_chave, valor, prioridade). A prioridade deve ser comparável (ex.: tupla).
+        self._transicoes = [{}]  # transições de cada nó: {caractere: próximo nó}
+        self._falhas = [0]       # nó de falha de cada nó (maior sufixo que também é prefixo de alguma palavra)
+        self._melhor = [None]    # melhor (prioridade, valor) que termina neste nó, considerando a cadeia de falhas
+
+        for palavra, valor, prioridade in itens:
+            if palavra:
+                self._adicionar(palavra, valor, prioridade)
+
+        self._construir_falhas()
+
+    def _adicionar(self, palavra, valor, prioridade):
+        no = 0
+        for caractere in palavra:
+            proximo = self._transicoes[no].get(caractere)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[no][caractere] = proximo
+                self._transicoes.append({})
+                self._falhas.append(0)
+                self._melhor.append(None)
+            no = proximo
+
+        atual = self._melhor[no]
+        if atual is None or prioridade > atual[0]:
+            self._melhor[no] = (prioridade, valor)
+
+    def _construir_falhas(self):
+        # busca em largura: o nó de falha de um filho é obtido seguindo as falhas do pai
+        fila = deque(self._transicoes[0].values())
+
+        while fila:
+            no = fila.popleft()
+            for caractere, filho in self._transicoes[no].items():
+                falha = self._falhas[no]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falhas[falha]
+                destino = self._transicoes[falha].get(caractere, 0)
+                self._falhas[filho] = destino if destino != filho else 0
+
+                # o filho também "enxerga" as palavras que terminam no seu nó de falha
+                herdado = self._melhor[self._falhas[filho]]
+                if herdado is not None and (self._melhor[filho] is None or herdado[0] > self._melhor[filho][0]):
+                    self._melhor[filho] = herdado
+
+                fila.append(filho)
+
+    def buscar(self, texto):
+        """Retorna o valor da palavra-chave de maior prioridade contida no texto, ou None se nenhuma aparecer."""
+        transicoes, falhas, melhor = self._transicoes, self._falhas, self._melhor
+        no = 0
+        encontrado = None
+
+        for caractere in texto:
+            while no and caractere not in transicoes[no]:
+                no = falhas[no]
+            no = transicoes[no].get(caractere, 0)
+
+            candidato = melhor[no]
+            if candidato is not None and (encontrado is None or candidato[0] > encontrado[0]):
+                encontrado = candidato
+
+        return encontrado[1] if encontrado else None
+
+    def __len__(self):
+        return len(self._transicoes) - 1
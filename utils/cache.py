@@ -0,0 +1,144 @@
+import copy
+import threading
+from collections import OrderedDict, deque
+from datetime import date, datetime
+from functools import wraps
+
+#region VERSÃO DOS DADOS
+# Cada usuário tem um número de versão dos seus dados, mantido em memória. Os caminhos de escrita (transaction_service,
+# account_service, importadorCSV e CRUDMixin) incrementam a versão depois do commit; como a versão faz parte da chave do cache,
+# qualquer escrita torna os resultados antigos inalcançáveis, e eles acabam descartados pelo LRU.
+# A versão vale para o processo atual (o Streamlit roda todas as sessões no mesmo processo).
+
+_versoes = {}     # id_usuario -> versão dos dados do usuário
+_versao_global = 0 # incrementada por escritas que não pertencem a um usuário específico (ex.: famílias, reconciliação de saldos)
+_versoes_familia = {} # id_familia -> versão da composição da família (membros e itens compartilhados)
+_trava_versoes = threading.Lock()
+
+# Para os caches de períodos fechados (ex.: os meses do histórico de saldos), cada escrita também registra a data mais antiga
+# que ela afetou: assim uma nova transação de hoje não invalida os meses anteriores. Guardamos só as últimas alterações
+# de cada usuário; se quem consulta ficou para trás, a resposta é "qualquer data" (date.min).
+MAX_ALTERACOES_POR_USUARIO = 256
+_alteracoes = {}  # id_usuario -> deque de (versão, data mais antiga afetada)
+
+def versao_dados(id_usuario):
+    """Retorna o token de versão dos dados do usuário (muda a cada escrita que o afeta). id_usuario também pode ser uma tupla
+    de usuários (ex.: os membros de uma família): a versão muda quando qualquer um deles escreve."""
+    if isinstance(id_usuario, tuple):
+        return (_versao_global,) + tuple(_versoes.get(u, 0) for u in id_usuario)
+    return (_versao_global, _versoes.get(id_usuario, 0))
+
+def incrementar_versao(id_usuario=None, desde=None):
+    """Registra que os dados do usuário mudaram. Sem id_usuario, invalida os dados de todos os usuários.
+    desde é a data mais antiga afetada pela escrita (ex.: a data da transação); sem ela, considera-se que qualquer data mudou."""
+    global _versao_global
+    if isinstance(desde, datetime):
+        desde = desde.date()
+
+    with _trava_versoes:
+        if id_usuario is None:
+            _versao_global += 1
+        else:
+            _versoes[id_usuario] = _versoes.get(id_usuario, 0) + 1
+            _alteracoes.setdefault(id_usuario, deque(maxlen=MAX_ALTERACOES_POR_USUARIO))\
+                .append((_versoes[id_usuario], desde or date.min))
+
+def versao_familia(id_familia):
+    """Token de versão da composição da família: quem são os membros e quais contas, metas e ativos são compartilhados com ela
+    (classes/familias.py incrementa a versão a cada escrita do ORM que muda um desses vínculos)."""
+    return (_versao_global, _versoes_familia.get(id_familia, 0))
+
+def incrementar_versao_familia(id_familia):
+    """Registra que a composição da família mudou (um membro entrou ou saiu, algo passou a ser ou deixou de ser compartilhado)."""
+    with _trava_versoes:
+        _versoes_familia[id_familia] = _versoes_familia.get(id_familia, 0) + 1
+
+def primeira_data_alterada(id_usuario, versao):
+    """ Data mais antiga afetada pelas escritas do usuário depois da versão informada (um token de versao_dados), ou None se
+    nada mudou desde então. Quando não há como saber (invalidação global ou alterações antigas demais), retorna date.min."""
+    with _trava_versoes:
+        versao_global, versao_usuario = versao
+        if versao_global != _versao_global:
+            return date.min
+
+        atual = _versoes.get(id_usuario, 0)
+        if atual == versao_usuario:
+            return None
+
+        posteriores = [desde for numero, desde in _alteracoes.get(id_usuario, ()) if numero > versao_usuario]
+        if len(posteriores) < atual - versao_usuario:
+            return date.min # parte das alterações já saiu do registro
+        return min(posteriores)
+
+#endregion
+
+#region CACHE LRU
+class CacheLRU:
+    """ Cache em memória com tamanho máximo: quando cheio, descarta o item usado há mais tempo.
+    Mantém contadores de acertos, faltas e descartes para acompanhar a eficiência."""
+
+    def __init__(self, tamanho_maximo=256):
+        self.tamanho_maximo = tamanho_maximo
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.descartes = 0
+
+    def obter(self, chave):
+        # retorna (encontrado, valor) e marca o item como usado recentemente
+        with self._trava:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return True, self._itens[chave]
+            self.faltas += 1
+            return False, None
+
+    def guardar(self, chave, valor):
+        with self._trava:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.faltas
+        return {
+            "itens": len(self._itens),
+            "tamanho_maximo": self.tamanho_maximo,
+            "acertos": self.acertos,
+            "faltas": self.faltas,
+            "descartes": self.descartes,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+        }
+
+# cache compartilhado pelas funções de leitura do data_provider
+cache_consultas = CacheLRU(tamanho_maximo=512)
+
+def em_cache(funcao):
+    """ Decorador para funções de leitura cujo primeiro argumento é o id_usuario (ou uma tupla de ids, nas visões da família). A chave do cache é
+    (função, id_usuario, demais argumentos, versão dos dados do usuário, dia atual): o dia entra na chave porque os saldos
+    e os períodos ('hoje', 'mensal', ...) dependem da data. Devolve uma cópia do resultado, para que quem chamou possa
+    alterá-lo sem afetar o cache."""
+
+    @wraps(funcao)
+    def envoltorio(id_usuario, *args, **kwargs):
+        chave = (funcao.__qualname__, id_usuario, args, tuple(sorted(kwargs.items())), versao_dados(id_usuario), date.today())
+
+        encontrado, resultado = cache_consultas.obter(chave)
+        if not encontrado:
+            resultado = funcao(id_usuario, *args, **kwargs)
+            cache_consultas.guardar(chave, resultado)
+
+        return copy.deepcopy(resultado)
+
+    envoltorio.sem_cache = funcao # acesso direto à função original, sem passar pelo cache
+    return envoltorio
+
+#endregion
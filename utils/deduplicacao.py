@@ -0,0 +1,98 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from utils.dinheiro import centavos
+
+# Detecção aproximada de duplicatas na importação de extratos. Os bancos reexportam o mesmo lançamento com a data de
+# compensação deslocada, a descrição truncada ou com outro espaçamento, então a comparação exata (data, valor, descrição)
+# não basta. Os candidatos são agrupados em blocos por (valor em centavos, tipo, dia): cada linha do extrato só é comparada
+# com os lançamentos da mesma conta com o mesmo valor e tipo em até JANELA_DIAS dias, e dentro do bloco as descrições
+# normalizadas são comparadas com uma pontuação de similaridade barata.
+
+JANELA_DIAS = 3 # diferença máxima, em dias, entre a data do extrato e a do lançamento já gravado
+LIMIAR_SIMILARIDADE = 0.8 # pontuação mínima para considerar duas descrições do mesmo lançamento
+TAMANHO_MINIMO_PREFIXO = 6 # descrições truncadas só contam como prefixo a partir deste tamanho (sem espaços)
+PONTUACAO_PREFIXO = 0.95 # pontuação de uma descrição que é o começo da outra (truncada pelo banco)
+
+def _bigramas(texto):
+    return Counter(texto[i:i + 2] for i in range(len(texto) - 1))
+
+def similaridade(descricao_a, descricao_b):
+    """ Pontuação entre 0 e 1 para duas descrições já normalizadas (utils.tools.normalizar_descricao). Os espaços são ignorados;
+    iguais valem 1, uma truncada no começo da outra vale PONTUACAO_PREFIXO e as demais valem o coeficiente de Dice dos bigramas
+    de caracteres (tolerante a letras trocadas e palavras cortadas)."""
+
+    a = (descricao_a or "").replace(" ", "")
+    b = (descricao_b or "").replace(" ", "")
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+
+    curta, longa = (a, b) if len(a) <= len(b) else (b, a)
+    if len(curta) >= TAMANHO_MINIMO_PREFIXO and longa.startswith(curta):
+        return PONTUACAO_PREFIXO
+
+    bigramas_a, bigramas_b = _bigramas(a), _bigramas(b)
+    total = sum(bigramas_a.values()) + sum(bigramas_b.values())
+    return 2 * sum((bigramas_a & bigramas_b).values()) / total if total else 0.0
+
+class IndiceDuplicatas:
+    """ Índice em memória dos lançamentos já gravados de uma conta, montado uma vez por lote de importação a partir da janela de
+    datas do lote (data mínima - JANELA_DIAS até data máxima + JANELA_DIAS). A busca de cada linha do extrato olha só os
+    2 × JANELA_DIAS + 1 blocos de (centavos, tipo, dia) vizinhos, então o custo por linha é constante.
+    Cada lançamento gravado casa com no máximo uma linha do extrato: ao ser encontrado, ele sai do índice."""
+
+    def __init__(self, lancamentos, janela_dias=JANELA_DIAS, limiar=LIMIAR_SIMILARIDADE):
+        # lancamentos: iterável de (id_transacao, data, valor, tipo, descricao_normalizada). O tipo deve vir na mesma representação
+        # usada em procurar (ex.: o valor do TipoTransacao, "despesa"/"receita").
+        self.janela_dias = janela_dias
+        self.limiar = limiar
+        self._blocos = {}
+        self._chaves = {} # id_transacao -> bloco, para retirar um lançamento encontrado por outro caminho
+        for id_transacao, data, valor, tipo, descricao in lancamentos:
+            chave = (centavos(valor), tipo, _dia(data))
+            self._blocos.setdefault(chave, []).append((id_transacao, descricao or ""))
+            self._chaves[id_transacao] = chave
+
+    def __len__(self):
+        return sum(len(bloco) for bloco in self._blocos.values())
+
+    def procurar(self, data, valor, tipo, descricao):
+        """ Lançamento gravado que corresponde à linha do extrato, ou None. Entre os candidatos do bloco com pontuação mínima
+        self.limiar, vence o de maior pontuação e, no empate, o de data mais próxima. Retorna (id_transacao, descrição gravada,
+        pontuação, diferença em dias entre a data do extrato e a gravada) e retira o lançamento do índice."""
+
+        centavos_linha, dia = centavos(valor), _dia(data)
+        melhor = None
+        for deslocamento in range(-self.janela_dias, self.janela_dias + 1):
+            chave = (centavos_linha, tipo, dia + deslocamento)
+            for posicao, (id_transacao, descricao_gravada) in enumerate(self._blocos.get(chave, ())):
+                pontuacao = similaridade(descricao, descricao_gravada)
+                if pontuacao >= self.limiar and (melhor is None or (pontuacao, -abs(deslocamento)) > (melhor[2], -abs(melhor[3]))):
+                    melhor = (id_transacao, descricao_gravada, pontuacao, deslocamento, chave, posicao)
+
+        if melhor is None:
+            return None
+
+        id_transacao, descricao_gravada, pontuacao, deslocamento, chave, posicao = melhor
+        del self._blocos[chave][posicao]
+        del self._chaves[id_transacao]
+        return id_transacao, descricao_gravada, pontuacao, -deslocamento
+
+    def retirar(self, id_transacao):
+        """ Retira do índice um lançamento que já casou com uma linha do extrato por outro critério (ex.: a impressão digital),
+        para que ele não case com uma segunda linha."""
+
+        chave = self._chaves.pop(id_transacao, None)
+        if chave is not None:
+            self._blocos[chave] = [item for item in self._blocos[chave] if item[0] != id_transacao]
+
+def _dia(data):
+    # número ordinal do dia (datetime, date ou Timestamp do pandas), para os blocos e o deslocamento de ±N dias
+    return data.toordinal() if not isinstance(data, datetime) else data.date().toordinal()
+
+def janela_de_busca(data_minima, data_maxima, janela_dias=JANELA_DIAS):
+    """ (início, fim) das datas dos lançamentos que precisam estar no índice para um lote com essas datas extremas."""
+    inicio = datetime.combine(data_minima.date() if isinstance(data_minima, datetime) else data_minima, datetime.min.time())
+    fim = datetime.combine(data_maxima.date() if isinstance(data_maxima, datetime) else data_maxima, datetime.max.time())
+    return inicio - timedelta(days=janela_dias), fim + timedelta(days=janela_dias)
@@ -0,0 +1,48 @@
+import numpy as np
+from sqlalchemy import Integer, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+# Valores monetários são gravados como centavos inteiros (int64 no SQLite). Assim as somas feitas no banco (SUM) e nos arrays
+# do NumPy são exatas, e a igualdade de valores (deduplicação, impressão digital, índices) não depende de arredondamento do float.
+# O resto do código continua trabalhando em reais (float): a conversão acontece só nas bordas, ao gravar e ao ler do banco
+# (tipo Dinheiro) e ao montar ou devolver os arrays das somas vetorizadas (centavos_array / reais_array).
+
+def centavos(valor):
+    """Valor em centavos inteiros, para comparar e somar valores sem os erros de arredondamento do float."""
+    return int(round(float(valor) * 100))
+
+def reais(valor_centavos):
+    """Centavos inteiros de volta para reais (float), para exibição e para o resto do código."""
+    return valor_centavos / 100
+
+def centavos_array(valores):
+    """Versão vetorizada de centavos: lista, Series ou array de valores em reais para um array int64 de centavos. Nulos viram 0."""
+    return np.rint(np.nan_to_num(np.asarray(valores, dtype=np.float64)) * 100).astype(np.int64)
+
+def reais_array(valores_centavos):
+    """Array de centavos (int64) de volta para reais (float64), depois das somas."""
+    return np.asarray(valores_centavos, dtype=np.int64) / 100
+
+def somar(valores):
+    """Soma exata de valores em reais: cada um vira centavos antes da soma. Usada nas somas feitas em Python (ex.: Meta.valor_poupado)."""
+    return reais(sum(centavos(v) for v in valores if v))
+
+class Dinheiro(TypeDecorator):
+    """ Tipo das colunas monetárias: INTEGER com os centavos no banco e float em reais no Python. Os valores passados nas consultas
+    (ex.: Transacao.valor > 100, saldo_materializado + delta) também são convertidos, então os filtros e os UPDATEs continuam em reais.
+    As expressões derivadas de uma coluna Dinheiro (SUM, CASE, soma de colunas) mantêm o tipo e voltam em reais; expressões que
+    misturam outros tipos precisam de como_dinheiro."""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, valor, dialeto):
+        return None if valor is None else centavos(valor)
+
+    def process_result_value(self, valor, dialeto):
+        return None if valor is None else reais(valor)
+
+def como_dinheiro(expressao):
+    """Marca uma expressão SQL que resulta em centavos (ex.: um CASE que começa com um literal) como Dinheiro, para que o resultado
+    volte em reais."""
+    return type_coerce(expressao, Dinheiro())
@@ -1,4 +1,6 @@
 import random
+import re
+import unicodedata
 
 def gerar_cor():
     #  define uma paleta de cores pré-definida, onde cada cor é representada por seu código hexadecimal. 
@@ -10,3 +12,36 @@ def gerar_cor():
               "#558B2F", "#9E9D24", "#F9A825", "#FF8F00", "#D84315", "#ED1111"]
     
     return random.choice(paleta)
+
+# caracteres que não ajudam a identificar o estabelecimento: números (datas, parcelas, finais de cartão) e pontuação.
+PADRAO_RUIDO_DESCRICAO = r"[^A-Z ]+"
+PADRAO_ESPACOS = r" {2,}"
+
+def normalizar_descricao(texto):
+    # versão canônica de uma descrição de transação, usada para agrupar lançamentos do mesmo estabelecimento:
+    # "Netflix.com 03/12" e "NETFLIX COM  04/12" viram "NETFLIX COM". Remove acentos, números e pontuação e junta os espaços.
+    # Deve produzir exatamente o mesmo resultado que normalizar_descricoes, que é a versão vetorizada para o pandas.
+    if texto is None:
+        return None
+
+    texto = unicodedata.normalize("NFKD", str(texto).upper()).encode("ascii", "ignore").decode("ascii")
+    texto = re.sub(PADRAO_RUIDO_DESCRICAO, " ", texto)
+    return re.sub(PADRAO_ESPACOS, " ", texto).strip()
+
+def normalizar_descricoes(serie):
+    # mesma regra de normalizar_descricao aplicada a uma Series inteira do pandas de uma vez (sem laço em Python).
+    return (serie.astype(str).str.upper()
+            .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+            .str.replace(PADRAO_RUIDO_DESCRICAO, " ", regex=True)
+            .str.replace(PADRAO_ESPACOS, " ", regex=True)
+            .str.strip())
+
+def canonizar_descricao(texto):
+    # versão canônica de uma descrição para a impressão digital das transações (Transacao.calcular_impressao_digital): ignora só
+    # maiúsculas/minúsculas, acentos e espaços. Ao contrário de normalizar_descricao, mantém números e pontuação, porque
+    # "PIX 123" e "PIX 456" (ou "PADARIA 1" e "PADARIA 2") no mesmo dia são lançamentos diferentes.
+    if texto is None:
+        return ""
+
+    texto = unicodedata.normalize("NFKD", str(texto).upper()).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.split())